@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
 
 # Changed: Direct imports instead of importing through app.entities
 from app.entities.player_data import PlayerData
@@ -9,9 +10,23 @@ from app.schemas.draft_schemas import DraftResponse
 class DraftData:
     team_a: list[PlayerData]
     team_b: list[PlayerData]
+    # All drawn teams, team_a and team_b are the first two of them
+    teams: list[list[PlayerData]] = field(default_factory=list)
+    imbalance: Optional[float] = None
+    # No draft of the same roster can have an imbalance below this
+    lower_bound: Optional[float] = None
+
+    @property
+    def gap(self) -> Optional[float]:
+        if self.imbalance is None or self.lower_bound is None:
+            return None
+        return max(self.imbalance - self.lower_bound, 0.0)
 
     def to_response(self) -> DraftResponse:
         return DraftResponse(
             team_a=[player.to_response() for player in self.team_a],
             team_b=[player.to_response() for player in self.team_b],
+            teams=[[player.to_response() for player in team] for team in self.teams],
+            imbalance=self.imbalance,
+            gap=self.gap,
         )
@@ -5,6 +5,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import auth
 from app.routes import squads
+from app.services.draw_teams_service import shutdown_draw_executor
 
 #.\.venv\Scripts\activate
 #pip freeze > requirements.txt
@@ -41,6 +42,10 @@ app.include_router(auth.router, prefix="/api/v1")
 app.include_router(squads.router, prefix="/api/v1")
 dotenv.load_dotenv()
 
+@app.on_event("shutdown")
+def stop_draw_workers():
+    shutdown_draw_executor()
+
 @app.get("/")
 def read_root():
     return {"message": "Squads API is running", "version": "1.0.0"}
@@ -9,6 +9,8 @@ from .team_player import TeamPlayer
 from .match import Match
 from .tournament import Tournament
 from .score_history import ScoreHistory
+from .player_stats import PlayerStats
+from .player_pair_stats import PlayerPairStats
 
 # Export commonly used items
 __all__ = [
@@ -23,5 +25,7 @@ __all__ = [
     "TeamPlayer", 
     "Match",
     "Tournament",
-    "ScoreHistory"
+    "ScoreHistory",
+    "PlayerStats",
+    "PlayerPairStats"
 ]
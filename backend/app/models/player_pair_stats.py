@@ -0,0 +1,22 @@
+from sqlalchemy import Column, ForeignKey, Integer, String, PrimaryKeyConstraint
+
+from ..database import Base
+
+
+class PlayerPairStats(Base):
+    """Scored matches of a player with or against another player, seen from the first one"""
+    __tablename__ = "player_pair_stats"
+
+    player_id = Column(String(36), ForeignKey("players.player_id", ondelete="CASCADE"))
+    other_player_id = Column(String(36), ForeignKey("players.player_id", ondelete="CASCADE"))
+    games_together = Column(Integer, nullable=False, default=0)
+    wins_together = Column(Integer, nullable=False, default=0)
+    losses_together = Column(Integer, nullable=False, default=0)
+    games_against = Column(Integer, nullable=False, default=0)
+    # Results of player_id in those games
+    wins_against = Column(Integer, nullable=False, default=0)
+    losses_against = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('player_id', 'other_player_id'),
+    )
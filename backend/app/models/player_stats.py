@@ -0,0 +1,29 @@
+from sqlalchemy import Column, ForeignKey, Integer, String, PrimaryKeyConstraint
+
+from ..database import Base
+
+
+class PlayerStats(Base):
+    """Running totals of a player's matches, kept up to date by MatchService"""
+    __tablename__ = "player_stats"
+
+    player_id = Column(String(36), ForeignKey("players.player_id", ondelete="CASCADE"))
+    matches_played = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
+    draws = Column(Integer, nullable=False, default=0)
+    losses = Column(Integer, nullable=False, default=0)
+    goals_scored = Column(Integer, nullable=False, default=0)
+    goals_conceded = Column(Integer, nullable=False, default=0)
+    # Depend on the order of results, so they are recomputed rather than added up
+    win_streak = Column(Integer, nullable=False, default=0)
+    loss_streak = Column(Integer, nullable=False, default=0)
+    biggest_win_streak = Column(Integer, nullable=False, default=0)
+    biggest_loss_streak = Column(Integer, nullable=False, default=0)
+    biggest_win = Column(Integer, nullable=False, default=0)
+    biggest_win_match_id = Column(String(36), ForeignKey("matches.match_id", ondelete="SET NULL"), nullable=True)
+    biggest_loss = Column(Integer, nullable=False, default=0)
+    biggest_loss_match_id = Column(String(36), ForeignKey("matches.match_id", ondelete="SET NULL"), nullable=True)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('player_id'),
+    )
@@ -1,10 +1,14 @@
+from time import perf_counter
+
 from fastapi import APIRouter, Depends, HTTPException, status, Security
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 from app.models import SessionLocal
 from app.services import SquadService, PlayerService, MatchService, TeamService
 from app.schemas import *
-from app.entities import PlayerData
+from app.entities import PlayerData, DraftData
+from app.services.draw_teams_service import TWO_TEAMS_TIME_BUDGET_MS, DrawProgress
 
 router = APIRouter(
     prefix="/squads",
@@ -331,16 +335,107 @@ async def draw_match(
 ):
     """Draw teams for a match - accessible to all authenticated users (but guest cannot use POST)"""
 
-    drafts = match_service.draw_teams(draft_data.players_ids)
+    # The search runs on the draw process pool, so other requests are served meanwhile
+    drafts = await match_service.draw_teams_async(
+        draft_data.players_ids,
+        draft_data.amount_of_teams,
+        time_budget_ms=draft_data.time_budget_ms,
+        max_gap=draft_data.max_gap,
+        friends=draft_data.friends,
+        enemies=draft_data.enemies,
+        one_goalie_per_team=draft_data.one_goalie_per_team,
+        min_distance=draft_data.min_distance,
+        position_weight=draft_data.position_weight,
+        repeat_weight=draft_data.repeat_weight,
+        recent_matches=draft_data.recent_matches,
+        two_teams_budget_ms=TWO_TEAMS_TIME_BUDGET_MS
+    )
     if drafts is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Match not found")
     
-    draft_responses = []
-    for draft in drafts:
-        team_a = [player.to_response() for player in draft.team_a]
-        team_b = [player.to_response() for player in draft.team_b]
-        draft_response = DraftResponse(team_a=team_a, team_b=team_b)
-        draft_responses.append(draft_response)
+    draft_responses = [draft.to_response() for draft in drafts]
+    lower_bound = drafts[0].lower_bound if drafts else None
     
-    return DraftListResponse(drafts=draft_responses)
+    return DraftListResponse(drafts=draft_responses, lower_bound=lower_bound)
+
+@router.post("/{squad_id}/matches/draw/stream")
+async def draw_match_stream(
+    squad_id: str,
+    draft_data: DraftCreate,
+    user_id: str = Depends(get_current_user),
+    match_service: MatchService = Depends(get_match_service)
+):
+    """Draw teams as NDJSON: each better draft and progress ticks while the search runs, then the drafts"""
+
+    events = match_service.draw_teams_stream(
+        draft_data.players_ids,
+        draft_data.amount_of_teams,
+        time_budget_ms=draft_data.time_budget_ms,
+        max_gap=draft_data.max_gap,
+        friends=draft_data.friends,
+        enemies=draft_data.enemies,
+        one_goalie_per_team=draft_data.one_goalie_per_team,
+        min_distance=draft_data.min_distance,
+        position_weight=draft_data.position_weight,
+        repeat_weight=draft_data.repeat_weight,
+        recent_matches=draft_data.recent_matches,
+        two_teams_budget_ms=TWO_TEAMS_TIME_BUDGET_MS
+    )
+
+    async def lines():
+        started = perf_counter()
+        async for event in events:
+            if isinstance(event, DrawProgress):
+                line = DraftProgressResponse(
+                    event="draft" if event.draft else "progress",
+                    evaluated=event.evaluated,
+                    elapsed_ms=event.elapsed_ms,
+                    imbalance=event.imbalance,
+                    draft=DraftData(team_a=event.draft[0], team_b=event.draft[1], teams=list(event.draft),
+                                    imbalance=event.imbalance).to_response() if event.draft else None
+                )
+            else:
+                drafts, report = event
+                line = DraftProgressResponse(
+                    event="result",
+                    evaluated=report.evaluated if report else 0,
+                    elapsed_ms=(perf_counter() - started) * 1000,
+                    imbalance=drafts[0].imbalance if drafts else None,
+                    drafts=[draft.to_response() for draft in drafts],
+                    lower_bound=drafts[0].lower_bound if drafts else None
+                )
+            yield line.model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.post("/{squad_id}/matches/redraw", response_model=DraftListResponse)
+async def redraw_match(
+    squad_id: str,
+    redraw_data: DraftRedraw,
+    user_id: str = Depends(get_current_user),
+    match_service: MatchService = Depends(get_match_service)
+):
+    """Re-draw earlier drafts after players joined or left - accessible to all authenticated users"""
+
+    # Like /draw, the search runs off the event loop, so other requests are served meanwhile
+    drafts = await match_service.redraw_teams_async(
+        redraw_data.drafts,
+        added=redraw_data.added,
+        removed=redraw_data.removed,
+        time_budget_ms=redraw_data.time_budget_ms,
+        max_gap=redraw_data.max_gap,
+        friends=redraw_data.friends,
+        enemies=redraw_data.enemies,
+        one_goalie_per_team=redraw_data.one_goalie_per_team,
+        min_distance=redraw_data.min_distance,
+        position_weight=redraw_data.position_weight,
+        repeat_weight=redraw_data.repeat_weight,
+        recent_matches=redraw_data.recent_matches,
+        two_teams_budget_ms=TWO_TEAMS_TIME_BUDGET_MS
+    )
+
+    draft_responses = [draft.to_response() for draft in drafts]
+    lower_bound = drafts[0].lower_bound if drafts else None
+
+    return DraftListResponse(drafts=draft_responses, lower_bound=lower_bound)
 
@@ -1,7 +1,7 @@
 from .player_schemas import PlayerCreate, PlayerResponse, PlayerUpdate, PlayerListResponse, PlayerDetailResponse
 from .match_schemas import MatchCreate, MatchResponse, MatchUpdate, MatchListResponse, MatchDetailResponse
 from .squad_schemas import SquadCreate, SquadResponse, SquadUpdate, SquadListResponse, SquadDetailResponse
-from .draft_schemas import DraftCreate, DraftResponse, DraftListResponse
+from .draft_schemas import DraftCreate, DraftRedraw, DraftResponse, DraftListResponse, DraftProgressResponse
 from .auth_schemas import UserRegister, UserLogin, UserResponse, AuthResponse
 from .stats_schemas import PlayerStats, SquadStats, CarouselStat, PlayerRef, MatchRef
 
@@ -25,8 +25,10 @@ __all__ = [
     "SquadDetailResponse",
 
     "DraftCreate",
+    "DraftRedraw",
     "DraftResponse",
     "DraftListResponse",
+    "DraftProgressResponse",
 
     "UserRegister",
     "UserLogin",
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from typing import Annotated, Optional
+from pydantic import BaseModel, Field
 
 from app.schemas import PlayerResponse
 
@@ -7,13 +8,49 @@ class DraftBase(BaseModel):
     players_ids: list[str]
 
 class DraftCreate(DraftBase):
-    pass
+    amount_of_teams: int = Field(2, ge=2, description="Number of teams to draw")
+    time_budget_ms: Optional[int] = Field(None, gt=0, le=10000, description="Return the best drafts found within this time")
+    max_gap: Optional[float] = Field(None, ge=0, description="Stop once the best draft is within this imbalance of the lower bound")
+    friends: list[tuple[str, str]] = Field([], description="Pairs of player ids that must play in the same team")
+    enemies: list[tuple[str, str]] = Field([], description="Pairs of player ids that must play in different teams")
+    one_goalie_per_team: bool = Field(False, description="Spread goalies so that no team gets a second one while another has none")
+    min_distance: int = Field(0, ge=0, description="Fewest players that must change teams between any two returned drafts")
+    position_weight: float = Field(0, ge=0, description="Score imbalance that one unit of position spread counts as; 0 balances scores only")
+    repeat_weight: float = Field(0, ge=0, description="Score imbalance that one recent match shared by two teammates counts as; 0 ignores history")
+    recent_matches: int = Field(10, ge=1, le=100, description="How many of the squad's latest matches count towards repeated teammates")
+
+class DraftRedraw(BaseModel):
+    drafts: list[Annotated[list[list[str]], Field(min_length=2)]] = Field(
+        ..., min_length=1, description="Earlier drafts as teams of player ids, best first; each has at least two teams")
+    added: list[str] = Field([], description="Ids of players who joined")
+    removed: list[str] = Field([], description="Ids of players who left")
+    time_budget_ms: Optional[int] = Field(None, gt=0, le=10000, description="Return the best drafts found within this time")
+    max_gap: Optional[float] = Field(None, ge=0, description="Run a full draw when the re-drawn drafts are further than this from the lower bound")
+    friends: list[tuple[str, str]] = Field([], description="Pairs of player ids that must play in the same team")
+    enemies: list[tuple[str, str]] = Field([], description="Pairs of player ids that must play in different teams")
+    one_goalie_per_team: bool = Field(False, description="Spread goalies so that no team gets a second one while another has none")
+    min_distance: int = Field(0, ge=0, description="Fewest players that must change teams between any two returned drafts")
+    position_weight: float = Field(0, ge=0, description="Score imbalance that one unit of position spread counts as; 0 balances scores only")
+    repeat_weight: float = Field(0, ge=0, description="Score imbalance that one recent match shared by two teammates counts as; 0 ignores history")
+    recent_matches: int = Field(10, ge=1, le=100, description="How many of the squad's latest matches count towards repeated teammates")
 
 class DraftResponse(BaseModel):
     team_a: list[PlayerResponse]
     team_b: list[PlayerResponse]
+    teams: list[list[PlayerResponse]] = []
+    imbalance: Optional[float] = None
+    gap: Optional[float] = None
 
 class DraftListResponse(BaseModel):
     drafts: list[DraftResponse]
-
-
+    lower_bound: Optional[float] = None
+
+class DraftProgressResponse(BaseModel):
+    """One line of the streamed draw: a better draft, a progress tick or the final drafts"""
+    event: str = Field(..., description="'draft', 'progress' or 'result'")
+    evaluated: int = 0
+    elapsed_ms: float = 0.0
+    imbalance: Optional[float] = None
+    draft: Optional[DraftResponse] = None
+    drafts: list[DraftResponse] = []
+    lower_bound: Optional[float] = None
@@ -5,6 +5,7 @@ from .squad_service import SquadService
 from .team_service import TeamService
 from .user_service import UserService
 __all__ = [
+    "draw_cache",
     "draw_teams_service",
     "match_service",
     "player_service",
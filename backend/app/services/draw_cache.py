@@ -0,0 +1,119 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Hashable, Iterable, Optional
+
+# How many draw results are kept before the least recently used one is dropped
+DRAW_CACHE_SIZE = 256
+# How many squads keep their recent teammate pairs in memory
+PAIR_HISTORY_CACHE_SIZE = 64
+
+
+class DrawCache:
+    """LRU cache of draw results.
+
+    Keys are built by `make_key` from the roster, a snapshot of its rounded
+    scores and the draw options. Each entry also remembers its players, so a
+    change to any one of them drops every draw it appears in.
+    """
+
+    def __init__(self, max_size: int = DRAW_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, list] = OrderedDict()
+        self._keys_by_player: dict[str, set[Hashable]] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def make_key(scores: dict[str, float], amount_of_teams: int, allow_substitutions: bool, **options) -> tuple:
+        """Key for a draw of the players in `scores` (player id -> score)"""
+        roster = tuple(sorted((player_id, round(score, 2)) for player_id, score in scores.items()))
+        return roster, amount_of_teams, allow_substitutions, tuple(sorted(options.items()))
+
+    def get(self, key: Hashable) -> Optional[list]:
+        with self._lock:
+            drafts = self._entries.get(key)
+            if drafts is None:
+                return None
+            self._entries.move_to_end(key)
+            return list(drafts)
+
+    def put(self, key: Hashable, drafts: list, player_ids: Iterable[str]):
+        with self._lock:
+            self._entries[key] = list(drafts)
+            self._entries.move_to_end(key)
+            for player_id in player_ids:
+                self._keys_by_player.setdefault(player_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                oldest, _ = self._entries.popitem(last=False)
+                self._forget(oldest)
+
+    def invalidate_player(self, player_id: str):
+        """Drop every cached draw that includes the player"""
+        with self._lock:
+            for key in self._keys_by_player.pop(player_id, set()):
+                if self._entries.pop(key, None) is not None:
+                    self._forget(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_player.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _forget(self, key: Hashable):
+        for player_id, _ in key[0]:
+            keys = self._keys_by_player.get(player_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_player[player_id]
+
+
+class PairHistoryCache:
+    """LRU cache of teammate pair counts over a squad's last matches.
+
+    Entries are keyed by squad and window size. Any change to the squad's
+    matches drops them and bumps the squad's version, which draw cache keys
+    include, so draws made with the old history are never served again.
+    """
+
+    def __init__(self, max_size: int = PAIR_HISTORY_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: OrderedDict[tuple[str, int], dict[tuple[str, str], int]] = OrderedDict()
+        self._versions: dict[str, int] = {}
+        self._lock = Lock()
+
+    def get(self, squad_id: str, last_matches: int) -> Optional[dict[tuple[str, str], int]]:
+        with self._lock:
+            pairs = self._entries.get((squad_id, last_matches))
+            if pairs is None:
+                return None
+            self._entries.move_to_end((squad_id, last_matches))
+            return pairs
+
+    def put(self, squad_id: str, last_matches: int, pairs: dict[tuple[str, str], int]):
+        with self._lock:
+            self._entries[(squad_id, last_matches)] = pairs
+            self._entries.move_to_end((squad_id, last_matches))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def version(self, squad_id: str) -> int:
+        with self._lock:
+            return self._versions.get(squad_id, 0)
+
+    def invalidate_squad(self, squad_id: str):
+        """Drop the squad's pair counts after one of its matches changed"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == squad_id]:
+                del self._entries[key]
+            self._versions[squad_id] = self._versions.get(squad_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+draw_cache = DrawCache()
+pair_history_cache = PairHistoryCache()
@@ -1,40 +1,1099 @@
+import asyncio
+import os
+from array import array
+from bisect import insort
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
 from enum import Enum
+from functools import lru_cache
+from itertools import repeat
+from math import comb, factorial
+from random import Random
+from threading import Lock
+from time import perf_counter, time
+from typing import Callable
+from app.constants import Position
 from app.entities import PlayerData
 from itertools import combinations
+import numpy as np
 
-class Relation(Enum):
+# Slack for comparing float bounds against exact team sums
+_BOUND_TOLERANCE = 1e-9
+
+# Above this many candidate splits the index matrix gets too big to hold in memory
+# and draw_teams_2 falls back to the branch-and-bound search
+VECTORIZED_MAX_COMBOS = 1_000_000
+
+# Time budget the HTTP routes give the two-team searches that are not bounded by memory
+# (branch and bound, subset-sum index) when the request sets none; coarse scores with many
+# equal splits can otherwise keep them enumerating for seconds. Called without
+# `two_teams_budget_ms`, the service runs these searches to the exact result
+TWO_TEAMS_TIME_BUDGET_MS = 1000
+
+# Subset-sum index: scores are quantised to this step, and rosters whose
+# quantised total exceeds SUBSET_SUM_MAX_UNITS use the branch-and-bound search
+SUBSET_SUM_RESOLUTION = 0.01
+SUBSET_SUM_MAX_UNITS = 400_000
+
+# Local search limits for draws into three or more teams; the search also stops once
+# this many restarts in a row left the best draft unchanged. Fewer stall restarts
+# noticeably miss the optimum on small rosters
+N_TEAMS_RESTARTS = 40
+N_TEAMS_TIME_BUDGET_MS = 250
+N_TEAMS_STALL_RESTARTS = 20
+# Rosters with at most this many distinct splits are enumerated instead of searched
+N_TEAMS_EXACT_MAX_SPLITS = 6_000
+# Fixed seed keeps the random restarts, and so the drafts, reproducible
+N_TEAMS_SEED = 2440
+
+# Re-draws after a roster change: time for the local search, and how far the best
+# re-optimised draft may sit above the lower bound before a full search runs instead
+REDRAW_TIME_BUDGET_MS = 100
+REDRAW_MAX_GAP = 1.0
+
+# With a minimum distance between drafts, the searches keep this many times
+# amount_of_draws best splits and the diverse drafts are picked from those
+DIVERSE_POOL_FACTOR = 10
+
+# Positions balanced by the multi-objective mode; field players and unknown positions fit anywhere
+BALANCED_POSITIONS = (Position.GOALIE, Position.DEFENDER, Position.MIDFIELDER, Position.FORWARD)
+
+# How many search nodes are expanded between deadline and gap checks
+_CHECK_INTERVAL = 256
+
+# Least time between two progress callbacks that only carry counters
+PROGRESS_INTERVAL_MS = 100
+
+# Worker processes for parallel draws, and shards per worker so that uneven shards even out
+DRAW_WORKERS = os.cpu_count() or 1
+SHARDS_PER_WORKER = 4
+
+_draw_executor: ProcessPoolExecutor | None = None
+_draw_executor_lock = Lock()
+
+
+def draw_executor() -> ProcessPoolExecutor:
+    """Process pool shared by all parallel draws, started on first use"""
+    global _draw_executor
+    with _draw_executor_lock:
+        if _draw_executor is None:
+            _draw_executor = ProcessPoolExecutor(max_workers=DRAW_WORKERS)
+        return _draw_executor
+
+
+def shutdown_draw_executor():
+    global _draw_executor
+    with _draw_executor_lock:
+        if _draw_executor is not None:
+            _draw_executor.shutdown(cancel_futures=True)
+            _draw_executor = None
+
+
+def _search_shard(service: "DrawTeamsService", search: str, shard: tuple[int, tuple[int, ...]]):
+    """Worker entry point: one shard of a two-team search"""
+    return getattr(service, search)(shard)
+
+
+def _draw_in_process(service: "DrawTeamsService") -> tuple[list[list[list[int]]], "DrawReport"]:
+    """Worker entry point: a whole draw, returned as player indices"""
+    drafts = service.draw_teams()
+    index = {id(player): i for i, player in enumerate(service.players)}
+    return [[[index[id(player)] for player in team] for team in draft] for draft in drafts], service.report
+
+
+def _has_bit(bits: bytes, position: int) -> bool:
+    """Whether bit `position` is set in a little-endian bitset"""
+    return 0 <= position < len(bits) * 8 and bits[position >> 3] >> (position & 7) & 1 == 1
+
+
+def _sums_by_distance(bits: bytes, target: float):
+    """Set bits of a little-endian bitset, nearest to `target` first"""
+    # below walks down from the target, above walks up
+    size = len(bits) * 8
+    below = min(int(target), size - 1)
+    above = below + 1
+    while below >= 0 or above < size:
+        if below >= 0 and (above >= size or target - below <= above - target):
+            position, below = below, below - 1
+        else:
+            position, above = above, above + 1
+        if _has_bit(bits, position):
+            yield position
+
+
+def _build_split_matrices(players_amount: int, team_size: int, memo: dict) -> tuple[np.ndarray, np.ndarray]:
+    key = (players_amount, team_size)
+    if key in memo:
+        return memo[key]
+    if team_size == 0:
+        split = (np.zeros((1, 0), dtype=np.int8), np.arange(players_amount, dtype=np.int8).reshape(1, players_amount))
+    elif players_amount == team_size:
+        split = (np.arange(team_size, dtype=np.int8).reshape(1, team_size), np.zeros((1, 0), dtype=np.int8))
+    else:
+        # Rows with player 0 in team A come first, then rows with player 0 in team B
+        with_a, with_b = _build_split_matrices(players_amount - 1, team_size - 1, memo)
+        without_a, without_b = _build_split_matrices(players_amount - 1, team_size, memo)
+        zeros_with = np.zeros((with_a.shape[0], 1), dtype=np.int8)
+        zeros_without = np.zeros((without_a.shape[0], 1), dtype=np.int8)
+        split = (
+            np.vstack((np.hstack((zeros_with, with_a + 1)), without_a + 1)),
+            np.vstack((with_b + 1, np.hstack((zeros_without, without_b + 1)))),
+        )
+    memo[key] = split
+    return split
+
+
+@lru_cache(maxsize=4)
+def _split_matrices(players_amount: int, team_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """Team A and team B index rows for every two-team split.
+
+    Rows follow `combinations(range(players_amount), team_size)` order, both
+    teams list their players in ascending index order, and duplicate splits
+    are dropped by keeping rows whose first team A player is in the first half.
+    """
+    team_a, team_b = _build_split_matrices(players_amount, team_size, {})
+    keep = team_a[:, 0] < players_amount // 2
+    # Column-major so that each rank can be gathered as one contiguous column
+    team_a, team_b = np.asfortranarray(team_a[keep]), np.asfortranarray(team_b[keep])
+    team_a.flags.writeable = False
+    team_b.flags.writeable = False
+    return team_a, team_b
+
+
+@lru_cache(maxsize=4)
+def _split_masks(players_amount: int, team_size: int) -> np.ndarray:
+    """Team A of every `_split_matrices` row as a bitmask of player indices"""
+    team_a, _ = _split_matrices(players_amount, team_size)
+    masks = np.zeros(team_a.shape[0], dtype=np.uint64)
+    for column in range(team_size):
+        masks |= np.left_shift(np.uint64(1), team_a[:, column].astype(np.uint64))
+    masks.flags.writeable = False
+    return masks
+
+
+class RelationType(Enum):
     FRIEND = 1
     ENEMY = 2
 
 class Relation:
-    def __init__(self, player_1: PlayerData, player_2: PlayerData, relation: int):
+    def __init__(self, player_1: PlayerData, player_2: PlayerData, relation: RelationType):
         self.player_1 = player_1
         self.player_2 = player_2
         self.relation = relation
 
+
+class DrawConstraints:
+    """Friends, enemies and goalies as indices into the score-sorted players.
+
+    Friends must play in the same team and enemies in different teams. With
+    `one_goalie_per_team` the goalies are spread so that goalie counts per
+    team differ by at most one, i.e. no team gets a second goalie while
+    another one has none. Relations with players outside the draw are ignored.
+    """
+    def __init__(self, players: list[PlayerData], amount_of_teams: int, relations: list[Relation] | None = None,
+                 one_goalie_per_team: bool = False):
+        index = {player.player_id: i for i, player in enumerate(players)}
+        self.friends: list[tuple[int, int]] = []
+        self.enemies: list[tuple[int, int]] = []
+        for relation in relations or []:
+            first, second = index.get(relation.player_1.player_id), index.get(relation.player_2.player_id)
+            if first is None or second is None or first == second:
+                continue
+            pair = (min(first, second), max(first, second))
+            (self.friends if relation.relation == RelationType.FRIEND else self.enemies).append(pair)
+
+        self.goalies = [i for i, player in enumerate(players)
+                        if one_goalie_per_team and player.position == Position.GOALIE]
+        if len(self.goalies) < 2:
+            # A single goalie fits any split
+            self.goalies = []
+        self.goalies_per_team = (len(self.goalies) // amount_of_teams, -(-len(self.goalies) // amount_of_teams))
+        self.active = bool(self.friends or self.enemies or self.goalies)
+
+        # For two-team searches: relations to earlier players, checked when a player is placed
+        self.earlier: list[list[tuple[int, bool]]] = [[] for _ in players]
+        for pairs, same in ((self.friends, True), (self.enemies, False)):
+            for first, second in pairs:
+                self.earlier[second].append((first, same))
+        self.is_goalie = [False] * len(players)
+        for i in self.goalies:
+            self.is_goalie[i] = True
+        self.goalies_before = [0]
+        for goalie in self.is_goalie:
+            self.goalies_before.append(self.goalies_before[-1] + goalie)
+
+    def allows(self, combo: tuple[int, ...], index: int, in_team_a: bool) -> bool:
+        """Whether player `index` may join team A (or team B) of a two-team split.
+
+        `combo` holds team A so far; every other player before `index` is in team B.
+        """
+        for other, same in self.earlier[index]:
+            if (other in combo) != (in_team_a == same):
+                return False
+        if self.is_goalie[index]:
+            goalies_a = sum(self.is_goalie[i] for i in combo)
+            goalies = goalies_a if in_team_a else self.goalies_before[index] - goalies_a
+            return goalies < self.goalies_per_team[1]
+        return True
+
+    def allows_prefix(self, combo: tuple[int, ...], depth: int) -> bool:
+        """Whether team A may hold exactly `combo` among the first `depth` players"""
+        placed = ()
+        for i in range(depth):
+            in_team_a = i in combo
+            if not self.allows(placed, i, in_team_a):
+                return False
+            if in_team_a:
+                placed += (i,)
+        return True
+
+    def allows_rest(self, combo: tuple[int, ...], index: int) -> bool:
+        """Whether every player from `index` on may complete team B"""
+        return all(self.allows(combo, i, False) for i in range(index, len(self.earlier)))
+
+    def split_rows(self, masks: np.ndarray) -> np.ndarray:
+        """Boolean filter of the two-team splits, given as team A bitmasks, that meet every constraint"""
+        allowed = np.ones(len(masks), dtype=bool)
+        for pairs, same in ((self.friends, True), (self.enemies, False)):
+            for first, second in pairs:
+                together = ((masks >> np.uint64(first)) & np.uint64(1)) == ((masks >> np.uint64(second)) & np.uint64(1))
+                allowed &= together if same else ~together
+        if self.goalies:
+            goalie_mask = np.uint64(sum(1 << i for i in self.goalies))
+            goalies_a = np.bitwise_count(masks & goalie_mask)
+            lowest, highest = len(self.goalies) - self.goalies_per_team[1], self.goalies_per_team[1]
+            allowed &= (goalies_a >= lowest) & (goalies_a <= highest)
+        return allowed
+
+    def violations(self, teams) -> int:
+        """How many constraints a split into teams of player indices breaks"""
+        if not self.active:
+            return 0
+        team_of = {i: t for t, team in enumerate(teams) for i in team}
+        broken = sum(team_of[first] != team_of[second] for first, second in self.friends)
+        broken += sum(team_of[first] == team_of[second] for first, second in self.enemies)
+        if self.goalies:
+            lowest, highest = self.goalies_per_team
+            for team in teams:
+                goalies = sum(self.is_goalie[i] for i in team)
+                broken += max(goalies - highest, 0) + max(lowest - goalies, 0)
+        return broken
+
+@dataclass
+class DrawReport:
+    """Quality of the last draw.
+
+    `imbalances` holds each returned draft's balance key (distance of team A
+    from half of the effective total for two teams, strongest minus weakest
+    team otherwise). No split of the roster has an imbalance below
+    `lower_bound`. `complete` is set when the search proved the ranking optimal.
+    `evaluated` counts the full splits (or local search trials) that were scored.
+    """
+    imbalances: list[float] = field(default_factory=list)
+    lower_bound: float = 0.0
+    complete: bool = True
+    evaluated: int = 0
+
+
+@dataclass
+class DrawProgress:
+    """Progress of a running draw, passed to the `progress` callback.
+
+    `draft` is set when the search found a new best draft; `imbalance` is
+    the balance key of the best draft so far.
+    """
+    evaluated: int
+    elapsed_ms: float
+    imbalance: float | None = None
+    draft: tuple[list[PlayerData], ...] | None = None
+
+
 #players are sorted by score from highest to lowest
 class DrawTeamsService:
-    def __init__(self, players: list[PlayerData], amount_of_teams: int = 2, amount_of_draws: int = 20, allow_substitutions: bool = True):
+    def __init__(self, players: list[PlayerData], amount_of_teams: int = 2, amount_of_draws: int = 20, allow_substitutions: bool = True,
+                 time_budget_ms: int | None = None, max_gap: float | None = None,
+                 relations: list[Relation] | None = None, one_goalie_per_team: bool = False, min_distance: int = 0,
+                 position_weight: float = 0.0, progress: Callable[[DrawProgress], None] | None = None,
+                 pair_history: dict[tuple[str, str], int] | None = None, repeat_weight: float = 0.0,
+                 two_teams_budget_ms: int | None = None):
         self.players = sorted(players, key=lambda x: x.score, reverse=True)
+        # The searches read scores by player index from here, and keep teams as
+        # indices or bitmasks; PlayerData only comes back for the returned drafts
+        self.scores = array("d", (player.score for player in self.players))
         self.amount_of_teams = amount_of_teams
         self.amount_of_draws = amount_of_draws
         self.allow_substitutions = allow_substitutions
+        # Anytime mode: stop when the budget runs out or the best draft is within max_gap of the lower bound
+        self.time_budget_ms = time_budget_ms
+        self.max_gap = max_gap
+        # Budget of the unbounded two-team searches when time_budget_ms is None; None keeps them exact,
+        # and a cut-short search says so with report.complete = False
+        self.two_teams_budget_ms = two_teams_budget_ms
+        # Applied inside the searches, so splits that break them are never scored
+        self.constraints = DrawConstraints(self.players, amount_of_teams, relations, one_goalie_per_team)
+        # Fewest players that must change teams between any two returned drafts
+        self.min_distance = min_distance
+        # Multi-objective mode: drafts rank by score imbalance plus this much per unit of
+        # position spread (see `_position_spread`), and imbalances report that sum
+        self.position_weight = position_weight
+        self.positions = [BALANCED_POSITIONS.index(player.position) if player.position in BALANCED_POSITIONS else -1
+                          for player in self.players]
+        # Recent lineups penalty: each pair of teammates adds repeat_weight for every
+        # recent match they shared, as counted in `pair_history` (player id pair -> matches)
+        self.pair_counts = self._pair_matrix(pair_history) if repeat_weight and pair_history else None
+        self.repeat_weight = repeat_weight if self.pair_counts else 0.0
+        # Wall-clock end of the time budget, shared by the shards of a parallel draw
+        self.deadline_at: float | None = None
+        # Called from the searches with each better draft and, every PROGRESS_INTERVAL_MS, with counters
+        self.progress = progress
+        self._start_progress()
+        self.report = DrawReport()
+
+    def _deadline(self, default_ms: float | None = None) -> float:
+        if self.deadline_at is not None:
+            return perf_counter() + max(self.deadline_at - time(), 0.0)
+        budget_ms = self.time_budget_ms if self.time_budget_ms is not None else default_ms
+        return perf_counter() + budget_ms / 1000 if budget_ms is not None else float("inf")
+
+    def __getstate__(self):
+        # Worker processes search without reporting progress
+        return {**self.__dict__, "progress": None}
+
+    def _start_progress(self):
+        self._progress_started = self._progress_at = perf_counter()
+        self._progress_best = None
+
+    def _report_progress(self, evaluated: int, best: list[tuple], to_teams: Callable):
+        """Pass a new best draft, or the counters once PROGRESS_INTERVAL_MS went by, to `progress`"""
+        now = perf_counter()
+        elapsed_ms = (now - self._progress_started) * 1000
+        # The list is sorted, so a new first entry is a better draft
+        top = best[0] if best else None
+        if top is not None and top is not self._progress_best:
+            self._progress_best = top
+            self._progress_at = now
+            self.progress(DrawProgress(evaluated, elapsed_ms, best[0][0], to_teams(best[0][2])))
+        elif now - self._progress_at >= PROGRESS_INTERVAL_MS / 1000:
+            self._progress_at = now
+            self.progress(DrawProgress(evaluated, elapsed_ms, best[0][0] if best else None))
+
+    def _within_gap(self, best_imbalance: float, lower_bound: float) -> bool:
+        return self.max_gap is not None and best_imbalance - lower_bound <= self.max_gap
+
+    def _pool_size(self) -> int:
+        """How many of the best splits a search keeps before the final selection"""
+        return self.amount_of_draws * DIVERSE_POOL_FACTOR if self.min_distance > 0 else self.amount_of_draws
+
+    def _split_distance(self, first: list[int], second: list[int]) -> int:
+        """Fewest players that must change teams to turn one split into the other.
+
+        Splits are lists of team bitmasks. Team labels do not matter, so the
+        teams are matched up to keep the most players in place.
+        """
+        # kept[used] = most players kept in place with `used` teams of `second` matched so far
+        kept = {0: 0}
+        for team in first:
+            matched = {}
+            for used, total in kept.items():
+                for j, other in enumerate(second):
+                    if not used >> j & 1:
+                        key = used | 1 << j
+                        matched[key] = max(matched.get(key, 0), total + (team & other).bit_count())
+            kept = matched
+        return len(self.players) - max(kept.values())
+
+    def _select_diverse(self, splits: list[list[int]]) -> list[int]:
+        """Positions of the drafts to return out of the ranked `splits`.
+
+        Walks the ranking once and keeps a split when it is at least
+        `min_distance` away from every split kept before it.
+        """
+        if self.min_distance <= 0:
+            return list(range(min(len(splits), self.amount_of_draws)))
+        chosen: list[int] = []
+        for position, split in enumerate(splits):
+            if all(self._split_distance(split, splits[other]) >= self.min_distance for other in chosen):
+                chosen.append(position)
+                if len(chosen) == self.amount_of_draws:
+                    break
+        return chosen
+
+    def _select_diverse_combos(self, combos: list[tuple[int, ...]]) -> list[int]:
+        """`_select_diverse` for two-team splits given by their team A indices"""
+        everyone = (1 << len(self.players)) - 1
+        splits = []
+        for combo in combos:
+            team_a = 0
+            for i in combo:
+                team_a |= 1 << i
+            splits.append([team_a, everyone ^ team_a])
+        return self._select_diverse(splits)
 
-    def draw_teams(self) -> list[tuple[list[PlayerData], list[PlayerData]]]:
+    def _position_prefix(self) -> tuple[list[int], list[list[int]]]:
+        """Slot of each player's position (-1 if not balanced) and per-slot prefix counts.
+
+        prefix[slot][i] is how many of the i strongest players play that
+        position. Only positions someone plays get a slot.
+        """
+        present = sorted(set(self.positions) - {-1})
+        slots = [present.index(position) if position >= 0 else -1 for position in self.positions]
+        prefix = []
+        for slot in range(len(present)):
+            counts = [0]
+            for player_slot in slots:
+                counts.append(counts[-1] + (player_slot == slot))
+            prefix.append(counts)
+        return slots, prefix
+
+    def _position_spread(self, teams) -> int:
+        """Per balanced position, most minus fewest players of it in a team, summed over positions"""
+        counts: dict[int, list[int]] = {}
+        for t, team in enumerate(teams):
+            for i in team:
+                if self.positions[i] >= 0:
+                    counts.setdefault(self.positions[i], [0] * len(teams))[t] += 1
+        return sum(max(per_team) - min(per_team) for per_team in counts.values())
+
+    def _position_spread_floor(self) -> int:
+        """Position spread no two-team split goes below: each position with an odd count leaves one team a player ahead"""
+        return sum(self.positions.count(p) % 2 for p in set(self.positions) - {-1})
+
+    def _pair_matrix(self, pair_history: dict[tuple[str, str], int]) -> list[list[int]] | None:
+        """Symmetric player index matrix of shared recent matches, or None if no pair of this roster has any"""
+        index = {player.player_id: i for i, player in enumerate(self.players)}
+        matrix = [[0] * len(self.players) for _ in self.players]
+        found = False
+        for (first, second), matches in pair_history.items():
+            if first in index and second in index and first != second and matches:
+                matrix[index[first]][index[second]] = matrix[index[second]][index[first]] = matches
+                found = True
+        return matrix if found else None
+
+    def _repeat_penalty(self, teams) -> int:
+        """Recent matches shared by pairs of teammates, summed over every team"""
+        penalty = 0
+        for team in teams:
+            for position, i in enumerate(team):
+                row = self.pair_counts[i]
+                for j in team[position + 1:]:
+                    penalty += row[j]
+        return penalty
+
+    def _scores_only(self) -> bool:
+        """Whether drafts rank by score balance alone, with no position spread or repeat penalty added"""
+        return not self.position_weight and not self.repeat_weight
+
+    def draw_teams(self) -> list[tuple[list[PlayerData], ...]]:
+        self._start_progress()
         if self.amount_of_teams == 2:
             combos = self.draw_teams_2()
             return combos
-        elif self.amount_of_teams == 3:
-            combos = self.draw_teams_3()
+        elif self.amount_of_teams > 2:
+            combos = self.draw_teams_n()
             return combos
         else:
             raise ValueError("Invalid amount of teams")
 
     def draw_teams_2(self) -> list[tuple[list[PlayerData], list[PlayerData]]]:
+        """Best two-team splits, scored in one batch when the index matrix fits in memory"""
+        players_amount = len(self.players)
+        team_size = players_amount // self.amount_of_teams
+        if players_amount >= 2 and comb(players_amount, team_size) <= VECTORIZED_MAX_COMBOS:
+            return self._draw_teams_2_vectorized()
+        if self._subset_sum_weights() is not None:
+            return self._draw_teams_2_subset_sum()
+        return self._draw_teams_2_branch_and_bound()
+
+    def draw_teams_parallel(self, executor: Executor | None = None) -> list[tuple[list[PlayerData], ...]]:
+        """`draw_teams` with a large two-team search split into shards that run on `executor`"""
+        search = self._parallel_search()
+        if search is None:
+            return self.draw_teams()
+        executor = executor or draw_executor()
+        self._start_parallel()
+        shards = self._shards(DRAW_WORKERS * SHARDS_PER_WORKER)
+        return self._merge_shards(list(executor.map(_search_shard, repeat(self), repeat(search), shards)))
+
+    async def draw_teams_async(self) -> list[tuple[list[PlayerData], ...]]:
+        """`draw_teams` off the event loop, so other requests are served meanwhile.
+
+        Small draws run on a thread, since sending the service to another
+        process would cost more than the search. Large two-team searches are
+        sharded over the draw process pool, and other large draws run there whole.
+        """
+        loop = asyncio.get_running_loop()
+        search = self._parallel_search()
+        if search is None and self._is_small_draw():
+            return await loop.run_in_executor(None, self.draw_teams)
+        executor = draw_executor()
+        if search is None:
+            drafts, self.report = await loop.run_in_executor(executor, _draw_in_process, self)
+            return [tuple([self.players[i] for i in team] for team in draft) for draft in drafts]
+        self._start_parallel()
+        shards = self._shards(DRAW_WORKERS * SHARDS_PER_WORKER)
+        results = await asyncio.gather(*(loop.run_in_executor(executor, _search_shard, self, search, shard)
+                                         for shard in shards))
+        return self._merge_shards(results)
+
+    def _parallel_search(self) -> str | None:
+        """The two-team search that `draw_teams_2` would run, if it is worth sharding"""
+        players_amount = len(self.players)
+        if self.amount_of_teams != 2 or players_amount < 2 or self.amount_of_draws <= 0:
+            return None
+        if comb(players_amount, players_amount // 2) <= VECTORIZED_MAX_COMBOS:
+            return None
+        if self._subset_sum_weights() is not None:
+            return "_search_subset_sum"
+        return "_search_branch_and_bound"
+
+    def _is_small_draw(self) -> bool:
+        """Whether the draw is scored in one batch (two teams) or enumerated (more teams)"""
+        players_amount = len(self.players)
+        if self.amount_of_teams == 2:
+            return comb(players_amount, players_amount // 2) <= VECTORIZED_MAX_COMBOS
+        return self._n_teams_split_count() <= N_TEAMS_EXACT_MAX_SPLITS
+
+    def _start_parallel(self):
+        self.report = DrawReport()
+        budget_ms = self.time_budget_ms if self.time_budget_ms is not None else self.two_teams_budget_ms
+        self.deadline_at = time() + budget_ms / 1000 if budget_ms is not None else None
+
+    def _shards(self, amount: int) -> list[tuple[int, tuple[int, ...]]]:
+        """Disjoint parts of the two-team search space, at least `amount` of them when possible.
+
+        A shard (depth, combo) holds the splits whose team A has exactly the
+        players in `combo` among the first `depth` players.
+        """
+        players_amount = len(self.players)
+        team_size = players_amount // self.amount_of_teams
+        depth = min((amount - 1).bit_length(), players_amount // 2)
+        return [(depth, combo)
+                for size in range(min(depth, team_size) + 1) if depth - size <= players_amount - team_size
+                for combo in combinations(range(depth), size)]
+
+    def _merge_shards(self, results: list[tuple[list, float, bool, int]]) -> list[tuple[list[PlayerData], list[PlayerData]]]:
+        """Combine the per-shard best lists into the drafts of the whole search"""
+        self.deadline_at = None
+        best = sorted(candidate for shard_best, _, _, _ in results for candidate in shard_best)[:self._pool_size()]
+        lower_bound = min((shard_bound for _, shard_bound, _, _ in results), default=float("inf"))
+        return self._finish_two_teams(best, lower_bound, all(complete for _, _, complete, _ in results),
+                                      sum(evaluated for _, _, _, evaluated in results))
+
+    def _finish_two_teams(self, best: list[tuple[float, float, tuple[int, ...]]], lower_bound: float,
+                          complete: bool, evaluated: int) -> list[tuple[list[PlayerData], list[PlayerData]]]:
+        """Drafts and report from a two-team search's ranked (balance, squared differences, combo) list"""
+        if not best:
+            self.report = DrawReport(evaluated=evaluated)
+            return []
+        best = [best[position] for position in self._select_diverse_combos([combo for _, _, combo in best])]
+        imbalances = [balance for balance, _, _ in best]
+        self.report = DrawReport(
+            imbalances=imbalances,
+            lower_bound=imbalances[0] if complete else min(lower_bound, imbalances[0]),
+            complete=complete,
+            evaluated=evaluated,
+        )
+        return [self._combo_to_teams(combo) for _, _, combo in best]
+
+    def _subset_sum_weights(self) -> list[int] | None:
+        """Scores quantised to SUBSET_SUM_RESOLUTION, or None if they do not fit the index"""
+        weights = [round(score / SUBSET_SUM_RESOLUTION) for score in self.scores]
+        if any(weight < 0 for weight in weights) or sum(weights) > SUBSET_SUM_MAX_UNITS:
+            return None
+        return weights
+
+    def _subset_sum_rounding(self, scores: list[float], weights: list[int]) -> list[float]:
+        """Quantisation error of each score in units, largest first"""
+        return sorted((abs(score / SUBSET_SUM_RESOLUTION - weight) for score, weight in zip(scores, weights)), reverse=True)
+
+    def _two_teams_lower_bound(self) -> float:
+        """Balance that no two-team split can go below, from the subset-sum index.
+
+        Falls back to 0 when the scores do not fit the index.
+        """
+        weights = self._subset_sum_weights()
+        if len(self.players) < 2 or weights is None:
+            return 0.0
         team_size = len(self.players) // self.amount_of_teams
+        scores = self.scores
+        target_units = self._get_effective_total_score() / 2 / SUBSET_SUM_RESOLUTION
+        error_units = sum(self._subset_sum_rounding(scores, weights)[:team_size]) + _BOUND_TOLERANCE / SUBSET_SUM_RESOLUTION
+        _, team_sums = self._subset_sum_index(weights, team_size)
+        nearest = next(_sums_by_distance(team_sums, target_units), None)
+        if nearest is None:
+            return 0.0
+        return max((abs(nearest - target_units) - error_units) * SUBSET_SUM_RESOLUTION, 0.0)
+
+    def _subset_sum_index(self, weights: list[int], team_size: int,
+                          shard: tuple[int, tuple[int, ...]] | None = None) -> tuple[list[list[bytes]], bytes]:
+        """Reachability bitsets for exact-size subset sums.
+
+        Bit `w` of `reach[j][r]` is set when some `r` players out of `j..n-1`
+        sum to `w` units. The second value has the bits reachable by a whole
+        team A whose first player is in the first half, i.e. by the
+        non-duplicate splits (of `shard` only, if given). Bitsets are built as
+        ints and stored as little-endian bytes, which makes single bit lookups O(1).
+        """
+        players_amount = len(weights)
+        reach = [[0] * (team_size + 1) for _ in range(players_amount + 1)]
+        reach[players_amount][0] = 1
+        for j in range(players_amount - 1, -1, -1):
+            # Only sizes that can still complete a team from position j are needed
+            for r in range(max(0, team_size - j), min(team_size, players_amount - j) + 1):
+                reachable = reach[j + 1][r]
+                if r:
+                    reachable |= reach[j + 1][r - 1] << weights[j]
+                reach[j][r] = reachable
+
+        team_sums = 0
+        if shard and shard[1]:
+            depth, combo = shard
+            team_sums = reach[depth][team_size - len(combo)] << sum(weights[i] for i in combo)
+        else:
+            for first in range(shard[0] if shard else 0, players_amount // 2):
+                team_sums |= reach[first + 1][team_size - 1] << weights[first]
+
+        to_bytes = lambda bits: bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+        return [[to_bytes(bits) for bits in row] for row in reach], to_bytes(team_sums)
+
+    def _subset_sum_combos(self, reach: list[list[bytes]], weights: list[int], scores: list[float],
+                           team_size: int, team_sum: int, squared_differences_limit,
+                           shard: tuple[int, tuple[int, ...]] | None = None):
+        """Every non-duplicate team A summing to `team_sum` units, in lexicographic order.
+
+        Yields (combo, squared differences). A rank's squared difference is
+        added as soon as both of its players are placed, so a subtree is
+        skipped once its partial sum exceeds `squared_differences_limit()`.
+        """
+        players_amount = len(weights)
+        constraints = self.constraints if self.constraints.active else None
+        stack = []
+        if shard and shard[1]:
+            depth, combo = shard
+            team_b = tuple(i for i in range(depth) if i not in combo)
+            squared_sum = 0
+            for a, b in zip(combo, team_b):
+                diff = scores[a] - scores[b]
+                squared_sum += diff * diff
+            rest = team_sum - sum(weights[i] for i in combo)
+            if _has_bit(reach[depth][team_size - len(combo)], rest):
+                stack.append((depth, rest, combo, team_b, squared_sum))
+        else:
+            for first in range(players_amount // 2 - 1, (shard[0] if shard else 0) - 1, -1):
+                rest = team_sum - weights[first]
+                if constraints and not (all(constraints.allows((), i, False) for i in range(first))
+                                        and constraints.allows((), first, True)):
+                    continue
+                if _has_bit(reach[first + 1][team_size - 1], rest):
+                    # Players before `first` are all in team B, the strongest facing `first`
+                    diff = scores[first] - scores[0]
+                    stack.append((first + 1, rest, (first,), tuple(range(first)), diff * diff if first else 0))
+
+        while stack:
+            index, rest, combo, team_b, squared_sum = stack.pop()
+            remaining = team_size - len(combo)
+            if remaining == 0:
+                if constraints and not constraints.allows_rest(combo, index):
+                    continue
+                # Every player left is in team B, strongest first
+                for rank in range(len(team_b), team_size):
+                    diff = scores[combo[rank]] - scores[index + rank - len(team_b)]
+                    squared_sum += diff * diff
+                yield combo, squared_sum
+                continue
+
+            if squared_sum > squared_differences_limit():
+                continue
+
+            # Push "skip" first so that "take" is expanded first
+            if players_amount - index - 1 >= remaining and _has_bit(reach[index + 1][remaining], rest) \
+                    and (not constraints or constraints.allows(combo, index, False)):
+                skipped = squared_sum
+                if len(team_b) < len(combo):
+                    diff = scores[combo[len(team_b)]] - scores[index]
+                    skipped += diff * diff
+                stack.append((index + 1, rest, combo, team_b + (index,), skipped))
+            taken = rest - weights[index]
+            if _has_bit(reach[index + 1][remaining - 1], taken) \
+                    and (not constraints or constraints.allows(combo, index, True)):
+                added = squared_sum
+                if len(combo) < len(team_b):
+                    diff = scores[index] - scores[team_b[len(combo)]]
+                    added += diff * diff
+                stack.append((index + 1, taken, combo + (index,), team_b, added))
+
+    def _draw_teams_2_subset_sum(self) -> list[tuple[list[PlayerData], list[PlayerData]]]:
+        """Best two-team splits from a subset-sum reachability index.
+
+        Balancing two teams is a partition problem. With quantised scores the
+        reachable team A sums are known from an n x team size table of bitsets,
+        so the splits can be enumerated sum by sum, closest to half of the
+        effective total first. Cost grows with n times the score range instead
+        of C(n, n/2). Only the enumerated splits get the exact balance and the
+        squared-difference tiebreak, which keeps the order of the exhaustive sort.
+        Position spread and repeat penalty are not indexed: they are added to
+        the balance of each enumerated split. Both are never negative, so a
+        sum's score distance still bounds every split it holds, and the search
+        stops at the same sums, only later when the weights push balances up.
+        """
+        self.report = DrawReport()
+        if len(self.players) < 2 or self.amount_of_draws <= 0 or self._subset_sum_weights() is None:
+            return []
+        return self._finish_two_teams(*self._search_subset_sum())
+
+    def _search_subset_sum(self, shard: tuple[int, tuple[int, ...]] | None = None) -> tuple[list, float, bool, int]:
+        """Subset-sum search behind `_draw_teams_2_subset_sum`, over all splits or one shard.
+
+        Returns the ranked (balance, squared differences, combo) candidates, a
+        lower bound on the balance of the splits searched, whether it finished
+        and how many splits it scored.
+        """
         players_amount = len(self.players)
-        total_score = sum(player.score for player in self.players)
-        
+        weights = self._subset_sum_weights()
+        if shard and self.constraints.active and not self.constraints.allows_prefix(shard[1], shard[0]):
+            return [], float("inf"), True, 0
+
+        team_size = players_amount // self.amount_of_teams
+        scores = self.scores
+        target = self._get_effective_total_score() / 2
+        target_units = target / SUBSET_SUM_RESOLUTION
+        rounding = self._subset_sum_rounding(scores, weights)
+        # Largest gap between a team's real score and its quantised sum, in units
+        error_units = sum(rounding[:team_size]) + _BOUND_TOLERANCE / SUBSET_SUM_RESOLUTION
+        # Binary fractions that quantise without error add up without rounding, so all
+        # splits with the same quantised sum share one balance and only squared
+        # differences (and combo order) set them apart
+        # Position spread and repeat penalty break that, as they differ between splits of one sum
+        scores_only = self._scores_only()
+        exact_sums = scores_only and rounding[0] < 1e-6 and all((score * 1024).is_integer() for score in scores)
+
+        # The budget also covers building the index
+        deadline = self._deadline(self.two_teams_budget_ms)
+        reach, team_sums = self._subset_sum_index(weights, team_size, shard)
+        pool = self._pool_size()
+
+        best: list[tuple[float, float, tuple[int, ...]]] = []
+        level_balance = None
+
+        def squared_differences_limit() -> float:
+            if not exact_sums or level_balance is None or len(best) < pool \
+                    or level_balance < best[-1][0]:
+                return float("inf")
+            # Ties on squared differences still compete on combo order
+            return best[-1][1] if level_balance == best[-1][0] else -1.0
+
+        # Weighted position spread every split pays, added to the score distance bounds below
+        spread_floor = self.position_weight * self._position_spread_floor() if self.position_weight else 0.0
+        lower_bound = None
+        complete = True
+        evaluated = 0
+        for team_sum in _sums_by_distance(team_sums, target_units):
+            distance = abs(team_sum - target_units)
+            if lower_bound is None:
+                # No split can be closer than the nearest reachable sum
+                lower_bound = max((distance - error_units) * SUBSET_SUM_RESOLUTION, 0.0) + spread_floor
+            elif best and self._within_gap(best[0][0], lower_bound):
+                complete = False
+                break
+            # Sums further out cannot hold a split better than the worst kept one
+            if len(best) == pool and (distance - error_units) * SUBSET_SUM_RESOLUTION + spread_floor > best[-1][0]:
+                break
+
+            level_balance = None
+            combos = self._subset_sum_combos(reach, weights, scores, team_size, team_sum,
+                                             squared_differences_limit, shard)
+            for enumerated, (combo, squared_differences) in enumerate(combos):
+                if enumerated % _CHECK_INTERVAL == _CHECK_INTERVAL - 1:
+                    if perf_counter() > deadline or self._within_gap(best[0][0], lower_bound):
+                        complete = False
+                        break
+                    if self.progress:
+                        self._report_progress(evaluated, best, self._combo_to_teams)
+                evaluated += 1
+                if scores_only:
+                    team_score = 0
+                    for i in combo:
+                        team_score += scores[i]
+                    candidate = (abs(team_score - target), squared_differences, combo)
+                else:
+                    candidate = self._combo_key(combo, scores, target)
+                level_balance = candidate[0]
+                if len(best) < pool or candidate < best[-1]:
+                    insort(best, candidate)
+                    if len(best) > pool:
+                        best.pop()
+                    if self.progress and best[0] is candidate:
+                        self._report_progress(evaluated, best, self._combo_to_teams)
+            if not complete:
+                break
+
+        return best, lower_bound if lower_bound is not None else float("inf"), complete, evaluated
+
+    def _draw_teams_2_vectorized(self) -> list[tuple[list[PlayerData], list[PlayerData]]]:
+        """Score every two-team split at once with array ops.
+
+        Each candidate team A is a row of an index matrix. Sums are accumulated
+        column by column, in the same order as the per-combo helpers, so the
+        keys are bit-identical to `_draw_teams_2_exhaustive` and so is the order.
+        """
+        players_amount = len(self.players)
+        self.report = DrawReport()
+        if players_amount < 2 or self.amount_of_draws <= 0:
+            return []
+
+        team_size = players_amount // self.amount_of_teams
+        scores = np.frombuffer(self.scores, dtype=np.float64)
+        target = self._get_effective_total_score() / 2
+
+        combos, team_b = _split_matrices(players_amount, team_size)
+        if self.constraints.active:
+            allowed = np.flatnonzero(self.constraints.split_rows(_split_masks(players_amount, team_size)))
+            if len(allowed) == 0:
+                return []
+            combos, team_b = combos[allowed], team_b[allowed]
+        rows = combos.shape[0]
+        pool = self._pool_size()
+
+        # team A is never the larger one, so its effective score is its plain sum
+        team_a_sum = np.zeros(rows)
+        for column in range(team_size):
+            team_a_sum += scores.take(combos[:, column])
+        balance = np.abs(team_a_sum - target)
+        if self.position_weight:
+            masks = _split_masks(players_amount, team_size)
+            if self.constraints.active:
+                masks = masks[allowed]
+            spread = np.zeros(rows, dtype=np.int64)
+            for p in set(self.positions) - {-1}:
+                position_mask = np.uint64(sum(1 << i for i, position in enumerate(self.positions) if position == p))
+                in_team_a = np.bitwise_count(masks & position_mask).astype(np.int64)
+                spread += np.abs(2 * in_team_a - self.positions.count(p))
+            balance = balance + self.position_weight * spread
+        if self.repeat_weight:
+            # Teammate pairs = all pairs - pairs across teams, and the pairs across are
+            # team A's row totals less its own pairs, counted from both ends
+            pair_counts = np.array(self.pair_counts, dtype=np.int64)
+            row_totals = pair_counts.sum(axis=1)
+            pairs_a = np.zeros(rows, dtype=np.int64)
+            across = np.zeros(rows, dtype=np.int64)
+            for column in range(team_size):
+                across += row_totals.take(combos[:, column])
+                for other in range(column + 1, team_size):
+                    pairs_a += pair_counts[combos[:, column], combos[:, other]]
+            penalty = row_totals.sum() // 2 - across + 2 * pairs_a
+            balance = balance + self.repeat_weight * penalty
+
+        if rows > pool:
+            threshold = balance[np.argpartition(balance, pool - 1)[pool - 1]]
+            shortlist = np.flatnonzero(balance <= threshold)
+        else:
+            shortlist = np.arange(rows)
+
+        # Rank-wise squared differences only for the shortlisted rows; the
+        # weakest player of a larger team B is the substitute and stays unpaired
+        squared_differences = np.zeros(len(shortlist))
+        for column in range(team_size):
+            diff = scores.take(combos[shortlist, column]) - scores.take(team_b[shortlist, column])
+            squared_differences += diff * diff
+
+        # Row order is the lexicographic combo order, which breaks the remaining ties
+        order = np.lexsort((shortlist, squared_differences, balance[shortlist]))
+        ranked = [tuple(combos[row].tolist()) for row in shortlist[order[:pool]]]
+        selected = [(shortlist[order[position]], ranked[position]) for position in self._select_diverse_combos(ranked)]
+
+        imbalances = [float(balance[row]) for row, _ in selected]
+        self.report = DrawReport(imbalances=imbalances, lower_bound=imbalances[0], complete=True, evaluated=rows)
+        return [self._combo_to_teams(combo) for _, combo in selected]
+
+    def _draw_teams_2_branch_and_bound(self) -> list[tuple[list[PlayerData], list[PlayerData]]]:
+        """Branch-and-bound search for the best two-team splits.
+
+        Walks the score-sorted players depth-first, keeps only the best
+        `amount_of_draws` candidates and prunes partial teams whose balance
+        can no longer beat the worst kept candidate. Returns the same drafts,
+        in the same order, as the exhaustive sort in `_draw_teams_2_exhaustive`.
+        """
+        self.report = DrawReport()
+        if len(self.players) < 2 or self.amount_of_draws <= 0:
+            return []
+        return self._finish_two_teams(*self._search_branch_and_bound())
+
+    def _search_branch_and_bound(self, shard: tuple[int, tuple[int, ...]] | None = None) -> tuple[list, float, bool, int]:
+        """Search behind `_draw_teams_2_branch_and_bound`, over all splits or one shard.
+
+        Returns the ranked (balance, squared differences, combo) candidates, a
+        lower bound on the balance of the splits searched, whether it finished
+        and how many splits it scored.
+        """
+        players_amount = len(self.players)
+        team_size = players_amount // self.amount_of_teams
+        scores = self.scores
+        target = self._get_effective_total_score() / 2
+
+        # prefix[i] = sum of the i strongest players, used for the reachable-sum bounds
+        prefix = [0.0]
+        for score in scores:
+            prefix.append(prefix[-1] + score)
+
+        # Position mode keeps team A's count of each position on the stack
+        weight = self.position_weight
+        slots, position_prefix = self._position_prefix() if weight else ([], [])
+
+        def position_bound(index: int, counts: tuple[int, ...], remaining: int) -> int:
+            # Of the players left, team A takes between as few and as many of
+            # each position as the other positions leave room for
+            spread = 0
+            for slot, slot_prefix in enumerate(position_prefix):
+                ahead = slot_prefix[players_amount] - slot_prefix[index]
+                lowest = counts[slot] + max(0, remaining - (players_amount - index - ahead))
+                highest = counts[slot] + min(remaining, ahead)
+                total = slot_prefix[players_amount]
+                spread += max(2 * lowest - total, total - 2 * highest, total % 2)
+            return spread
+
+        # Repeat penalty mode keeps the matches shared by teammates placed so far on the stack
+        repeat_weight = self.repeat_weight
+        pair_counts = self.pair_counts
+        if repeat_weight:
+            # pair_prefix[i][m] = matches player i shared with the players before m
+            pair_prefix = []
+            for row in pair_counts:
+                row_prefix = [0]
+                for matches in row:
+                    row_prefix.append(row_prefix[-1] + matches)
+                pair_prefix.append(row_prefix)
+            # rest_in_b[i] = pairs among players i.. and with earlier ones if they all were in team B
+            rest_in_b = [0] * (players_amount + 1)
+            for i in range(players_amount - 1, -1, -1):
+                rest_in_b[i] = rest_in_b[i + 1] + pair_prefix[i][i]
+
+        def place(pairs: int, combo: tuple[int, ...], i: int, in_team_a: bool) -> int:
+            if not repeat_weight:
+                return pairs
+            with_team_a = sum(pair_counts[i][a] for a in combo)
+            return pairs + (with_team_a if in_team_a else pair_prefix[i][i] - with_team_a)
+
+        def bound(index: int, team_score: float, remaining: int, counts: tuple[int, ...], pairs: int) -> float:
+            # Team A can still end up anywhere between taking the weakest
+            # and the strongest of the players left
+            lowest = team_score + prefix[players_amount] - prefix[players_amount - remaining]
+            highest = team_score + prefix[index + remaining] - prefix[index]
+            balance = max(lowest - target, target - highest, 0.0)
+            if weight:
+                balance += weight * position_bound(index, counts, remaining)
+            if repeat_weight:
+                balance += repeat_weight * pairs
+            return balance
+
+        def open_bound() -> float:
+            # Nothing left on the stack can beat the smallest of these
+            bounds = [bound(index, team_score, team_size - len(combo), counts, pairs)
+                      for index, team_score, combo, counts, pairs in stack if combo or index < players_amount // 2]
+            return min(bounds, default=float("inf"))
+
+        def add_player(counts: tuple[int, ...], i: int) -> tuple[int, ...]:
+            slot = slots[i] if weight else -1
+            return counts if slot < 0 else counts[:slot] + (counts[slot] + 1,) + counts[slot + 1:]
+
+        deadline = self._deadline(self.two_teams_budget_ms)
+        expanded = 0
+        evaluated = 0
+        constraints = self.constraints if self.constraints.active else None
+        pool = self._pool_size()
+
+        # best holds (balance, squared_differences, combo) sorted ascending,
+        # combo keeps ties in the same order as the lexicographic enumeration
+        best: list[tuple[float, float, tuple[int, ...]]] = []
+        counts = (0,) * len(position_prefix)
+        stack = [(0, 0, (), counts, 0)]
+        if shard:
+            depth, combo = shard
+            if constraints and not constraints.allows_prefix(combo, depth):
+                return [], float("inf"), True, 0
+            team_score = 0
+            for i in combo:
+                team_score += scores[i]
+                counts = add_player(counts, i)
+            pairs = 0
+            for i in range(depth):
+                pairs = place(pairs, tuple(a for a in combo if a < i), i, i in combo)
+            stack = [(depth, team_score, combo, counts, pairs)]
+
+        while stack:
+            expanded += 1
+            if expanded % _CHECK_INTERVAL == 0 and best:
+                if perf_counter() > deadline or self._within_gap(best[0][0], min(best[0][0], open_bound())):
+                    break
+                if self.progress:
+                    self._report_progress(evaluated, best, self._combo_to_teams)
+
+            index, team_score, combo, counts, pairs = stack.pop()
+            remaining = team_size - len(combo)
+
+            if remaining == 0:
+                if constraints and not constraints.allows_rest(combo, index):
+                    continue
+                evaluated += 1
+                balance = abs(team_score - target)
+                if weight:
+                    balance += weight * sum(abs(2 * count - slot_prefix[players_amount])
+                                            for count, slot_prefix in zip(counts, position_prefix))
+                if repeat_weight:
+                    # Everyone from `index` on is in team B
+                    pairs += rest_in_b[index] - sum(pair_prefix[a][players_amount] - pair_prefix[a][index] for a in combo)
+                    balance += repeat_weight * pairs
+                if len(best) == pool and balance > best[-1][0]:
+                    continue
+                candidate = (balance, self._calculate_squared_differences_for_combo(combo), combo)
+                if len(best) < pool or candidate < best[-1]:
+                    insort(best, candidate)
+                    if len(best) > pool:
+                        best.pop()
+                    if self.progress and best[0] is candidate:
+                        self._report_progress(evaluated, best, self._combo_to_teams)
+                continue
+
+            # Skip duplicate splits: the first player picked must be in the first half
+            if not combo and index >= players_amount // 2:
+                continue
+
+            if len(best) == pool and bound(index, team_score, remaining, counts, pairs) > best[-1][0] + _BOUND_TOLERANCE:
+                continue
+
+            # Constraints prune a branch as soon as the player breaking them is placed
+            if players_amount - index - 1 >= remaining and (not constraints or constraints.allows(combo, index, False)):
+                stack.append((index + 1, team_score, combo, counts, place(pairs, combo, index, False)))
+            if not constraints or constraints.allows(combo, index, True):
+                stack.append((index + 1, team_score + scores[index], combo + (index,), add_player(counts, index),
+                               place(pairs, combo, index, True)))
+
+        lower_bound = min(best[0][0], open_bound()) if best else open_bound()
+        return best, lower_bound, not stack, evaluated
+
+    def _combo_to_teams(self, combo: tuple[int, ...]) -> tuple[list[PlayerData], list[PlayerData]]:
+        """Map a combo of team A indices back to both teams"""
+        in_team_a = self._combo_mask(combo)
+        team_a = [self.players[i] for i in combo]
+        team_b = [player for i, player in enumerate(self.players) if not in_team_a >> i & 1]
+        return team_a, team_b
+
+    @staticmethod
+    def _combo_mask(combo: tuple[int, ...]) -> int:
+        """Bitmask with bit i set for every player index i in the combo"""
+        mask = 0
+        for i in combo:
+            mask |= 1 << i
+        return mask
+
+    def _mask_to_team_b(self, in_team_a: int) -> list[int]:
+        """Indices of the players outside a team A bitmask, strongest first"""
+        return [i for i in range(len(self.players)) if not in_team_a >> i & 1]
+
+    def _draw_teams_2_exhaustive(self) -> list[tuple[list[PlayerData], list[PlayerData]]]:
+        """Reference implementation: score and sort every two-team split"""
+        team_size = len(self.players) // self.amount_of_teams
+        players_amount = len(self.players)
+
         combos = []
         for combo in combinations(range(players_amount), team_size):
             # Filter out duplicate team combinations by ensuring the first player 
@@ -42,100 +1101,555 @@ class DrawTeamsService:
             if min(combo) < players_amount // 2:
                 combos.append(combo)
 
+        if self.constraints.active:
+            combos = [combo for combo in combos
+                      if not self.constraints.violations((combo, self._mask_to_team_b(self._combo_mask(combo))))]
+
         # Sort combos by how close their score is to half of the total score
         combos = sorted(
             combos,
             key=lambda x: (
-                abs(self._get_effective_combo_score(x) - self._get_effective_total_score() / 2),  # First: team balance
-                self._calculate_squared_differences_for_combo(x)                                   # Second: squared differences
+                self._combo_balance(x),                           # First: team balance
+                self._calculate_squared_differences_for_combo(x)  # Second: squared differences
             )
         )
 
-        combos = combos[0:self.amount_of_draws]
-
-        draft_data = []
+        combos = combos[0:self._pool_size()]
+        combos = [combos[position] for position in self._select_diverse_combos(combos)]
 
-        for combo in combos:
-            team_a = [self.players[i] for i in combo]
-            team_b = [player for player in self.players if player not in team_a]
-            draft_data.append((team_a, team_b))
-
-        return draft_data
+        return [self._combo_to_teams(combo) for combo in combos]
     
+    def _combo_balance(self, combo: tuple) -> float:
+        """Distance of team A's effective score from half of the total, plus the weighted position spread and repeat penalty"""
+        balance = abs(self._get_effective_combo_score(combo) - self._get_effective_total_score() / 2)
+        if self.position_weight or self.repeat_weight:
+            teams = (combo, self._mask_to_team_b(self._combo_mask(combo)))
+            if self.position_weight:
+                balance += self.position_weight * self._position_spread(teams)
+            if self.repeat_weight:
+                balance += self.repeat_weight * self._repeat_penalty(teams)
+        return balance
+
     def _get_effective_total_score(self) -> float:
         """Get total score of all players considering substitutions"""
-        if not self.allow_substitutions:
-            return sum(player.score for player in self.players)
-        
-        # If substitutions allowed and odd number of players, exclude the weakest
-        total_players = len(self.players)
-        expected_smaller_team_size = total_players // self.amount_of_teams
-        
-        if total_players % self.amount_of_teams != 0:
-            # Odd number - exclude the weakest player
-            return sum(player.score for player in self.players[:-1])
-        else:
-            return sum(player.score for player in self.players)
-    
+        # If substitutions allowed and the teams cannot be equal, exclude the weakest
+        if self.allow_substitutions and len(self.players) % self.amount_of_teams != 0:
+            return sum(self.scores[:-1])
+        return sum(self.scores)
+
     def _get_effective_combo_score(self, combo: tuple) -> float:
-        """Get effective score for a combo considering substitutions"""
-        team_a = [self.players[i] for i in combo]
-        team_b = [self.players[i] for i in range(len(self.players)) if i not in combo]
-        
-        return self._get_effective_team_score(team_a, team_b)
-    
-    def _get_effective_team_score(self, team_a: list[PlayerData], team_b: list[PlayerData]) -> float:
-        """Get team A score considering substitutions option"""
-        if not self.allow_substitutions:
-            return sum(player.score for player in team_a)
-        
-        # If team sizes are different, exclude weakest player from larger team
-        if len(team_a) > len(team_b):
-            # team_a is larger, exclude its weakest player
-            team_a_sorted = sorted(team_a, key=lambda x: x.score, reverse=True)
-            return sum(player.score for player in team_a_sorted[:-1])
-        else:
-            return sum(player.score for player in team_a)
-    
+        """Get team A score for a combo considering substitutions"""
+        if self.allow_substitutions and 2 * len(combo) > len(self.players):
+            # Team A is the larger team, so its weakest player sits out
+            combo = sorted(combo)[:-1]
+        scores = self.scores
+        return sum(scores[i] for i in combo)
+
     def _calculate_squared_differences_for_combo(self, combo: tuple) -> float:
         """Calculate sum of squared differences for a specific combination of player indices"""
-        # Create teams from the combo
-        team_a = [self.players[i] for i in combo]
-        team_b = [self.players[i] for i in range(len(self.players)) if i not in combo]
-        
-        # Sort both teams by score (highest to lowest)
-        team_a_sorted = sorted(team_a, key=lambda x: x.score, reverse=True)
-        team_b_sorted = sorted(team_b, key=lambda x: x.score, reverse=True)
-        
+        # Players are sorted by score, so both teams in index order go from highest to lowest
+        team_a = sorted(combo)
+        team_b = self._mask_to_team_b(self._combo_mask(combo))
+
         # Handle substitutions - exclude weakest player from larger team
-        if self.allow_substitutions and len(team_a_sorted) != len(team_b_sorted):
-            if len(team_a_sorted) > len(team_b_sorted):
-                # team_a is larger, exclude its weakest player
-                team_a_sorted = team_a_sorted[:-1]
+        if self.allow_substitutions and len(team_a) != len(team_b):
+            if len(team_a) > len(team_b):
+                team_a = team_a[:-1]
             else:
-                # team_b is larger, exclude its weakest player
-                team_b_sorted = team_b_sorted[:-1]
-        
+                team_b = team_b[:-1]
+
         # Calculate sum of squared differences between corresponding players
+        scores = self.scores
         squared_sum = 0
-        for i in range(min(len(team_a_sorted), len(team_b_sorted))):
-            diff = team_a_sorted[i].score - team_b_sorted[i].score
+        for a, b in zip(team_a, team_b):
+            diff = scores[a] - scores[b]
             squared_sum += diff * diff
-        
+
         return squared_sum
 
-    def draw_teams_3(self) -> list[int]:
-        team_size = len(self.players) // self.amount_of_teams
+    def draw_teams_n(self) -> list[tuple[list[PlayerData], ...]]:
+        """Best splits into `amount_of_teams` teams found by local search.
+
+        Seeds assignments with a snake draft, a greedy fill and random starts,
+        then improves each with player swaps (and moves between teams whose
+        sizes differ by one) until no move lowers the score spread or, on
+        equal spread, the rank-wise squared differences. Restarts run until
+        `N_TEAMS_RESTARTS` or `N_TEAMS_TIME_BUDGET_MS` is reached, or until
+        `N_TEAMS_STALL_RESTARTS` restarts in a row did not improve the best
+        split. Rosters with at most `N_TEAMS_EXACT_MAX_SPLITS` splits are
+        enumerated instead, which proves the optimum. Teams are stored in a
+        canonical order, so relabelled copies of a split count once.
+        """
+        return self._draw_teams_n(exact=self._n_teams_split_count() <= N_TEAMS_EXACT_MAX_SPLITS)
+
+    def _draw_teams_n_local_search(self) -> list[tuple[list[PlayerData], ...]]:
+        """`draw_teams_n` without the enumeration of small rosters, so the local search always runs"""
+        return self._draw_teams_n(exact=False)
+
+    def _draw_teams_n(self, exact: bool) -> list[tuple[list[PlayerData], ...]]:
+        players_amount = len(self.players)
+        self.report = DrawReport()
+        if players_amount < self.amount_of_teams or self.amount_of_draws <= 0:
+            return []
+
+        scores = self.scores
+        deadline = self._deadline(N_TEAMS_TIME_BUDGET_MS)
+        rng = Random(N_TEAMS_SEED)
+        smallest_size = players_amount // self.amount_of_teams
+        lower_bound = self._n_teams_lower_bound(scores, smallest_size)
+        pool = self._pool_size()
+
+        # best holds (spread, squared_differences, teams) sorted ascending
+        best: list[tuple[float, float, tuple[tuple[int, ...], ...]]] = []
+        kept = set()
+        evaluated = 0
+
+        def keep(teams: list[list[int]]):
+            canonical = tuple(sorted(tuple(team) for team in teams))
+            if canonical in kept or self.constraints.violations(canonical):
+                return
+            spread = self._teams_spread(canonical, scores, smallest_size)
+            if len(best) == pool and spread > best[-1][0] + _BOUND_TOLERANCE:
+                return
+            candidate = (spread, self._teams_squared_differences(canonical, scores, smallest_size), canonical)
+            if len(best) < pool or candidate < best[-1]:
+                insort(best, candidate)
+                kept.add(canonical)
+                if len(best) > pool:
+                    kept.discard(best.pop()[2])
+
+        if exact:
+            for teams in self._n_teams_splits():
+                keep(teams)
+                evaluated += 1
+                if evaluated % _CHECK_INTERVAL == 0:
+                    if perf_counter() > deadline:
+                        exact = False
+                        break
+                    if self.progress:
+                        self._report_progress(evaluated, best, self._teams_to_players)
+            if self.progress:
+                self._report_progress(evaluated, best, self._teams_to_players)
+
+        stalled = 0
+        for restart in range(0 if exact else N_TEAMS_RESTARTS):
+            if restart and (perf_counter() > deadline or best and self._within_gap(best[0][0], lower_bound)
+                            or stalled >= N_TEAMS_STALL_RESTARTS):
+                break
+            before = best[0] if best else None
+            teams = self._seed_teams(restart, rng)
+            evaluated += self._improve_teams(teams, scores, smallest_size, deadline) + 1
+            keep(teams)
+            # Single swaps around each local optimum give the near-best alternatives
+            for first, second, i, j in self._team_swaps(teams):
+                teams[first][i], teams[second][j] = teams[second][j], teams[first][i]
+                keep([sorted(team) for team in teams])
+                evaluated += 1
+                teams[first][i], teams[second][j] = teams[second][j], teams[first][i]
+            stalled = stalled + 1 if best and best[0] is before else 0
+            if self.progress:
+                self._report_progress(evaluated, best, self._teams_to_players)
+
+        if not best:
+            self.report = DrawReport(evaluated=evaluated)
+            return []
+        splits = [[sum(1 << i for i in team) for team in teams] for _, _, teams in best]
+        best = [best[position] for position in self._select_diverse(splits)]
+        imbalances = [spread for spread, _, _ in best]
+        # Every split was scored, so the best one is the optimum
+        if exact:
+            lower_bound = imbalances[0]
+        self.report = DrawReport(
+            imbalances=imbalances,
+            lower_bound=min(lower_bound, imbalances[0]),
+            complete=imbalances[0] - lower_bound <= _BOUND_TOLERANCE,
+            evaluated=evaluated,
+        )
+        return [self._teams_to_players(teams) for _, _, teams in best]
+
+    def _n_teams_split_count(self) -> int:
+        """How many distinct splits into `amount_of_teams` teams the roster has"""
+        sizes = self._team_sizes()
+        count = factorial(len(self.players))
+        for size in sizes:
+            count //= factorial(size)
+        # Teams of the same size can swap labels
+        for size in set(sizes):
+            count //= factorial(sizes.count(size))
+        return count
+
+    def _n_teams_splits(self):
+        """Every split into `amount_of_teams` teams once, each team index-sorted.
+
+        The weakest-index player left always opens the next team, and each
+        size is tried once per team, so relabelled copies are never made.
+        """
+        def splits(rest: list[int], sizes: list[int]):
+            if not rest:
+                yield []
+                return
+            first, others = rest[0], rest[1:]
+            for size in sorted(set(sizes)):
+                remaining_sizes = list(sizes)
+                remaining_sizes.remove(size)
+                for mates in combinations(others, size - 1):
+                    team = [first, *mates]
+                    in_team = set(mates)
+                    for teams in splits([i for i in others if i not in in_team], remaining_sizes):
+                        yield [team, *teams]
+
+        yield from splits(list(range(len(self.players))), self._team_sizes())
+
+    def _teams_to_players(self, teams) -> tuple[list[PlayerData], ...]:
+        return tuple([self.players[i] for i in team] for team in teams)
+
+    def redraw_teams(self, previous: list[list[list[str]]]) -> list[tuple[list[PlayerData], ...]]:
+        """Re-optimise earlier drafts after players joined or left the roster.
+
+        `previous` holds the earlier drafts as teams of player ids. Players no
+        longer in the roster are dropped, newcomers join the weakest team with
+        room, and each adapted draft goes through the same local search as
+        `draw_teams_n`. If the best result is more than `max_gap` (by default
+        `REDRAW_MAX_GAP`) above the lower bound, a full `draw_teams` runs instead.
+        """
+        drafts = self._redraw(previous)
+        return self.draw_teams() if drafts is None else drafts
+
+    async def redraw_teams_async(self, previous: list[list[list[str]]]) -> list[tuple[list[PlayerData], ...]]:
+        """`redraw_teams` off the event loop: the re-optimisation runs on a thread,
+        and a full draw it falls back to goes through `draw_teams_async`"""
+        drafts = await asyncio.get_running_loop().run_in_executor(None, self._redraw, previous)
+        return await self.draw_teams_async() if drafts is None else drafts
+
+    def _redraw(self, previous: list[list[list[str]]]) -> list[tuple[list[PlayerData], ...]] | None:
+        """Drafts re-optimised from `previous`, or None when a full draw has to run instead"""
+        players_amount = len(self.players)
+        self.report = DrawReport()
+        if players_amount < max(self.amount_of_teams, 2) or self.amount_of_draws <= 0:
+            return []
+        if not previous:
+            return None
+
+        index = {player.player_id: i for i, player in enumerate(self.players)}
+        scores = self.scores
+        smallest_size = players_amount // self.amount_of_teams
+        target = self._get_effective_total_score() / 2
+        deadline = self._deadline(REDRAW_TIME_BUDGET_MS)
+        pool = self._pool_size()
+
+        # best holds (imbalance, squared_differences, split) sorted ascending, where a split
+        # is team A's combo for two teams and the canonical teams otherwise
+        best: list[tuple[float, float, tuple]] = []
+        kept = set()
+        evaluated = 0
+
+        def keep(teams: list[list[int]]):
+            if self.constraints.violations(teams):
+                return
+            if self.amount_of_teams == 2:
+                candidate = self._combo_key(self._teams_to_combo(teams), scores, target)
+            else:
+                canonical = tuple(sorted(tuple(sorted(team)) for team in teams))
+                candidate = (self._teams_spread(canonical, scores, smallest_size),
+                             self._teams_squared_differences(canonical, scores, smallest_size), canonical)
+            if candidate[2] in kept:
+                return
+            if len(best) < pool or candidate < best[-1]:
+                insort(best, candidate)
+                kept.add(candidate[2])
+                if len(best) > pool:
+                    kept.discard(best.pop()[2])
+
+        for draft in previous:
+            if best and perf_counter() > deadline:
+                break
+            teams = self._adapt_teams(draft, index, scores)
+            if teams is None:
+                continue
+            evaluated += self._improve_teams(teams, scores, smallest_size, deadline) + 1
+            keep(teams)
+            for first, second, i, j in self._team_swaps(teams):
+                teams[first][i], teams[second][j] = teams[second][j], teams[first][i]
+                keep(teams)
+                evaluated += 1
+                teams[first][i], teams[second][j] = teams[second][j], teams[first][i]
+
+        if self.amount_of_teams == 2:
+            lower_bound = self._two_teams_lower_bound()
+        else:
+            lower_bound = self._n_teams_lower_bound(scores, smallest_size)
+        max_gap = self.max_gap if self.max_gap is not None else REDRAW_MAX_GAP
+        if not best or best[0][0] - lower_bound > max_gap:
+            return None
+
+        if self.amount_of_teams == 2:
+            best = [best[position] for position in self._select_diverse_combos([combo for _, _, combo in best])]
+        else:
+            splits = [[sum(1 << i for i in team) for team in teams] for _, _, teams in best]
+            best = [best[position] for position in self._select_diverse(splits)]
+        imbalances = [imbalance for imbalance, _, _ in best]
+        self.report = DrawReport(
+            imbalances=imbalances,
+            lower_bound=min(lower_bound, imbalances[0]),
+            complete=imbalances[0] - lower_bound <= _BOUND_TOLERANCE,
+            evaluated=evaluated,
+        )
+        if self.amount_of_teams == 2:
+            return [self._combo_to_teams(combo) for _, _, combo in best]
+        return [tuple([self.players[i] for i in team] for team in teams) for _, _, teams in best]
+
+    def _adapt_teams(self, draft: list[list[str]], index: dict[str, int], scores: list[float]) -> list[list[int]] | None:
+        """Teams of an earlier draft fitted to the current roster and team sizes"""
+        if len(draft) != self.amount_of_teams:
+            return None
+        placed = set()
+        teams = []
+        for team in draft:
+            teams.append(sorted(index[player_id] for player_id in team
+                                if player_id in index and index[player_id] not in placed))
+            placed.update(teams[-1])
+
+        # The teams that kept the most players get the larger sizes; the
+        # weakest players of a team that is now too big are placed again
+        waiting = [i for i in range(len(self.players)) if i not in placed]
+        order = sorted(range(self.amount_of_teams), key=lambda t: len(teams[t]), reverse=True)
+        capacity = dict(zip(order, self._team_sizes()))
+        for t in order:
+            while len(teams[t]) > capacity[t]:
+                waiting.append(teams[t].pop())
+        sums = [sum(scores[i] for i in team) for team in teams]
+        for i in sorted(waiting):
+            team = min((t for t in order if len(teams[t]) < capacity[t]), key=lambda t: sums[t])
+            teams[team].append(i)
+            sums[team] += scores[i]
+        for team in teams:
+            team.sort()
+        return teams
+
+    def _teams_to_combo(self, teams: list[list[int]]) -> tuple[int, ...]:
+        """Team A of a two-team split: the smaller team, or the one with the strongest player"""
+        first, second = sorted(teams, key=lambda team: (len(team), min(team, default=len(self.players))))
+        return tuple(sorted(first))
+
+    def _combo_key(self, combo: tuple[int, ...], scores: list[float], target: float) -> tuple[float, float, tuple[int, ...]]:
+        """Ranking key of a two-team split, equal to the one `_draw_teams_2_exhaustive` sorts by"""
+        in_team_a = set(combo)
+        team_b = [i for i in range(len(scores)) if i not in in_team_a]
+        team_score = 0
+        for i in combo:
+            team_score += scores[i]
+        squared_sum = 0
+        for a, b in zip(combo, team_b):
+            diff = scores[a] - scores[b]
+            squared_sum += diff * diff
+        balance = abs(team_score - target)
+        if self.position_weight:
+            balance += self.position_weight * self._position_spread((combo, team_b))
+        if self.repeat_weight:
+            balance += self.repeat_weight * self._repeat_penalty((combo, team_b))
+        return balance, squared_sum, combo
+
+    def _n_teams_lower_bound(self, scores: list[float], smallest_size: int) -> float:
+        """Spread that no split into `amount_of_teams` teams can go below.
+
+        The strongest player's team counts at least `smallest_size` players, so
+        its effective score is at least that player plus the weakest others. The
+        weakest team is at most average, and substitutes (one per larger team,
+        each at least as strong as the weakest players) only lower that average.
+        """
+        players_amount = len(scores)
+        strongest_team = scores[0] + sum(scores[players_amount - smallest_size + 1:]) if smallest_size > 1 else scores[0]
+        effective_total = sum(scores)
+        if self.allow_substitutions:
+            substitutes = players_amount % self.amount_of_teams
+            effective_total -= sum(scores[players_amount - substitutes:])
+        return max(strongest_team - effective_total / self.amount_of_teams, 0.0)
+
+    def _team_sizes(self) -> list[int]:
+        """Size of each team, the larger ones first"""
+        players_amount = len(self.players)
+        return [players_amount // self.amount_of_teams + (1 if t < players_amount % self.amount_of_teams else 0)
+                for t in range(self.amount_of_teams)]
+
+    def _seed_teams(self, restart: int, rng: Random) -> list[list[int]]:
+        """Starting assignment for a local search restart"""
+        players_amount = len(self.players)
+        if restart == 0:
+            # Snake draft: 0, 1, ..., k-1, k-1, ..., 0, 0, 1, ...
+            teams = [[] for _ in range(self.amount_of_teams)]
+            for i in range(players_amount):
+                round_number, pick = divmod(i, self.amount_of_teams)
+                teams[pick if round_number % 2 == 0 else self.amount_of_teams - 1 - pick].append(i)
+            return teams
+
+        sizes = self._team_sizes()
+        if self.constraints.active:
+            return self._seed_constrained_teams(restart, rng, sizes)
+        if restart == 1:
+            # Greedy: each player joins the weakest team that still has room
+            teams = [[] for _ in range(self.amount_of_teams)]
+            sums = [0.0] * self.amount_of_teams
+            for i, score in enumerate(self.scores):
+                team = min((t for t in range(self.amount_of_teams) if len(teams[t]) < sizes[t]), key=lambda t: sums[t])
+                teams[team].append(i)
+                sums[team] += score
+            return teams
+
+        labels = [t for t, size in enumerate(sizes) for _ in range(size)]
+        rng.shuffle(labels)
+        teams = [[] for _ in range(self.amount_of_teams)]
+        for i, label in enumerate(labels):
+            teams[label].append(i)
+        return teams
+
+    def _seed_constrained_teams(self, restart: int, rng: Random, sizes: list[int]) -> list[list[int]]:
+        """Greedy start that places friends as one group and keeps enemies and goalies apart.
+
+        Groups go strongest first on the first call and in random order after
+        that, each into the weakest team that has room and breaks nothing. A
+        group that cannot be placed cleanly goes where it fits, or is split.
+        """
+        constraints = self.constraints
         players_amount = len(self.players)
-        all_teams = []
-        # Generate all possible combinations for the first team
-        for first_team in combinations(range(players_amount), team_size):
-            remaining_players = [i for i in range(players_amount) if i not in first_team]
-            # Generate all possible combinations for the second team from remaining players
-            for second_team in combinations(remaining_players, team_size):
-                third_team = [i for i in remaining_players if i not in second_team]
-                all_teams.append([list(first_team), list(second_team), third_team])
-        return all_teams
+        group_of = list(range(players_amount))
+
+        def root(i: int) -> int:
+            while group_of[i] != i:
+                group_of[i] = group_of[group_of[i]]
+                i = group_of[i]
+            return i
+
+        for first, second in constraints.friends:
+            group_of[root(second)] = root(first)
+        groups: dict[int, list[int]] = {}
+        for i in range(players_amount):
+            groups.setdefault(root(i), []).append(i)
+        ordered = list(groups.values())
+        if restart == 1:
+            ordered.sort(key=lambda group: sum(self.scores[i] for i in group), reverse=True)
+        else:
+            rng.shuffle(ordered)
+
+        enemies = [set() for _ in range(players_amount)]
+        for first, second in constraints.enemies:
+            enemies[first].add(second)
+            enemies[second].add(first)
+
+        teams = [[] for _ in range(self.amount_of_teams)]
+        sums = [0.0] * self.amount_of_teams
+        goalies = [0] * self.amount_of_teams
+
+        def place(group: list[int], team: int):
+            teams[team].extend(group)
+            sums[team] += sum(self.scores[i] for i in group)
+            goalies[team] += sum(constraints.is_goalie[i] for i in group)
+
+        for group in ordered:
+            fits = [t for t in range(self.amount_of_teams) if len(teams[t]) + len(group) <= sizes[t]]
+            clean = [t for t in fits
+                     if not any(enemies[i].intersection(teams[t]) for i in group)
+                     and goalies[t] + sum(constraints.is_goalie[i] for i in group) <= constraints.goalies_per_team[1]]
+            if clean or fits:
+                place(group, min(clean or fits, key=lambda t: sums[t]))
+                continue
+            for i in group:
+                place([i], min((t for t in range(self.amount_of_teams) if len(teams[t]) < sizes[t]), key=lambda t: sums[t]))
+        return teams
+
+    def _team_swaps(self, teams: list[list[int]]):
+        """Positions (first team, second team, i, j) of every useful player swap"""
+        for first in range(len(teams)):
+            for second in range(first + 1, len(teams)):
+                for i, a in enumerate(teams[first]):
+                    for j, b in enumerate(teams[second]):
+                        if self.scores[a] != self.scores[b]:
+                            yield first, second, i, j
+
+    def _improve_teams(self, teams: list[list[int]], scores: list[float], smallest_size: int, deadline: float) -> int:
+        """First-improvement local search over swaps and moves, in place.
+
+        Broken constraints are counted first, so a search started from an
+        infeasible seed works its way to a feasible split when it can.
+        Returns how many trial splits were tried.
+        """
+        for team in teams:
+            team.sort()
+        violations = self.constraints.violations
+        current = (violations(teams),
+                   self._teams_spread(teams, scores, smallest_size),
+                   self._teams_squared_differences(teams, scores, smallest_size))
+
+        trials = 0
+        improved = True
+        while improved and perf_counter() <= deadline:
+            improved = False
+            for first in range(len(teams)):
+                for second in range(len(teams)):
+                    if first == second:
+                        continue
+                    candidates = []
+                    if first < second:
+                        for i in range(len(teams[first])):
+                            for j in range(len(teams[second])):
+                                new_first = teams[first][:i] + teams[first][i + 1:] + [teams[second][j]]
+                                new_second = teams[second][:j] + teams[second][j + 1:] + [teams[first][i]]
+                                candidates.append((new_first, new_second))
+                    if len(teams[first]) == len(teams[second]) + 1:
+                        for i in range(len(teams[first])):
+                            candidates.append((teams[first][:i] + teams[first][i + 1:], teams[second] + [teams[first][i]]))
+
+                    for new_first, new_second in candidates:
+                        trials += 1
+                        new_first.sort()
+                        new_second.sort()
+                        trial = list(teams)
+                        trial[first], trial[second] = new_first, new_second
+                        broken = violations(trial)
+                        if broken > current[0]:
+                            continue
+                        spread = self._teams_spread(trial, scores, smallest_size)
+                        if broken == current[0] and spread > current[1] + _BOUND_TOLERANCE:
+                            continue
+                        key = (broken, spread, self._teams_squared_differences(trial, scores, smallest_size))
+                        if key[0] < current[0] or key[1] < current[1] - _BOUND_TOLERANCE \
+                                or key[2] < current[2] - _BOUND_TOLERANCE:
+                            teams[first], teams[second] = new_first, new_second
+                            current = key
+                            improved = True
+                            break
+        return trials
+
+    def _team_effective_score(self, team, scores: list[float], smallest_size: int) -> float:
+        """Team score without its substitute; `team` is index-sorted, so its weakest player is last"""
+        total = sum(scores[i] for i in team)
+        if self.allow_substitutions and len(team) > smallest_size:
+            total -= scores[team[-1]]
+        return total
+
+    def _teams_spread(self, teams, scores: list[float], smallest_size: int) -> float:
+        """Difference between the strongest and the weakest team's effective score, plus the weighted
+        position spread and repeat penalty"""
+        effective = [self._team_effective_score(team, scores, smallest_size) for team in teams]
+        spread = max(effective) - min(effective)
+        if self.position_weight:
+            spread += self.position_weight * self._position_spread(teams)
+        if self.repeat_weight:
+            spread += self.repeat_weight * self._repeat_penalty(teams)
+        return spread
+
+    def _teams_squared_differences(self, teams, scores: list[float], smallest_size: int) -> float:
+        """Rank-wise squared differences summed over every pair of teams.
+
+        For each rank the pairwise sum is computed as k * sum(x^2) - sum(x)^2.
+        Ranks past the smallest team are substitutes and are left unpaired.
+        """
+        amount = len(teams)
+        squared_sum = 0
+        for rank in range(smallest_size):
+            rank_scores = [scores[team[rank]] for team in teams]
+            total = sum(rank_scores)
+            squared_sum += amount * sum(x * x for x in rank_scores) - total * total
+        return squared_sum
     
 #cd backend
 #python -m app.services.draw_teams_service
@@ -152,10 +1666,13 @@ if __name__ == "__main__":
     draw_teams_service = DrawTeamsService(players, 2, amount_of_draws=5)
     teams = draw_teams_service.draw_teams()
 
+    # Drafts hold players; the combo scoring works on their indices in the sorted roster
+    indices = {player.player_id: i for i, player in enumerate(draw_teams_service.players)}
+
     print("Team combinations (5 players with substitutions):")
     for i, (team_a, team_b) in enumerate(teams):
-        team_a_score = draw_teams_service._get_effective_team_score(team_a, team_b)
-        team_b_score = draw_teams_service._get_effective_team_score(team_b, team_a)
+        team_a_score = draw_teams_service._get_effective_combo_score(tuple(indices[p.player_id] for p in team_a))
+        team_b_score = draw_teams_service._get_effective_combo_score(tuple(indices[p.player_id] for p in team_b))
         score_diff = abs(team_a_score - team_b_score)
         
         print(f"Combination {i+1}:")
@@ -1,9 +1,16 @@
-from typing import Optional
-from app.models import Match, ScoreHistory
+import asyncio
+from typing import AsyncIterator, Optional
+from sqlalchemy import case, distinct, func
+from sqlalchemy.orm import aliased, selectinload
+from app.models import Match, ScoreHistory, Team, TeamPlayer
 
 from app.entities import MatchData, PlayerData, MatchDetailData, DraftData
 from app.models.player import Player
 from app.schemas.match_schemas import TeamUpdate
+from app.services.draw_cache import draw_cache, pair_history_cache
+
+# How many of the squad's latest matches count towards repeated teammates in a draw
+RECENT_MATCHES = 10
 
 
 class MatchService:
@@ -11,21 +18,16 @@ class MatchService:
         self.session = session
 
     def match_to_data(self, match: Match) -> MatchData:
-        from app.services import TeamService
-        team_service = TeamService(self.session)
-        
         # Get teams safely
         teams = match.teams
 
         # Check if teams exist before accessing them
         if len(teams) >= 2:
-            team_a = team_service.get_team(teams[0].team_id)
-            team_b = team_service.get_team(teams[1].team_id)
             # Check if score is actually set (not default 0-0)
-            if team_a.score is None or team_b.score is None:
+            if teams[0].score is None or teams[1].score is None:
                 score = None
             else:
-                score = (team_a.score, team_b.score)
+                score = (teams[0].score, teams[1].score)
         else:
             # Return None if teams don't exist
             score = None
@@ -36,7 +38,7 @@ class MatchService:
             created_at=match.created_at,
             score=score,
         )
-    
+
     def match_to_detail_data(self, match: Match) -> MatchDetailData:
         from app.services import TeamService
         team_service = TeamService(self.session)
@@ -58,7 +60,12 @@ class MatchService:
         )
 
     def get_matches(self, squad_id: str) -> list[MatchData]:
-        matches = self.session.query(Match).filter(Match.squad_id == squad_id).all()
+        matches = (
+            self.session.query(Match)
+            .options(selectinload(Match.teams))
+            .filter(Match.squad_id == squad_id)
+            .all()
+        )
 
         match_data = []
         for match in matches:
@@ -88,9 +95,14 @@ class MatchService:
                 delta=0.0
             )
             self.session.add(score_history)
-        
+
+        from app.services.stat_service import StatService
+        StatService(self.session).apply_match(match.match_id)
         self.session.commit()
 
+        # Cached drafts show how many matches each player has played
+        self._invalidate_draws(squad_id, [player.player_id for player in all_players])
+
         return self.get_match_detail(match.match_id)
 
     def get_match(self, match_id: str) -> MatchData | None:
@@ -111,31 +123,270 @@ class MatchService:
 
         return self.match_to_detail_data(match)
 
-    def draw_teams(self, players_ids: list[str]) -> list[DraftData]:
+    def get_match_details(self, match_ids: list[str]) -> list[MatchDetailData]:
+        """Match details for many matches, in the order of `match_ids`, from a fixed number of queries.
+
+        Teams and their players are loaded with selectinload and matches played
+        are counted in one query, so the cost does not grow with the number of
+        matches or players. Unknown ids are skipped.
+        """
+        if not match_ids:
+            return []
+        from app.services import PlayerService, TeamService
+        player_service = PlayerService(self.session)
+        team_service = TeamService(self.session)
+
+        matches = (
+            self.session.query(Match)
+            .options(selectinload(Match.teams).selectinload(Team.players))
+            .filter(Match.match_id.in_(match_ids))
+            .all()
+        )
+        matches_by_id = {match.match_id: match for match in matches}
+        matches_played = player_service.get_matches_played(
+            list({player.player_id for match in matches for team in match.teams for player in team.players}))
+
+        details = []
+        for match_id in match_ids:
+            match = matches_by_id.get(match_id)
+            if match is None:
+                continue
+            if len(match.teams) < 2:
+                raise ValueError("Team not found")
+            team_a, team_b = (
+                team_service.team_to_detail_data(team, [
+                    player_service.player_to_data(player, matches_played.get(player.player_id, 0))
+                    for player in team.players
+                ])
+                for team in match.teams[:2]
+            )
+            details.append(MatchDetailData(
+                squad_id=match.squad_id,
+                match_id=str(match.match_id),
+                created_at=match.created_at,
+                team_a=team_a,
+                team_b=team_b
+            ))
+        return details
+
+    def draw_teams(self, players_ids: list[str], amount_of_teams: int = 2,
+                   time_budget_ms: Optional[int] = None, max_gap: Optional[float] = None,
+                   friends: list[tuple[str, str]] = (), enemies: list[tuple[str, str]] = (),
+                   one_goalie_per_team: bool = False, min_distance: int = 0,
+                   allow_substitutions: bool = True, position_weight: float = 0.0,
+                   repeat_weight: float = 0.0, recent_matches: int = RECENT_MATCHES,
+                   two_teams_budget_ms: Optional[int] = None) -> list[DraftData]:
+        cached, draw_teams_service, key = self._prepare_draw(
+            players_ids, amount_of_teams, time_budget_ms=time_budget_ms, max_gap=max_gap,
+            friends=friends, enemies=enemies, one_goalie_per_team=one_goalie_per_team,
+            min_distance=min_distance, allow_substitutions=allow_substitutions, position_weight=position_weight,
+            repeat_weight=repeat_weight, recent_matches=recent_matches, two_teams_budget_ms=two_teams_budget_ms)
+        if draw_teams_service is None:
+            return cached
+        return self._store_draw(key, draw_teams_service, draw_teams_service.draw_teams())
+
+    async def draw_teams_async(self, players_ids: list[str], amount_of_teams: int = 2, **options) -> list[DraftData]:
+        """`draw_teams` with the search itself on the draw process pool; takes the same options"""
+        cached, draw_teams_service, key = self._prepare_draw(players_ids, amount_of_teams, **options)
+        if draw_teams_service is None:
+            return cached
+        return self._store_draw(key, draw_teams_service, await draw_teams_service.draw_teams_async())
+
+    def draw_teams_stream(self, players_ids: list[str], amount_of_teams: int = 2, **options) -> AsyncIterator:
+        """`draw_teams` as it runs: yields DrawProgress events, then (drafts, report).
+
+        The roster is loaded here, so the returned iterator no longer needs the
+        session. The search runs on a thread and hands its progress back to
+        the event loop; a cached draw yields only its drafts, with no report.
+        """
+        cached, draw_teams_service, key = self._prepare_draw(players_ids, amount_of_teams, **options)
+
+        async def events():
+            if draw_teams_service is None:
+                yield cached, None
+                return
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue = asyncio.Queue()
+            finished = object()
+            draw_teams_service.progress = lambda progress: loop.call_soon_threadsafe(queue.put_nowait, progress)
+            search = loop.run_in_executor(None, draw_teams_service.draw_teams)
+            search.add_done_callback(lambda _: queue.put_nowait(finished))
+            while (event := await queue.get()) is not finished:
+                yield event
+            yield self._store_draw(key, draw_teams_service, search.result()), draw_teams_service.report
+
+        return events()
+
+    def _prepare_draw(self, players_ids: list[str], amount_of_teams: int,
+                      time_budget_ms: Optional[int] = None, max_gap: Optional[float] = None,
+                      friends: list[tuple[str, str]] = (), enemies: list[tuple[str, str]] = (),
+                      one_goalie_per_team: bool = False, min_distance: int = 0,
+                      allow_substitutions: bool = True, position_weight: float = 0.0,
+                      repeat_weight: float = 0.0, recent_matches: int = RECENT_MATCHES,
+                      two_teams_budget_ms: Optional[int] = None):
+        """Cached drafts for the draw, or the service that still has to run it, and the cache key"""
         # Check if players list is empty
         if not players_ids:
-            return []
-        
+            return [], None, None
+
+        # One query for the whole roster; its scores are part of the cache key
+        orm_players = self.session.query(Player).filter(Player.player_id.in_(players_ids)).all()
+        squad_id = orm_players[0].squad_id if orm_players else None
+        # Draws penalising repeats depend on the squad's match history as well
+        history = (recent_matches, pair_history_cache.version(squad_id)) if repeat_weight and squad_id else None
+        key = draw_cache.make_key(
+            {player.player_id: player.score for player in orm_players},
+            amount_of_teams,
+            allow_substitutions,
+            time_budget_ms=time_budget_ms,
+            two_teams_budget_ms=two_teams_budget_ms,
+            max_gap=max_gap,
+            friends=tuple(sorted(tuple(sorted(pair)) for pair in friends)),
+            enemies=tuple(sorted(tuple(sorted(pair)) for pair in enemies)),
+            one_goalie_per_team=one_goalie_per_team,
+            min_distance=min_distance,
+            position_weight=position_weight,
+            repeat_weight=repeat_weight,
+            history=history,
+        )
+        cached = draw_cache.get(key)
+        if cached is not None:
+            return cached, None, key
+
         from app.services import PlayerService
         player_service = PlayerService(self.session)
-        
-        players = []
-        for player_id in players_ids:
-            player = player_service.get_player(player_id)
-            if player:
-                players.append(player)
+        players = player_service.players_to_data(orm_players)
             
         players.sort(key=lambda x: x._score, reverse=True)
-        from app.services import DrawTeamsService
-        draw_teams_service = DrawTeamsService(players, 2)
-        drafts = draw_teams_service.draw_teams()
+        pair_history = self.get_pair_history(squad_id, recent_matches) if history else None
+        from app.services.draw_teams_service import DrawTeamsService, Relation, RelationType
+        players_by_id = {player.player_id: player for player in players}
+        relations = [
+            Relation(players_by_id[first], players_by_id[second], relation)
+            for pairs, relation in ((friends, RelationType.FRIEND), (enemies, RelationType.ENEMY))
+            for first, second in pairs
+            if first in players_by_id and second in players_by_id
+        ]
+        draw_teams_service = DrawTeamsService(players, amount_of_teams, allow_substitutions=allow_substitutions,
+                                              time_budget_ms=time_budget_ms, max_gap=max_gap,
+                                              relations=relations, one_goalie_per_team=one_goalie_per_team,
+                                              min_distance=min_distance, position_weight=position_weight,
+                                              pair_history=pair_history, repeat_weight=repeat_weight,
+                                              two_teams_budget_ms=two_teams_budget_ms)
+        return None, draw_teams_service, key
+
+    def _store_draw(self, key, draw_teams_service, drafts) -> list[DraftData]:
+        draft_data = self.drafts_to_data(drafts, draw_teams_service.report)
+        draw_cache.put(key, draft_data, [player.player_id for player in draw_teams_service.players])
+        return draft_data
+
+    def redraw_teams(self, previous: list[list[list[str]]], added: list[str] = (), removed: list[str] = (),
+                     **options) -> list[DraftData]:
+        """Re-draw earlier drafts (teams of player ids) after players were added or removed.
+
+        Takes `time_budget_ms`, `two_teams_budget_ms`, `max_gap`, the relations and the weights of `draw_teams`.
+        """
+        draw_teams_service = self._prepare_redraw(previous, added, removed, **options)
+        if draw_teams_service is None:
+            return []
+        drafts = draw_teams_service.redraw_teams(previous)
+        return self.drafts_to_data(drafts, draw_teams_service.report)
+
+    async def redraw_teams_async(self, previous: list[list[list[str]]], added: list[str] = (), removed: list[str] = (),
+                                 **options) -> list[DraftData]:
+        """`redraw_teams` with the search off the event loop; takes the same options"""
+        draw_teams_service = self._prepare_redraw(previous, added, removed, **options)
+        if draw_teams_service is None:
+            return []
+        drafts = await draw_teams_service.redraw_teams_async(previous)
+        return self.drafts_to_data(drafts, draw_teams_service.report)
+
+    def _prepare_redraw(self, previous: list[list[list[str]]], added: list[str] = (), removed: list[str] = (),
+                        time_budget_ms: Optional[int] = None, max_gap: Optional[float] = None,
+                        friends: list[tuple[str, str]] = (), enemies: list[tuple[str, str]] = (),
+                        one_goalie_per_team: bool = False, min_distance: int = 0,
+                        position_weight: float = 0.0, repeat_weight: float = 0.0,
+                        recent_matches: int = RECENT_MATCHES, two_teams_budget_ms: Optional[int] = None):
+        """The service for a re-draw of `previous`, or None when no player is left"""
+        if not previous:
+            return None
+        players_ids = {player_id for team in previous[0] for player_id in team}
+        players_ids = (players_ids | set(added)) - set(removed)
+        if not players_ids:
+            return None
 
+        from app.services import PlayerService
+        player_service = PlayerService(self.session)
+        orm_players = self.session.query(Player).filter(Player.player_id.in_(players_ids)).all()
+        players = player_service.players_to_data(orm_players)
+        pair_history = None
+        if repeat_weight and orm_players:
+            pair_history = self.get_pair_history(orm_players[0].squad_id, recent_matches)
+
+        from app.services.draw_teams_service import DrawTeamsService, Relation, RelationType
+        players_by_id = {player.player_id: player for player in players}
+        relations = [
+            Relation(players_by_id[first], players_by_id[second], relation)
+            for pairs, relation in ((friends, RelationType.FRIEND), (enemies, RelationType.ENEMY))
+            for first, second in pairs
+            if first in players_by_id and second in players_by_id
+        ]
+        return DrawTeamsService(players, len(previous[0]), time_budget_ms=time_budget_ms, max_gap=max_gap,
+                                relations=relations, one_goalie_per_team=one_goalie_per_team,
+                                min_distance=min_distance, position_weight=position_weight,
+                                pair_history=pair_history, repeat_weight=repeat_weight,
+                                two_teams_budget_ms=two_teams_budget_ms)
+
+    def get_pair_history(self, squad_id: str, last_matches: int = RECENT_MATCHES) -> dict[tuple[str, str], int]:
+        """How many of the squad's last matches each pair of players played in the same team.
+
+        Counted by the database in one query, a self-join of team_players on
+        the team, and cached per squad until one of its matches changes.
+        Pairs are keyed with the smaller player id first.
+        """
+        pairs = pair_history_cache.get(squad_id, last_matches)
+        if pairs is not None:
+            return pairs
+
+        # A derived table rather than IN (... LIMIT ...), which MySQL does not support
+        recent = (
+            self.session.query(Match.match_id)
+            .filter(Match.squad_id == squad_id)
+            .order_by(Match.created_at.desc())
+            .limit(last_matches)
+            .subquery()
+        )
+        first, second = aliased(TeamPlayer), aliased(TeamPlayer)
+        rows = (
+            self.session.query(first.player_id, second.player_id, func.count())
+            .join(recent, recent.c.match_id == first.match_id)
+            .join(second, (second.team_id == first.team_id) & (second.player_id > first.player_id))
+            .group_by(first.player_id, second.player_id)
+            .all()
+        )
+        pairs = {(first_id, second_id): matches for first_id, second_id, matches in rows}
+        pair_history_cache.put(squad_id, last_matches, pairs)
+        return pairs
+
+    def _invalidate_draws(self, squad_id: str, player_ids):
+        """Forget cached draws and pair counts that a change to a match of these players makes stale"""
+        pair_history_cache.invalidate_squad(squad_id)
+        for player_id in player_ids:
+            draw_cache.invalidate_player(player_id)
+
+    def drafts_to_data(self, drafts: list[tuple[list[PlayerData], ...]], report) -> list[DraftData]:
         draft_data = []
 
-        for draft in drafts:
-            team_a, team_b = draft
-            draft_data.append(DraftData(team_a=team_a, team_b=team_b))
-            
+        for i, draft in enumerate(drafts):
+            team_a, team_b = draft[0], draft[1]
+            draft_data.append(DraftData(
+                team_a=team_a,
+                team_b=team_b,
+                teams=list(draft),
+                imbalance=report.imbalances[i],
+                lower_bound=report.lower_bound
+            ))
+
         return draft_data
     
     def validate_no_older_matches_without_result(self, squad_id: str, current_match_id: str) -> bool:
@@ -148,21 +399,17 @@ class MatchService:
         if not current_match:
             return False
         
-        # Find all older matches in the same squad
-        older_matches = self.session.query(Match).filter(
-            Match.squad_id == squad_id,
-            Match.created_at < current_match.created_at
-        ).all()
-        
-        # Check if any older match has null score in any team
-        for match in older_matches:
-            teams = match.teams
-            if len(teams) >= 2:
-                # If either team has null score, validation fails
-                if teams[0].score is None or teams[1].score is None:
-                    return False
-        
-        return True
+        # One query over the teams of all older matches in the same squad:
+        # a match with two teams fails validation if either has no score
+        unscored = (
+            self.session.query(Team.match_id)
+            .join(Match, Match.match_id == Team.match_id)
+            .filter(Match.squad_id == squad_id, Match.created_at < current_match.created_at)
+            .group_by(Team.match_id)
+            .having(func.count() >= 2, func.sum(case((Team.score.is_(None), 1), else_=0)) > 0)
+            .first()
+        )
+        return unscored is None
 
     def update_match(self, match_id: str, 
                      team_a: TeamUpdate, 
@@ -181,35 +428,54 @@ class MatchService:
                 raise ValueError("Cannot update match result: there are older matches without results")
 
         from app.services import TeamService, PlayerService
+        from app.services.stat_service import StatService
         team_service = TeamService(self.session)
         player_service = PlayerService(self.session)
+        stat_service = StatService(self.session)
+
+        previous_players = {player.player_id for team in match.teams for player in team.players}
 
         def update_team(team_data):
             if not team_data:
                 return
-            team_id = team_data.team_id
+            # Changed here rather than through TeamService's update methods, which commit
+            team = next((team for team in match.teams if team.team_id == team_data.team_id), None)
+            if not team:
+                return
             if team_data.players is not None:
                 player_objs = [player_service.get_player(pid) for pid in team_data.players]
-                team_service.update_team_players(team_id, player_objs)
+                team_service.replace_team_players(team, player_objs)
             if team_data.score is not None:
-                team_service.update_team_score(team_id, team_data.score)
-
-        update_team(team_a)
-        update_team(team_b)
-
-        score = (team_a.score, team_b.score)
-
-
-        if score is not None and score[0] is not None and score[1] is not None:
-            self.update_score_history(match_id, team_a.team_id, team_b.team_id, score[0], score[1])
-
-        self.session.commit()
-        return self.get_match_detail(match_id)
+                team.score = team_data.score
+
+        # Stats rows take the match out here and back in once it is updated. Nothing is
+        # committed in between, so a failure leaves neither half in the database
+        try:
+            changed_players = stat_service.revert_match(match_id)
+            update_team(team_a)
+            update_team(team_b)
+
+            score = (team_a.score, team_b.score)
+
+
+            if score is not None and score[0] is not None and score[1] is not None:
+                self.update_score_history(match_id, team_a.team_id, team_b.team_id, score[0], score[1])
+
+            changed_players |= stat_service.apply_match(match_id)
+            stat_service.refresh_records(changed_players)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        # Scores and teams of these players may have changed
+        self._invalidate_draws(match.squad_id, previous_players | {player.player_id for team in match.teams for player in team.players})
+        return self.get_match_details([match_id])[0]
     
     def update_score_history(self, match_id: str, team_a_id: str, team_b_id: str, team_a_score: int, team_b_score: int) -> MatchDetailData | None:
         """
         Update score history and player rankings for both teams in a match.
-        Assumes team scores are already set in the database.
+        Assumes team scores are already set in the database. Nothing is
+        committed; the caller commits every player's change at once.
         """
         match = self.session.query(Match).filter(Match.match_id == match_id).first()
         if not match:
@@ -223,27 +489,28 @@ class MatchService:
         if not team_a or not team_b:
             raise ValueError("Team not found")
 
-        # For each player, update score history and player score
+        players = team_a.players + team_b.players
+        # Match index of each player: how many of their matches are older than this one
+        earlier_matches = dict(
+            self.session.query(TeamPlayer.player_id, func.count(distinct(TeamPlayer.match_id)))
+            .join(Match, Match.match_id == TeamPlayer.match_id)
+            .filter(TeamPlayer.player_id.in_([player.player_id for player in players]), Match.created_at < match.created_at)
+            .group_by(TeamPlayer.player_id)
+            .all()
+        )
+
+        deltas = {}
         for team, score, opp_score in [
             (team_a, team_a_score, team_b_score),
             (team_b, team_b_score, team_a_score)
         ]:
             for player in team.players:
-                # Get match index for this player (count of previous matches)
-                player_matches = sorted(player.matches, key=lambda x: x.created_at)
-                match_index = next((i for i, m in enumerate(player_matches) if m.match_id == match_id), 0)
-                factor = match_index * 0.2 + 1
-                delta = (score - opp_score) / factor
-                # Get previous score from score history
-                score_history = self.session.query(ScoreHistory).filter(
-                    ScoreHistory.player_id == player.player_id,
-                    ScoreHistory.match_id == match_id
-                ).first()
-                prev_score = score_history.previous_score if score_history else player.score
-                new_score = prev_score + delta
-                player_service.update_player_score(player.player_id, new_score, match_id)
+                factor = earlier_matches.get(player.player_id, 0) * 0.2 + 1
+                deltas[player.player_id] = (score - opp_score) / factor
+        # Every player's history entry and score are written with bulk statements
+        player_service.apply_match_deltas(players, match_id, deltas)
 
-        return self.match_to_detail_data(match)
+        return self.get_match_details([match_id])[0]
     
     def update_match_players(self, match_id: str, team_a_players: list[str], team_b_players: list[str]) -> MatchDetailData | None:
         match = self.session.query(Match).filter(Match.match_id == match_id).first()
@@ -267,7 +534,9 @@ class MatchService:
                 team_b_players_data.append(player)
         
         from app.services import TeamService
+        from app.services.stat_service import StatService
         team_service = TeamService(self.session)
+        stat_service = StatService(self.session)
         
         # Get current players in the match
         current_players = set()
@@ -286,35 +555,45 @@ class MatchService:
         for player_id in team_b_players:
             new_players.add(player_id)
         
-        # Remove score history for players who are no longer in the match
-        removed_players = current_players - new_players
-        for player_id in removed_players:
-            score_history = self.session.query(ScoreHistory).filter(
-                ScoreHistory.player_id == player_id,
-                ScoreHistory.match_id == match_id
-            ).first()
-            if score_history:
-                self.session.delete(score_history)
-        
-        # Create score history for new players
-        added_players = new_players - current_players
-        for player_id in added_players:
-            player_data = next((p for p in all_new_players if p.player_id == player_id), None)
-            if player_data:
-                score_history = ScoreHistory(
-                    match_id=match_id,
-                    player_id=player_id,
-                    previous_score=player_data.score,
-                    new_score=player_data.score,
-                    delta=0.0
-                )
-                self.session.add(score_history)
-        
-        # Update team players
-        team_a = team_service.update_team_players(match.teams[0].team_id, team_a_players_data)
-        team_b = team_service.update_team_players(match.teams[1].team_id, team_b_players_data)
+        # Stats rows take the match out and back in around the change, committed at once
+        try:
+            changed_players = stat_service.revert_match(match_id)
 
-        self.session.commit()
+            # Remove score history for players who are no longer in the match
+            removed_players = current_players - new_players
+            for player_id in removed_players:
+                score_history = self.session.query(ScoreHistory).filter(
+                    ScoreHistory.player_id == player_id,
+                    ScoreHistory.match_id == match_id
+                ).first()
+                if score_history:
+                    self.session.delete(score_history)
+
+            # Create score history for new players
+            added_players = new_players - current_players
+            for player_id in added_players:
+                player_data = next((p for p in all_new_players if p.player_id == player_id), None)
+                if player_data:
+                    score_history = ScoreHistory(
+                        match_id=match_id,
+                        player_id=player_id,
+                        previous_score=player_data.score,
+                        new_score=player_data.score,
+                        delta=0.0
+                    )
+                    self.session.add(score_history)
+
+            # Update team players
+            team_service.replace_team_players(match.teams[0], team_a_players_data)
+            team_service.replace_team_players(match.teams[1], team_b_players_data)
+
+            changed_players |= stat_service.apply_match(match_id)
+            stat_service.refresh_records(changed_players)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        self._invalidate_draws(match.squad_id, current_players | new_players)
 
         return self.match_to_detail_data(match)
     
@@ -325,20 +604,34 @@ class MatchService:
             return False
         
         # Get all players who participated in this match before deleting it
-        players_to_recalculate = set()
+        match_players = set()
         for team in match.teams:
             for player in team.players:
-                players_to_recalculate.add(player.player_id)
+                match_players.add(player.player_id)
             
-        # Delete the match (cascade should handle teams and score history)
-        self.session.delete(match)
-        self.session.commit()
-        
-        # Recalculate scores for all players who were in the deleted match
+        from app.services.stat_service import StatService
         from app.services import PlayerService
-        player_service = PlayerService(self.session)
-        for player_id in players_to_recalculate:
-            player_service.recalculate_and_update_score(player_id)
+        stat_service = StatService(self.session)
+        squad_id = match.squad_id
+
+        # The delete, the stats revert and the score replay commit together, so a
+        # failure leaves the match and the stats and scores built on it in place
+        try:
+            changed_players = stat_service.revert_match(match_id)
+
+            # Delete the match (cascade should handle teams and score history)
+            self.session.delete(match)
+            self.session.flush()
+            stat_service.refresh_records(changed_players)
+
+            # Later matches of these players now have a lower match index, so
+            # their deltas change too: replay the squad instead of re-summing
+            changed_scores = PlayerService(self.session).replay_squad_scores(squad_id)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        self._invalidate_draws(squad_id, match_players | changed_scores)
         
         return True
         
\ No newline at end of file
@@ -1,15 +1,20 @@
-from app.models import Player, Match, ScoreHistory
+from sqlalchemy import bindparam, case, distinct, func, select, update
+from app.models import Player, Match, ScoreHistory, Team, TeamPlayer
 from app.entities import PlayerData, PlayerDetailData, MatchData
 from app.constants import Position
 from app.schemas.player_schemas import PlayerResponse, PlayerListResponse
 from app.services.match_service import MatchService
 from app.services.stat_service import StatService
+from app.services.draw_cache import draw_cache
+from app.services.score_replay import ReplayEntry, ReplayMatch, ScoreReplay
 
 class PlayerService:
     def __init__(self, session):
         self.session = session
 
-    def player_to_data(self, player: Player) -> PlayerData:
+    def player_to_data(self, player: Player, matches_played: int | None = None) -> PlayerData:
+        if matches_played is None:
+            matches_played = len(player.matches)
         return PlayerData(
             squad_id=player.squad_id,
             player_id=player.player_id,
@@ -17,9 +22,26 @@ class PlayerService:
             position=Position(player.position) if player.position else Position.NONE,
             base_score=player.base_score,
             _score=round(player.score, 2),
-            matches_played=len(player.matches),
+            matches_played=matches_played,
             created_at=player.created_at
         )
+
+    def players_to_data(self, players: list[Player]) -> list[PlayerData]:
+        """Convert many players at once, counting their matches in one query instead of loading them per player"""
+        counts = self.get_matches_played([player.player_id for player in players])
+        return [self.player_to_data(player, counts.get(player.player_id, 0)) for player in players]
+
+    def get_matches_played(self, player_ids: list[str]) -> dict[str, int]:
+        """Number of matches each player took part in, by player id; players without matches are left out"""
+        if not player_ids:
+            return {}
+        rows = (
+            self.session.query(TeamPlayer.player_id, func.count(distinct(TeamPlayer.match_id)))
+            .filter(TeamPlayer.player_id.in_(player_ids))
+            .group_by(TeamPlayer.player_id)
+            .all()
+        )
+        return dict(rows)
     
     def player_to_detail_data(self, player: Player) -> PlayerDetailData:
         match_service = MatchService(self.session)
@@ -43,9 +65,7 @@ class PlayerService:
     def get_players(self, squad_id: str) -> list[PlayerData]:
         """Get all players for a squad and return as list of PlayerData"""
         players = self.session.query(Player).filter(Player.squad_id == squad_id).all()
-        player_data_list = [self.player_to_data(player) for player in players]
-        
-        return player_data_list
+        return self.players_to_data(players)
 
     def get_player(self, player_id: str) -> PlayerData | None:
         player = self.session.query(Player).filter(Player.player_id == player_id).first()
@@ -96,6 +116,7 @@ class PlayerService:
         if player:
             self.session.delete(player)
             self.session.commit()
+            draw_cache.invalidate_player(player_id)
 
     def update_player_name(self, player_id: str, name: str) -> PlayerData | None:
         player = self.session.query(Player).filter(Player.player_id == player_id).first()
@@ -103,6 +124,7 @@ class PlayerService:
             return None
         player.name = name
         self.session.commit()
+        draw_cache.invalidate_player(player_id)
         return self.get_player(player_id)
     
     def update_player_base_score(self, player_id: str, base_score: int) -> PlayerData | None:
@@ -110,9 +132,11 @@ class PlayerService:
         if not player:
             return None
         player.base_score = base_score
+        # Every previous/new score in the player's history starts from the base score
+        changed_players = self.replay_squad_scores(player.squad_id)
         self.session.commit()
-
-        self.recalculate_and_update_score(player_id)
+        for changed_player_id in changed_players | {player_id}:
+            draw_cache.invalidate_player(changed_player_id)
         
         return self.get_player(player_id)
     
@@ -156,6 +180,7 @@ class PlayerService:
             return None
         player.position = position.value if hasattr(position, "value") else position
         self.session.commit()
+        draw_cache.invalidate_player(player_id)
         return self.get_player(player_id)
     
     def recalculate_and_update_score(self, player_id: str) -> PlayerData | None:
@@ -185,10 +210,72 @@ class PlayerService:
             #format score to 2 decimal places
             player.score = round(player.score, 2)
             self.session.commit()
+            draw_cache.invalidate_player(player_id)
 
         # Return updated PlayerData
         return self.player_to_data(player)
 
+    def apply_match_deltas(self, players: list[Player], match_id: str, deltas: dict[str, float]) -> set[str]:
+        """Set the change of each player's score in a match, like `update_player_score`, without committing.
+
+        One grouped query returns each player's total of stored deltas and
+        their entry for this match, if any. The entries and scores are then
+        written with bulk statements, so the round trips do not grow with the
+        number of players or matches. Returns the players whose score changed.
+        """
+        history = {}
+        if players:
+            is_match = ScoreHistory.match_id == match_id
+            rows = (
+                self.session.query(
+                    ScoreHistory.player_id,
+                    func.sum(ScoreHistory.delta),
+                    func.max(case((is_match, ScoreHistory.score_history_id))),
+                    func.max(case((is_match, ScoreHistory.previous_score))),
+                    func.max(case((is_match, ScoreHistory.delta))),
+                )
+                .filter(ScoreHistory.player_id.in_([player.player_id for player in players]))
+                .group_by(ScoreHistory.player_id)
+                .all()
+            )
+            history = {player_id: values for player_id, *values in rows}
+
+        history_updates, history_inserts, score_updates = [], [], []
+        for player in players:
+            total, entry_id, previous_score, old_delta = history.get(player.player_id, (0.0, None, None, None))
+            delta = deltas[player.player_id]
+            if entry_id is None:
+                new_score = player.score + delta
+                history_inserts.append(dict(
+                    player_id=player.player_id,
+                    match_id=match_id,
+                    previous_score=round(player.score, 2),
+                    new_score=round(new_score, 2),
+                    delta=round(new_score - player.score, 2)
+                ))
+                total += history_inserts[-1]["delta"]
+            else:
+                new_score = previous_score + delta
+                history_updates.append(dict(
+                    score_history_id=entry_id,
+                    new_score=round(new_score, 2),
+                    delta=round(new_score - previous_score, 2)
+                ))
+                total += history_updates[-1]["delta"] - old_delta
+
+            # Clamp score to [0, 100]
+            score = round(max(0, min(100, player.base_score + total)), 2)
+            if player.score != score:
+                score_updates.append(dict(player_id=player.player_id, score=score))
+
+        self.session.bulk_update_mappings(ScoreHistory, history_updates)
+        self.session.bulk_insert_mappings(ScoreHistory, history_inserts)
+        self.session.bulk_update_mappings(Player, score_updates)
+        # Bulk statements skip the session, so loaded players would keep their old score
+        for player in players:
+            self.session.expire(player, ["score"])
+        return {update["player_id"] for update in score_updates}
+
     def calculate_score_delta(self, player: Player, match: Match, match_index: int) -> float:
         # Find the match in which the player played
         player_team = next((team for team in match.teams if any(p.player_id == player.player_id for p in team.players)), None)
@@ -203,5 +290,83 @@ class PlayerService:
         # Calculate how much the player gained/lost in this match
         return (player_team.score - opponent_team.score) / factor
 
-    
+    def replay_squad_scores(self, squad_id: str) -> set[str]:
+        """Recompute a squad's whole score history and scores from its matches, without committing.
+
+        Unlike `recalculate_and_update_score`, which re-sums stored deltas,
+        this replays every match in order (see ScoreReplay), so the match
+        index factors stay right after an older match is deleted. The squad
+        is read with four queries and only rows that changed are written,
+        with bulk statements. Returns the players whose score changed.
+        """
+        self.session.flush()
+        players = (
+            self.session.query(Player.player_id, Player.base_score, Player.score)
+            .filter(Player.squad_id == squad_id)
+            .all()
+        )
+        matches = {
+            match_id: ReplayMatch(match_id, created_at)
+            for match_id, created_at in self.session.query(Match.match_id, Match.created_at).filter(Match.squad_id == squad_id)
+        }
+        # The bulk of the rows come from the next two queries, so they run on the
+        # connection, skipping the ORM, and leave out every datetime the replay does not need
+        connection = self.session.connection()
+        rows = connection.execute(
+            select(Team.match_id, Team.team_id, Team.score, TeamPlayer.player_id)
+            .outerjoin(TeamPlayer, TeamPlayer.team_id == Team.team_id)
+            .where(Team.squad_id == squad_id)
+            .order_by(Team.created_at, Team.team_id)
+        )
+        entries = connection.execute(
+            select(ScoreHistory.score_history_id, ScoreHistory.player_id, ScoreHistory.match_id,
+                   case((ScoreHistory.match_id.is_(None), ScoreHistory.created_at)),
+                   ScoreHistory.previous_score, ScoreHistory.new_score, ScoreHistory.delta)
+            .join(Player, Player.player_id == ScoreHistory.player_id)
+            .where(Player.squad_id == squad_id)
+        )
+
+        teams: dict[str, list[str]] = {}
+        for match_id, team_id, score, player_id in rows:
+            if team_id not in teams and match_id in matches:
+                teams[team_id] = []
+                matches[match_id].teams.append((teams[team_id], score))
+            if player_id is not None and team_id in teams:
+                teams[team_id].append(player_id)
 
+        replay = ScoreReplay(
+            {player.player_id: player.base_score for player in players},
+            list(matches.values()),
+            [ReplayEntry(*entry) for entry in entries],
+        ).run()
+
+        if replay.changed:
+            # A whole squad can change at once; one executemany skips the ORM's per-row bookkeeping
+            connection.execute(
+                update(ScoreHistory.__table__)
+                .where(ScoreHistory.score_history_id == bindparam("entry_id"))
+                .values(previous_score=bindparam("entry_previous_score"), new_score=bindparam("entry_new_score"),
+                        delta=bindparam("entry_delta")),
+                [
+                    dict(entry_id=entry.score_history_id, entry_previous_score=entry.previous_score,
+                         entry_new_score=entry.new_score, entry_delta=entry.delta)
+                    for entry in replay.changed
+                ]
+            )
+        self.session.bulk_insert_mappings(ScoreHistory, [
+            dict(player_id=entry.player_id, match_id=entry.match_id, created_at=entry.created_at,
+                 previous_score=entry.previous_score, new_score=entry.new_score, delta=entry.delta)
+            for entry in replay.added
+        ])
+        if replay.removed:
+            self.session.query(ScoreHistory).filter(
+                ScoreHistory.score_history_id.in_(replay.removed)
+            ).delete(synchronize_session=False)
+        score_updates = [
+            dict(player_id=player.player_id, score=replay.scores[player.player_id])
+            for player in players if player.score != replay.scores[player.player_id]
+        ]
+        self.session.bulk_update_mappings(Player, score_updates)
+        # Bulk statements skip the session, so loaded players and entries would keep their old values
+        self.session.expire_all()
+        return {score_update["player_id"] for score_update in score_updates}
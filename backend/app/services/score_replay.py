@@ -0,0 +1,149 @@
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import groupby
+from typing import Optional
+
+
+@dataclass(slots=True)
+class ReplayMatch:
+    """A match as the replay sees it: when it was created and each team's players and goals"""
+    match_id: str
+    created_at: datetime
+    teams: list[tuple[list[str], Optional[int]]] = field(default_factory=list)
+
+    @property
+    def scored(self) -> bool:
+        return len(self.teams) == 2 and all(score is not None for _, score in self.teams)
+
+
+@dataclass(slots=True)
+class ReplayEntry:
+    """One score history entry. `created_at` is only read for manual entries, which have no match;
+    `score_history_id` is None for entries the replay adds."""
+    score_history_id: Optional[str]
+    player_id: str
+    match_id: Optional[str]
+    created_at: Optional[datetime]
+    previous_score: float
+    new_score: Optional[float]
+    delta: float
+
+
+class ScoreReplay:
+    """Recomputes a squad's score history by replaying its matches in order.
+
+    Matches are streamed once, oldest first, keeping each player's running
+    score and number of earlier matches, so every scored match gets the
+    delta `update_score_history` would give it today:
+    (own - opponent goals) / (match_index * 0.2 + 1). Manual entries, which
+    have no match, keep their delta and are replayed where they were
+    created. So do entries of matches without a result.
+
+    Nothing touches the database: `run` fills `changed` with the entries whose
+    values moved, `added` with entries missing for a match the player is in,
+    `removed` with ids of entries whose match or player is gone, and `scores`
+    with every player's final score, clamped to [0, 100].
+    """
+
+    def __init__(self, base_scores: dict[str, float], matches: list[ReplayMatch], entries: list[ReplayEntry]):
+        self.base_scores = base_scores
+        self.matches = sorted(matches, key=lambda match: (match.created_at, match.match_id))
+        self.entries = entries
+        self.changed: list[ReplayEntry] = []
+        self.added: list[ReplayEntry] = []
+        self.removed: list[str] = []
+        self.scores: dict[str, float] = {}
+
+    def run(self) -> "ScoreReplay":
+        by_match: dict[tuple[str, str], ReplayEntry] = {}
+        manual: dict[str, list[ReplayEntry]] = {}
+        for entry in self.entries:
+            if entry.match_id is None:
+                manual.setdefault(entry.player_id, []).append(entry)
+            elif (entry.player_id, entry.match_id) in by_match:
+                self.removed.append(entry.score_history_id)
+            else:
+                by_match[(entry.player_id, entry.match_id)] = entry
+        # Manual entries go after every match created at or before them
+        times = [match.created_at for match in self.matches]
+        for player_entries in manual.values():
+            player_entries.sort(key=lambda entry: (entry.created_at, entry.score_history_id))
+        next_manual = {player_id: 0 for player_id in manual}
+
+        running = dict(self.base_scores)
+        earlier_matches = dict.fromkeys(self.base_scores, 0)
+
+        def catch_up(player_id: str, rank: int):
+            """Replay the player's manual entries placed before the match of this rank"""
+            player_entries = manual[player_id]
+            i = next_manual[player_id]
+            while i < len(player_entries) and bisect_right(times, player_entries[i].created_at) <= rank:
+                self._apply(player_entries[i], running, None)
+                i += 1
+            next_manual[player_id] = i
+
+        rank = 0
+        # Matches created at the same moment do not count as earlier than each other
+        for _, group in groupby(self.matches, key=lambda match: match.created_at):
+            group = list(group)
+            for match in group:
+                sides = {}
+                if match.scored:
+                    (team_a, score_a), (team_b, score_b) = match.teams
+                    for players, goals in [(team_a, score_a - score_b), (team_b, score_b - score_a)]:
+                        for player_id in players:
+                            sides[player_id] = goals
+                else:
+                    for players, _ in match.teams:
+                        sides.update(dict.fromkeys(players))
+
+                for player_id, goals in sides.items():
+                    if player_id not in running:
+                        continue
+                    if player_id in manual:
+                        catch_up(player_id, rank)
+                    entry = by_match.pop((player_id, match.match_id), None)
+                    if entry is None:
+                        entry = ReplayEntry(None, player_id, match.match_id, match.created_at, 0.0, None, 0.0)
+                        self.added.append(entry)
+                    delta = None if goals is None else goals / (earlier_matches[player_id] * 0.2 + 1)
+                    self._apply(entry, running, delta)
+                rank += 1
+            for match in group:
+                for player_id in {player_id for players, _ in match.teams for player_id in players}:
+                    if player_id in earlier_matches:
+                        earlier_matches[player_id] += 1
+
+        for player_id in manual:
+            if player_id in running:
+                catch_up(player_id, len(times))
+            else:
+                self.removed.extend(entry.score_history_id for entry in manual[player_id])
+        # Entries left over belong to matches that are gone or that the player no longer plays in
+        self.removed.extend(entry.score_history_id for entry in by_match.values())
+
+        for player_id, score in running.items():
+            # Clamp score to [0, 100]
+            self.scores[player_id] = round(max(0, min(100, score)), 2)
+        return self
+
+    def _apply(self, entry: ReplayEntry, running: dict[str, float], delta: Optional[float]):
+        """Set the entry's scores from the player's running score and add its delta to it.
+
+        A None delta keeps the stored one. Otherwise rounding matches
+        `apply_match_deltas`, so replaying unchanged history changes nothing.
+        """
+        previous_score = round(max(0, min(100, running[entry.player_id])), 2)
+        if delta is None:
+            new_score = previous_score + entry.delta
+            delta = entry.delta
+        else:
+            new_score = previous_score + delta
+            delta = round(new_score - previous_score, 2)
+        new_score = round(new_score, 2)
+        if entry.previous_score != previous_score or entry.new_score != new_score or entry.delta != delta:
+            entry.previous_score, entry.new_score, entry.delta = previous_score, new_score, delta
+            if entry.score_history_id is not None:
+                self.changed.append(entry)
+        running[entry.player_id] += delta
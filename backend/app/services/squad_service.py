@@ -33,8 +33,8 @@ class SquadService:
             created_at=squad.created_at,
             players_count=len(squad.players),
             owner_id=squad.owner_id,
-            players=[player_service.player_to_data(player) for player in squad.players],
-            matches=[match_service.match_to_data(match) for match in squad.matches],
+            players=player_service.players_to_data(squad.players),
+            matches=match_service.get_matches(squad.squad_id),
             stats=stat_service.get_squad_stats(squad.squad_id)
         )
 
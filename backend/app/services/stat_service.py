@@ -1,5 +1,12 @@
+from operator import attrgetter
+from types import SimpleNamespace
+
+from sqlalchemy import Integer, and_, case, func, select, tuple_
+from sqlalchemy.orm import aliased
+
 from app.entities.stats_data import CarouselData, PlayerStatsData, ScoreHistoryData, SquadStatsData, Teammate_Ref
-from app.models import Player, Squad, ScoreHistory, Match
+from app.models import Player, PlayerPairStats, PlayerStats, Squad, ScoreHistory, Match, Team, TeamPlayer
+from app.schemas import MatchRef, PlayerRef
 from app.services.match_service import MatchService
 from app.constants import CarouselType
 from app.entities import MatchData
@@ -8,9 +15,13 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from app.services.player_service import PlayerService
 
+# The H2H entry is padded with "X" up to this many results
+H2H_MIN_RESULTS = 5
+# Every number in a player_stats row; a player without matches has them all at 0
+_STATS_COUNTERS = tuple(column.name for column in PlayerStats.__table__.columns if isinstance(column.type, Integer))
+_PAIR_COUNTERS = tuple(column.name for column in PlayerPairStats.__table__.columns if isinstance(column.type, Integer))
 
 class StatService:
-    teammates: list[Teammate_Ref] = []
     def __init__(self, session):
         self.session = session
         # Removed: self.player_service = PlayerService(session) - using lazy import instead
@@ -22,35 +33,48 @@ class StatService:
         return PlayerService(self.session)
 
     def get_squad_stats(self, squad_id: str) -> SquadStatsData:
+        """Squad totals aggregated by the database, in three queries whatever the squad size"""
         squad = self.session.query(Squad).filter(Squad.squad_id == squad_id).first()
-        total_goals = 0
-        avg_player_score = 0
-        match_datas = []
-        player_datas = []
-        for match in squad.matches:
-            match_data = self.match_service.get_match_detail(match.match_id)
-            match_datas.append(match_data)
-        for player in squad.players:
-            player_data = self._get_player_service().get_player(player.player_id)
-            player_datas.append(player_data)
-
-        total_matches = len(match_datas)
-
-        white_goals = 0
-        black_goals = 0
-        for match_data in match_datas:
-            if match_data.team_a.score is None or match_data.team_b.score is None:
-                continue
-            total_goals += match_data.team_a.score + match_data.team_b.score
-            white_goals += match_data.team_a.score if match_data.team_a.score is not None else 0
-            black_goals += match_data.team_b.score if match_data.team_b.score is not None else 0
 
-        total_players = len(player_datas)
-        for player_data in player_datas:
-            avg_player_score += player_data.score
-
-        avg_player_score /= total_players
-        avg_goals_per_match = total_goals / total_matches
+        total_players, score_sum = self.session.execute(
+            select(func.count(Player.player_id), func.coalesce(func.sum(func.round(Player.score, 2)), 0))
+            .where(Player.squad_id == squad_id)
+        ).one()
+
+        # Teams in creation order, like Match.teams: the first is white, the second black
+        ranked = (
+            select(
+                Team.match_id,
+                Team.score,
+                func.row_number().over(partition_by=Team.match_id, order_by=Team.created_at).label("position"),
+            )
+            .subquery()
+        )
+        per_match = (
+            select(
+                Match.match_id,
+                func.max(case((ranked.c.position == 1, ranked.c.score))).label("white"),
+                func.max(case((ranked.c.position == 2, ranked.c.score))).label("black"),
+            )
+            .outerjoin(ranked, ranked.c.match_id == Match.match_id)
+            .where(Match.squad_id == squad_id)
+            .group_by(Match.match_id)
+            .subquery()
+        )
+        # Only matches with both scores set count towards goals
+        scored = and_(per_match.c.white.is_not(None), per_match.c.black.is_not(None))
+        total_matches, total_goals, white_goals, black_goals = self.session.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(case((scored, per_match.c.white + per_match.c.black), else_=0)), 0),
+                func.coalesce(func.sum(case((scored, per_match.c.white), else_=0)), 0),
+                func.coalesce(func.sum(case((scored, per_match.c.black), else_=0)), 0),
+            )
+        ).one()
+
+        avg_player_score = score_sum / total_players if total_players else 0
+        avg_goals_per_match = total_goals / total_matches if total_matches else 0
+        avg_score = (round(white_goals / total_matches, 2), round(black_goals / total_matches, 2)) if total_matches else (0, 0)
 
         return SquadStatsData(
             squad_id=squad.squad_id,
@@ -60,92 +84,50 @@ class StatService:
             total_goals=total_goals,
             avg_player_score=avg_player_score,
             avg_goals_per_match=avg_goals_per_match,
-            avg_score=(round(white_goals / total_matches, 2), round(black_goals / total_matches, 2))
+            avg_score=avg_score
         )
 
     def get_player_stats(self, player_id: str) -> PlayerStatsData:
+        """Player statistics read from the player's `player_stats` row and pair rows.
+
+        The rows are kept up to date by MatchService, so the number of queries
+        does not grow with the number of matches played. The score history,
+        the H2H results and the order other players were met in are still
+        read per match.
+        """
         player = self.session.query(Player).filter(Player.player_id == player_id).first()
-        matches = sorted(player.matches, key=lambda x: x.created_at, reverse=True)
+        stats = self.session.get(PlayerStats, player_id) or PlayerStats(
+            player_id=player_id, **dict.fromkeys(_STATS_COUNTERS, 0)
+        )
+        # Everything computed below is local to this call, so concurrent requests share no state
         carousel_stats: list[CarouselData] = []
-        self.teammates = self.get_teammates(player)
-        print(self.teammates)
-        player_service = self._get_player_service()
-        match_service = MatchService(self.session)
-
-        matches_data : list[MatchData] = []
-        if matches:
-            for match in matches:
-                match_data = self.match_service.get_match_detail(match.match_id)
-                matches_data.append(match_data)
-
-        biggest_win_match_id = None
-        biggest_loss_match_id = None
-        biggest_win = 0
-        biggest_loss = 0
-        biggest_win_streak = 0
-        total_wins = 0
-        total_losses = 0
-        biggest_loss_streak = 0
-        win_streak = 0
-        loss_streak = 0
-        goals_scored = 0
-        goals_conceded = 0
-
-        total_matches = len(matches_data)
-        total_draws = 0
-
-        temp_win_streak = 0
-        temp_loss_streak = 0
-
-        is_win_streak = True
-        is_loss_streak = True
-
-        #print(matches_data)
-        for match in matches_data:
-
-            player_team = match.team_a if any(player.player_id == player_id for player in match.team_a.players) else match.team_b
-            opponent_team = match.team_b if player_team == match.team_a else match.team_a
-            #print(player_team.score, opponent_team.score)
-
-            if player_team.score is None or opponent_team.score is None:
-                continue
-
-            goals_scored += player_team.score
-            goals_conceded += opponent_team.score
-            
-
-            diff = player_team.score - opponent_team.score
-            if diff > biggest_win:
-                biggest_win = diff
-                biggest_win_match_id = match.match_id
-            if diff < biggest_loss:
-                biggest_loss = diff
-                biggest_loss_match_id = match.match_id
-
-            if diff > 0:
-                
-                is_loss_streak = False
-                total_wins += 1
-                temp_win_streak += 1
-                temp_loss_streak = 0
-                if is_win_streak:
-                    win_streak += 1
-
-            elif diff < 0:
-                is_win_streak = False
-                total_losses += 1
-                temp_loss_streak += 1
-                temp_win_streak = 0
-                if is_loss_streak:
-                    loss_streak += 1
-            else:
-                total_draws += 1
-
-            if temp_win_streak > biggest_win_streak:
-                biggest_win_streak = temp_win_streak
-
-            if temp_loss_streak > biggest_loss_streak:
-                biggest_loss_streak = temp_loss_streak
+        teammates: list[Teammate_Ref] = []
+        names: dict[str, str] = {}
+
+        pair_rows = (
+            self.session.query(PlayerPairStats, Player.name)
+            .join(Player, Player.player_id == PlayerPairStats.other_player_id)
+            .filter(PlayerPairStats.player_id == player_id)
+            .all()
+        )
+        met = self._get_meeting_order(player)
+        pair_rows.sort(key=lambda row: met.get(row[0].other_player_id, len(met)))
+        for pair, name in pair_rows:
+            teammate = Teammate_Ref(pair.other_player_id)
+            teammate.games_together = pair.games_together
+            teammate.wins_together = pair.wins_together
+            teammate.losses_together = pair.losses_together
+            teammate.games_against = pair.games_against
+            teammate.wins_against_him = pair.wins_against
+            teammate.losses_against_him = pair.losses_against
+            teammates.append(teammate)
+            names[pair.other_player_id] = name
+
+        total_matches = stats.matches_played
+        total_wins, total_draws, total_losses = stats.wins, stats.draws, stats.losses
+        goals_scored, goals_conceded = stats.goals_scored, stats.goals_conceded
+        biggest_win, biggest_win_match_id = stats.biggest_win, stats.biggest_win_match_id
+        biggest_loss, biggest_loss_match_id = stats.biggest_loss, stats.biggest_loss_match_id
 
         avg_goals_per_match = (goals_scored + goals_conceded) / total_matches if total_matches > 0 else 0
         avg_score = (goals_scored / total_matches, goals_conceded / total_matches) if total_matches > 0 else (0, 0)
@@ -154,6 +136,17 @@ class StatService:
         score_history = player.score_history
         score_history = sorted(score_history, key=lambda x: x.created_at)
 
+        referenced = {change.match_id for change in score_history if change.match_id}
+        referenced.update(match_id for match_id in (biggest_win_match_id, biggest_loss_match_id) if match_id)
+        match_refs = self._get_match_refs(referenced)
+
+        def match_ref(match_id: str):
+            # None when history outlives its match, where deletes do not cascade
+            return match_refs.get(match_id)
+
+        def player_ref(ref_id: str) -> PlayerRef:
+            return PlayerRef(playerId=ref_id, playerName=names[ref_id])
+
         score_history_data = []
         score_history_data.append(ScoreHistoryData(score=player.base_score, created_at=player.created_at, match_ref=None))
 
@@ -162,8 +155,7 @@ class StatService:
         for change in score_history:
             score += change.delta
             if change.match_id:
-                match_data = self.match_service.get_match(change.match_id)
-                score_history_data.append(ScoreHistoryData(score=round(score, 2), created_at=change.created_at, match_ref=match_data.to_ref()))
+                score_history_data.append(ScoreHistoryData(score=round(score, 2), created_at=change.created_at, match_ref=match_ref(change.match_id)))
             else:
                 score_history_data.append(ScoreHistoryData(score=round(score, 2), created_at=change.created_at, match_ref=None))
 
@@ -171,18 +163,15 @@ class StatService:
 
         #biggest win
         if biggest_win_match_id:
-            match_data = match_service.get_match(biggest_win_match_id)
-            biggest_win_statdata = CarouselData(CarouselType.BIGGEST_WIN, value=biggest_win, ref=match_data.to_ref())
+            biggest_win_statdata = CarouselData(CarouselType.BIGGEST_WIN, value=biggest_win, ref=match_ref(biggest_win_match_id))
             carousel_stats.append(biggest_win_statdata)
 
         #biggest loss
         if biggest_loss_match_id:
-            match_data = match_service.get_match(biggest_loss_match_id)
-            biggest_loss_statdata = CarouselData(CarouselType.BIGGEST_LOSS, value=biggest_loss, ref=match_data.to_ref())
+            biggest_loss_statdata = CarouselData(CarouselType.BIGGEST_LOSS, value=biggest_loss, ref=match_ref(biggest_loss_match_id))
             carousel_stats.append(biggest_loss_statdata)
 
         #win ratio
-
         if total_matches > 0:
             win_ratio_percentage = total_wins / total_matches
             draw_ratio_percentage = total_draws / total_matches
@@ -191,110 +180,98 @@ class StatService:
             win_ratio_statdata = CarouselData(CarouselType.WIN_RATIO, value=[str(int(win_ratio_percentage * 100)), str(int(draw_ratio_percentage * 100)), str(int(loss_ratio_percentage * 100))])
             carousel_stats.append(win_ratio_statdata)
 
+        # Each entry keeps the first teammate reaching its best value, in the order they were met
         #top teammate
-        if self.teammates and any(x.games_together > 0 for x in self.teammates):
+        if any(x.games_together > 0 for x in teammates):
             top_teammate = None
             top_teammate_value = 0
-            for teammate in self.teammates:
-                if teammate.games_together > 0:
-                    if teammate.games_together > top_teammate_value:
-                        top_teammate = teammate
-                        top_teammate_value = teammate.games_together
-
-            top_teammate_player_data = self._get_player_service().get_player(top_teammate.player_id)
-            top_teammate_statdata = CarouselData(CarouselType.TOP_TEAMMATE, value=top_teammate_value, ref=top_teammate_player_data.to_ref())
+            for teammate in teammates:
+                if teammate.games_together > top_teammate_value:
+                    top_teammate = teammate
+                    top_teammate_value = teammate.games_together
+
+            top_teammate_statdata = CarouselData(CarouselType.TOP_TEAMMATE, value=top_teammate_value, ref=player_ref(top_teammate.player_id))
             carousel_stats.append(top_teammate_statdata)
 
         #win teammate
-        if self.teammates and any(x.games_together > 0 for x in self.teammates):
+        if any(x.games_together > 0 for x in teammates):
             win_teammate = None
             win_teammate_value = 0
-            for teammate in self.teammates:
+            for teammate in teammates:
                 if teammate.games_together > 0 and teammate.wins_together > 0:
                     if teammate.wins_together / teammate.games_together > win_teammate_value:
                         win_teammate = teammate
                         win_teammate_value = teammate.wins_together / teammate.games_together
             if win_teammate:
-                win_teammate_player_data = self._get_player_service().get_player(win_teammate.player_id)
-                win_teammate_statdata = CarouselData(CarouselType.WIN_TEAMMATE, value= int(win_teammate_value * 100), ref=win_teammate_player_data.to_ref())
+                win_teammate_statdata = CarouselData(CarouselType.WIN_TEAMMATE, value= int(win_teammate_value * 100), ref=player_ref(win_teammate.player_id))
                 carousel_stats.append(win_teammate_statdata)
 
-        #worst teammate 
-        if self.teammates and any(x.games_together > 0 for x in self.teammates):
+        #worst teammate
+        if any(x.games_together > 0 for x in teammates):
             worst_teammate = None
             worst_teammate_value = 0
-            for teammate in self.teammates:
+            for teammate in teammates:
                 if teammate.games_together > 0 and teammate.losses_together > 0:
                     if teammate.losses_together / teammate.games_together > worst_teammate_value:
                         worst_teammate = teammate
                         worst_teammate_value = teammate.losses_together / teammate.games_together
 
             if worst_teammate:
-                worst_teammate_player_data = self._get_player_service().get_player(worst_teammate.player_id)
-                worst_teammate_statdata = CarouselData(CarouselType.WORST_TEAMMATE, value= int(worst_teammate_value * 100), ref=worst_teammate_player_data.to_ref())
+                worst_teammate_statdata = CarouselData(CarouselType.WORST_TEAMMATE, value= int(worst_teammate_value * 100), ref=player_ref(worst_teammate.player_id))
                 carousel_stats.append(worst_teammate_statdata)
 
         #nemezis
-        if self.teammates and any(x.games_against > 0 for x in self.teammates):
+        if any(x.games_against > 0 for x in teammates):
             nemezis = None
             nemezis_value = 0
-            for teammate in self.teammates:
+            for teammate in teammates:
                 if teammate.games_against > 0 and teammate.losses_against_him > 0:
                     if teammate.losses_against_him / teammate.games_against > nemezis_value:
                         nemezis = teammate
                         nemezis_value = teammate.losses_against_him / teammate.games_against
 
-            #nemezis = max(self.teammates, key=lambda x: (x.losses_against_him / x.games_against ) if x.games_against > 0 else 0)
-            #losses_against_him = int(nemezis.losses_against_him / nemezis.games_against * 100)
             if nemezis:
-
                 nemezis_value = [nemezis.wins_against_him, nemezis.losses_against_him]
-                nemezis_player_data = self._get_player_service().get_player(nemezis.player_id)
-                nemezis_statdata = CarouselData(CarouselType.NEMEZIS, value= nemezis_value, ref=nemezis_player_data.to_ref())
+                nemezis_statdata = CarouselData(CarouselType.NEMEZIS, value= nemezis_value, ref=player_ref(nemezis.player_id))
                 carousel_stats.append(nemezis_statdata)
 
         #worst rival
-        if self.teammates and any(x.games_against > 0 for x in self.teammates):
+        if any(x.games_against > 0 for x in teammates):
             worst_rival = None
             worst_rival_value = 0
-            for teammate in self.teammates:
+            for teammate in teammates:
                 if teammate.games_against > 0 and teammate.wins_against_him > 0:
                     if teammate.wins_against_him / teammate.games_against > worst_rival_value:
                         worst_rival = teammate
                         worst_rival_value = teammate.wins_against_him / teammate.games_against
 
-            #worst_rival = max(self.teammates, key=lambda x: x.wins_against_him / x.games_against if x.games_against > 0 else 0)
-            #wins_against_him = int(worst_rival.wins_against_him / worst_rival.games_against * 100)
             if worst_rival:
                 worst_rival_value = [worst_rival.wins_against_him, worst_rival.losses_against_him]
-                worst_rival_player_data = self._get_player_service().get_player(worst_rival.player_id)
-                worst_rival_statdata = CarouselData(CarouselType.WORST_RIVAL, value= worst_rival_value, ref=worst_rival_player_data.to_ref())
+                worst_rival_statdata = CarouselData(CarouselType.WORST_RIVAL, value= worst_rival_value, ref=player_ref(worst_rival.player_id))
                 carousel_stats.append(worst_rival_statdata)
 
         #h2h
-        if self.teammates and any(x.games_against > 0 for x in self.teammates):
+        if any(x.games_against > 0 for x in teammates):
             h2h = None
             h2h_value = 0
-            for teammate in self.teammates:
-                if teammate.games_against > 0:
-                    if teammate.games_against > h2h_value:
-                        h2h = teammate
-                        h2h_value = teammate.games_against
-            h2h_value = self.get_h2h_value(player, h2h.player_id)
-            h2h_player_data = self._get_player_service().get_player(h2h.player_id)
-            h2h_statdata = CarouselData(CarouselType.H2H, value=h2h_value, ref=h2h_player_data.to_ref())
+            for teammate in teammates:
+                if teammate.games_against > h2h_value:
+                    h2h = teammate
+                    h2h_value = teammate.games_against
+            # Pad results with 'X' to ensure minimum length of 5
+            h2h_value = self._get_h2h_results(player_id, h2h.player_id)
+            h2h_value += ["X"] * (H2H_MIN_RESULTS - len(h2h_value))
+            h2h_statdata = CarouselData(CarouselType.H2H, value=h2h_value, ref=player_ref(h2h.player_id))
             carousel_stats.append(h2h_statdata)
 
-
-
         return PlayerStatsData(
             player_id=player.player_id,
             base_score=player.base_score,
             score=player.score,
-            win_streak=win_streak,
-            loss_streak=loss_streak,
-            biggest_win_streak=biggest_win_streak,
-            biggest_loss_streak=biggest_loss_streak,
+            win_streak=stats.win_streak,
+            loss_streak=stats.loss_streak,
+            biggest_win_streak=stats.biggest_win_streak,
+            biggest_loss_streak=stats.biggest_loss_streak,
             goals_scored=goals_scored,
             goals_conceded=goals_conceded,
             avg_goals_per_match=avg_goals_per_match,
@@ -306,81 +283,310 @@ class StatService:
             score_history=score_history_data,
             carousel_stats=carousel_stats
         )
-    
-    
-    def get_h2h_value(self, player_model: Player, opponent_id: str) -> list[str]:
-        results: list[str] = []
-        matches = player_model.matches
-        matches_data: list[MatchData] = []
-        for match in matches:
-            match_data = self.match_service.get_match_detail(match.match_id)
-            matches_data.append(match_data)
-        
-        matches_data.sort(key=lambda x: x.created_at, reverse=True)
-        for match in matches_data:
-            player_team = match.team_a if any(player.player_id == player_model.player_id for player in match.team_a.players) else match.team_b
-            opponent_team = match.team_b if player_team == match.team_a else match.team_a
-
-            if(opponent_id not in [player.player_id for player in opponent_team.players]):
-                continue
 
-            if player_team.score is None or opponent_team.score is None:
+    def _get_match_refs(self, match_ids) -> dict[str, MatchRef]:
+        """Refs of the given matches from one query over their teams"""
+        if not match_ids:
+            return {}
+        rows = (
+            self.session.query(Match.match_id, Match.squad_id, Match.created_at, Team.score)
+            .join(Team, Team.match_id == Match.match_id)
+            .filter(Match.match_id.in_(match_ids))
+            .order_by(Match.match_id, Team.created_at, Team.team_id)
+            .all()
+        )
+        teams: dict[str, list] = {}
+        for match_id, squad_id, created_at, team_score in rows:
+            teams.setdefault(match_id, [squad_id, created_at]).append(team_score)
+
+        refs = {}
+        for match_id, (squad_id, created_at, *scores) in teams.items():
+            if len(scores) < 2:
+                raise ValueError("Team not found")
+            score = None if scores[0] is None or scores[1] is None else (scores[0], scores[1])
+            refs[match_id] = MatchData(squad_id=squad_id, match_id=match_id, created_at=created_at, score=score).to_ref()
+        return refs
+
+    def _get_meeting_order(self, player: Player) -> dict[str, int]:
+        """Position at which each other player is first met in the player's scored matches.
+
+        Matches are taken in `player.matches` order and teammates come before
+        rivals, like the scan that used to build the teammate list, so ties in
+        the carousel go to the same player as before.
+        """
+        match_order = {match.match_id: position for position, match in enumerate(player.matches)}
+        mine, theirs = aliased(TeamPlayer), aliased(TeamPlayer)
+        my_team, opposing_team = aliased(Team), aliased(Team)
+        rows = (
+            self.session.query(theirs.match_id, theirs.team_id == mine.team_id, theirs.player_id)
+            .select_from(mine)
+            .join(theirs, (theirs.match_id == mine.match_id) & (theirs.player_id != mine.player_id))
+            .join(my_team, my_team.team_id == mine.team_id)
+            .join(opposing_team, (opposing_team.match_id == mine.match_id) & (opposing_team.team_id != mine.team_id))
+            .filter(mine.player_id == player.player_id, my_team.score.is_not(None), opposing_team.score.is_not(None))
+            .order_by(theirs.created_at, theirs.player_id)
+            .all()
+        )
+        rows.sort(key=lambda row: (match_order.get(row[0], len(match_order)), not row[1]))
+        order: dict[str, int] = {}
+        for _, _, other_player_id in rows:
+            order.setdefault(other_player_id, len(order))
+        return order
+
+    def _get_h2h_results(self, player_id: str, rival_id: str) -> list[str]:
+        """W/L/D of the player in every scored match against the rival, newest first"""
+        mine, theirs = aliased(TeamPlayer), aliased(TeamPlayer)
+        my_team, their_team = aliased(Team), aliased(Team)
+        diffs = (
+            self.session.query(my_team.score - their_team.score)
+            .select_from(mine)
+            .join(theirs, (theirs.match_id == mine.match_id) & (theirs.team_id != mine.team_id))
+            .join(my_team, my_team.team_id == mine.team_id)
+            .join(their_team, their_team.team_id == theirs.team_id)
+            .join(Match, Match.match_id == mine.match_id)
+            .filter(
+                mine.player_id == player_id,
+                theirs.player_id == rival_id,
+                my_team.score.is_not(None),
+                their_team.score.is_not(None),
+            )
+            .order_by(Match.created_at.desc(), Match.match_id)
+            .all()
+        )
+        return ["W" if diff > 0 else "L" if diff < 0 else "D" for diff, in diffs]
+
+    def apply_match(self, match_id: str) -> set[str]:
+        """Add a match to the stats rows of its players.
+
+        Returns the players whose results changed, whose records then need
+        `refresh_records`.
+        """
+        return self._add_match(match_id, 1)
+
+    def revert_match(self, match_id: str) -> set[str]:
+        """Take a match out of the stats rows of its players, before it is changed or deleted"""
+        return self._add_match(match_id, -1)
+
+    def _add_match(self, match_id: str, sign: int) -> set[str]:
+        # Sessions may not autoflush, and rows added by an earlier call must be found
+        self.session.flush()
+        teams = self._load_teams(Team.match_id == match_id).get(match_id, [])
+        sides = self._match_sides(teams)
+        if not sides:
+            return set()
+        scored = all(team_score is not None for team_score, _ in teams[:2])
+
+        stats = {row.player_id: row for row in self._load_rows(PlayerStats, PlayerStats.player_id.in_(sides))}
+        new_stats = sides.keys() - stats.keys()
+        for player_id in new_stats:
+            stats[player_id] = SimpleNamespace(player_id=player_id, **dict.fromkeys(_STATS_COUNTERS, 0))
+
+        pairs = {
+            (row.player_id, row.other_player_id): row
+            for row in self._load_rows(
+                PlayerPairStats, PlayerPairStats.player_id.in_(sides), PlayerPairStats.other_player_id.in_(sides)
+            )
+        } if scored else {}
+        new_pairs = set()
+
+        def pair_row(player_id: str, other_player_id: str) -> SimpleNamespace:
+            pair = pairs.get((player_id, other_player_id))
+            if pair is None:
+                pair = SimpleNamespace(player_id=player_id, other_player_id=other_player_id,
+                                       **dict.fromkeys(_PAIR_COUNTERS, 0))
+                pairs[(player_id, other_player_id)] = pair
+                new_pairs.add((player_id, other_player_id))
+            return pair
+
+        self._accumulate(sides, sign, stats, pair_row)
+        if not scored:
+            self._save_rows(PlayerStats, stats.values(), new_stats, key="player_id")
+            return set()
+
+        # Pairs that no longer share a scored match are dropped
+        empty = {key for key, pair in pairs.items() if pair.games_together == 0 and pair.games_against == 0}
+        stale = empty - new_pairs
+        if stale:
+            self.session.query(PlayerPairStats).filter(
+                tuple_(PlayerPairStats.player_id, PlayerPairStats.other_player_id).in_(stale)
+            ).delete(synchronize_session=False)
+        self._save_rows(PlayerStats, stats.values(), new_stats, key="player_id")
+        self._save_rows(PlayerPairStats, [pairs[key] for key in pairs.keys() - empty], new_pairs,
+                        key=lambda pair: (pair.player_id, pair.other_player_id))
+        return set(sides)
+
+    def _load_teams(self, *filters) -> dict[str, list[tuple[int | None, list[str]]]]:
+        """Teams of the matches as (score, player ids), in Match.teams order, from one query.
+
+        Joined to their match, as deletes do not cascade everywhere and may leave teams behind.
+        """
+        rows = (
+            self.session.query(Team.match_id, Team.team_id, Team.score, TeamPlayer.player_id)
+            .join(Match, Match.match_id == Team.match_id)
+            .outerjoin(TeamPlayer, TeamPlayer.team_id == Team.team_id)
+            .filter(*filters)
+            .order_by(Team.match_id, Team.created_at, Team.team_id)
+            .all()
+        )
+        matches: dict[str, list[tuple[int | None, list[str]]]] = {}
+        last_team_id = None
+        for match_id, team_id, team_score, player_id in rows:
+            if team_id != last_team_id:
+                matches.setdefault(match_id, []).append((team_score, []))
+                last_team_id = team_id
+            if player_id is not None:
+                matches[match_id][-1][1].append(player_id)
+        return matches
+
+    @staticmethod
+    def _match_sides(teams) -> dict:
+        """Player -> (own team, opposing team) of one match; like Match.teams, the first team wins a tie"""
+        if len(teams) < 2:
+            return {}
+        (score_a, members_a), (score_b, members_b) = teams[:2]
+        sides = {player_id: ((score_b, members_b), (score_a, members_a)) for player_id in members_b}
+        sides.update({player_id: ((score_a, members_a), (score_b, members_b)) for player_id in members_a})
+        return sides
+
+    @staticmethod
+    def _accumulate(sides: dict, sign: int, stats: dict, pair_row) -> None:
+        """Add one match to in-memory stats rows, or take it out with sign -1.
+
+        Every player on a side counts the match as played; results, goals
+        and pair tallies only count once both teams are scored.
+        """
+        for player_id, ((own_score, teammates), (opponent_score, rivals)) in sides.items():
+            row = stats[player_id]
+            row.matches_played += sign
+            if own_score is None or opponent_score is None:
                 continue
-
-            if player_team.score > opponent_team.score:
-                results.append("W")
-            elif player_team.score < opponent_team.score:
-                results.append("L")
+            row.goals_scored += sign * own_score
+            row.goals_conceded += sign * opponent_score
+            diff = own_score - opponent_score
+            if diff > 0:
+                row.wins += sign
+            elif diff < 0:
+                row.losses += sign
             else:
-                results.append("D")
-
-        # Pad results with 'X' to ensure minimum length of 5
-        while len(results) < 5:
-            results.append("X")
-        return results
-
-    def get_teammate_ref(self, player_id: str) -> Teammate_Ref:
-            teammate_ref = next((t for t in self.teammates if t.player_id == player_id), None)
-            if not teammate_ref:
-                teammate_ref = Teammate_Ref(player_id)
-                self.teammates.append(teammate_ref)
-            return teammate_ref
-
-    def get_teammates(self, player_model: Player) -> list[Teammate_Ref]:
-        self.teammates = []
-
-        match_details = []
-        for match in player_model.matches:
-            match_data = MatchService(self.session).get_match_detail(match.match_id)
-            match_details.append(match_data)
-
-        print(player_model.player_id)
-        for match_data in match_details:
-            #print(match_data)
-            player_team = match_data.team_a if any(player.player_id == player_model.player_id for player in match_data.team_a.players) else match_data.team_b
-            opponent_team = match_data.team_b if player_team == match_data.team_a else match_data.team_a
-            print('player_team', player_team.score)
-            print('opponent_team', opponent_team.score)
-            if player_team.score is None or opponent_team.score is None:
+                row.draws += sign
+
+            for teammate_id in teammates:
+                if teammate_id != player_id:
+                    pair = pair_row(player_id, teammate_id)
+                    pair.games_together += sign
+                    if diff > 0:
+                        pair.wins_together += sign
+                    elif diff < 0:
+                        pair.losses_together += sign
+            for rival_id in rivals:
+                if rival_id != player_id:
+                    pair = pair_row(player_id, rival_id)
+                    pair.games_against += sign
+                    if diff > 0:
+                        pair.wins_against += sign
+                    elif diff < 0:
+                        pair.losses_against += sign
+
+    def _load_rows(self, model, *filters) -> list[SimpleNamespace]:
+        """Rows of a stats table as plain objects, to be changed in memory and written by `_save_rows`"""
+        return [SimpleNamespace(**row._asdict()) for row in self.session.query(*model.__table__.columns).filter(*filters)]
+
+    def _save_rows(self, model, rows, new_keys: set, key):
+        """Write stats rows back with one bulk UPDATE and one bulk INSERT, whatever their number"""
+        key = attrgetter(key) if isinstance(key, str) else key
+        rows = list(rows)
+        self.session.bulk_update_mappings(model, [vars(row) for row in rows if key(row) not in new_keys])
+        self.session.bulk_insert_mappings(model, [vars(row) for row in rows if key(row) in new_keys])
+
+    def refresh_records(self, player_ids):
+        """Recompute streaks and the biggest win and loss of these players.
+
+        Unlike the totals these depend on the order of results, so they are
+        rebuilt from the players' scored matches in one query.
+        """
+        player_ids = set(player_ids)
+        if not player_ids:
+            return
+        self.session.flush()
+        my_team, their_team = aliased(Team), aliased(Team)
+        rows = (
+            self.session.query(TeamPlayer.player_id, Match.match_id, my_team.score - their_team.score)
+            .join(Match, Match.match_id == TeamPlayer.match_id)
+            .join(my_team, my_team.team_id == TeamPlayer.team_id)
+            .join(their_team, (their_team.match_id == TeamPlayer.match_id) & (their_team.team_id != my_team.team_id))
+            .filter(
+                TeamPlayer.player_id.in_(player_ids),
+                my_team.score.is_not(None),
+                their_team.score.is_not(None),
+            )
+            .order_by(Match.created_at.desc(), Match.match_id)
+            .all()
+        )
+        # Newest first
+        results: dict[str, list[tuple[str, int]]] = {player_id: [] for player_id in player_ids}
+        for player_id, match_id, diff in rows:
+            results[player_id].append((match_id, diff))
+
+        stats = {row.player_id: row for row in self._load_rows(PlayerStats, PlayerStats.player_id.in_(player_ids))}
+        for player_id, diffs in results.items():
+            row = stats.get(player_id)
+            if row is None:
                 continue
-            print('hello')
-            for teammate in player_team.players:
-                if teammate.player_id != player_model.player_id:
-                    teammate_ref = self.get_teammate_ref(teammate.player_id)
-                    teammate_ref.games_together += 1
-                    if player_team.score > opponent_team.score:
-                        teammate_ref.wins_together += 1
-                    elif player_team.score < opponent_team.score:
-                        teammate_ref.losses_together += 1
-
-            for teammate in opponent_team.players:
-                if teammate.player_id != player_model.player_id:
-                    teammate_ref = self.get_teammate_ref(teammate.player_id)
-                    teammate_ref.games_against += 1
-                    if player_team.score > opponent_team.score:
-                        teammate_ref.wins_against_him += 1
-                    elif player_team.score < opponent_team.score:
-                        teammate_ref.losses_against_him += 1
-
-
-        return self.teammates
+            row.win_streak = row.loss_streak = row.biggest_win_streak = row.biggest_loss_streak = 0
+            row.biggest_win, row.biggest_win_match_id = 0, None
+            row.biggest_loss, row.biggest_loss_match_id = 0, None
+            temp_win_streak = temp_loss_streak = 0
+            is_win_streak = is_loss_streak = True
+            for match_id, diff in diffs:
+                if diff > row.biggest_win:
+                    row.biggest_win, row.biggest_win_match_id = diff, match_id
+                if diff < row.biggest_loss:
+                    row.biggest_loss, row.biggest_loss_match_id = diff, match_id
+
+                if diff > 0:
+                    is_loss_streak = False
+                    temp_win_streak += 1
+                    temp_loss_streak = 0
+                    if is_win_streak:
+                        row.win_streak += 1
+                elif diff < 0:
+                    is_win_streak = False
+                    temp_loss_streak += 1
+                    temp_win_streak = 0
+                    if is_loss_streak:
+                        row.loss_streak += 1
+
+                row.biggest_win_streak = max(row.biggest_win_streak, temp_win_streak)
+                row.biggest_loss_streak = max(row.biggest_loss_streak, temp_loss_streak)
+        self._save_rows(PlayerStats, stats.values(), set(), key="player_id")
+
+    def rebuild_player_stats(self):
+        """Fill the stats rows from scratch, from every match in the database.
+
+        Matches are added the same way MatchService adds them one by one, but
+        read in one query and written in bulk, so the number of queries does
+        not grow with the number of matches.
+        """
+        self.session.query(PlayerPairStats).delete()
+        self.session.query(PlayerStats).delete()
+
+        stats: dict[str, SimpleNamespace] = {}
+        pairs: dict[tuple[str, str], SimpleNamespace] = {}
+
+        def pair_row(player_id: str, other_player_id: str) -> SimpleNamespace:
+            pair = pairs.get((player_id, other_player_id))
+            if pair is None:
+                pair = pairs[(player_id, other_player_id)] = SimpleNamespace(
+                    player_id=player_id, other_player_id=other_player_id, **dict.fromkeys(_PAIR_COUNTERS, 0)
+                )
+            return pair
+
+        for teams in self._load_teams().values():
+            sides = self._match_sides(teams)
+            for player_id in sides.keys() - stats.keys():
+                stats[player_id] = SimpleNamespace(player_id=player_id, **dict.fromkeys(_STATS_COUNTERS, 0))
+            self._accumulate(sides, 1, stats, pair_row)
+        self._save_rows(PlayerStats, stats.values(), set(stats), key="player_id")
+        self._save_rows(PlayerPairStats, pairs.values(), set(pairs),
+                        key=lambda pair: (pair.player_id, pair.other_player_id))
+        self.refresh_records(stats)
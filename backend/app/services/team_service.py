@@ -54,7 +54,11 @@ class TeamService:
                 player_data = player_service.get_player(player.player_id)
             players.append(player_data)
 
-        players.sort(key=lambda x: x.score, reverse=True)
+        return self.team_to_detail_data(team, players)
+
+    def team_to_detail_data(self, team: Team, players: list[PlayerData]) -> TeamDetailData:
+        """Team details with its players already converted, strongest first"""
+        players = sorted(players, key=lambda x: x.score, reverse=True)
         return TeamDetailData(
             squad_id=team.squad_id,
             match_id=team.match_id,
@@ -94,16 +98,24 @@ class TeamService:
         team = self.session.query(Team).filter(Team.team_id == team_id).first()
         if not team:
             return None
-        team_players = self.session.query(TeamPlayer).filter(TeamPlayer.team_id == team_id).all()
+        self.replace_team_players(team, players)
+        self.session.commit()
+        return self.get_team_details(team_id)
+
+    def replace_team_players(self, team: Team, players: list[PlayerData]):
+        """Swap the team's players. Changes are only flushed, so the caller
+        commits them together with the rest of its update."""
+        team_players = self.session.query(TeamPlayer).filter(TeamPlayer.team_id == team.team_id).all()
         for player in team_players:
             self.session.delete(player)
         for player in players:
             team_player = TeamPlayer(
                 squad_id=team.squad_id,
                 match_id=team.match_id,
-                team_id=team_id,
+                team_id=team.team_id,
                 player_id=player.player_id
             )
             self.session.add(team_player)
-        self.session.commit()
-        return self.get_team_details(team_id)
+        self.session.flush()
+        # team.players is read-only and would keep the old members until the commit
+        self.session.expire(team, ["players"])
@@ -18,6 +18,8 @@ from app.models.match import Match
 from app.models.tournament import Tournament
 from app.models.score_history import ScoreHistory
 from app.models.user_squad import UserSquad
+from app.models.player_stats import PlayerStats
+from app.models.player_pair_stats import PlayerPairStats
 
 # Load environment variables from .env file
 dotenv.load_dotenv()
@@ -0,0 +1,175 @@
+"""add player stats
+
+Revision ID: 8d1f2a6b4c70
+Revises: c45f9b3c5c08
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d1f2a6b4c70'
+down_revision: Union[str, None] = 'c45f9b3c5c08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('player_stats',
+    sa.Column('player_id', sa.String(length=36), nullable=False),
+    sa.Column('matches_played', sa.Integer(), nullable=False),
+    sa.Column('wins', sa.Integer(), nullable=False),
+    sa.Column('draws', sa.Integer(), nullable=False),
+    sa.Column('losses', sa.Integer(), nullable=False),
+    sa.Column('goals_scored', sa.Integer(), nullable=False),
+    sa.Column('goals_conceded', sa.Integer(), nullable=False),
+    sa.Column('win_streak', sa.Integer(), nullable=False),
+    sa.Column('loss_streak', sa.Integer(), nullable=False),
+    sa.Column('biggest_win_streak', sa.Integer(), nullable=False),
+    sa.Column('biggest_loss_streak', sa.Integer(), nullable=False),
+    sa.Column('biggest_win', sa.Integer(), nullable=False),
+    sa.Column('biggest_win_match_id', sa.String(length=36), nullable=True),
+    sa.Column('biggest_loss', sa.Integer(), nullable=False),
+    sa.Column('biggest_loss_match_id', sa.String(length=36), nullable=True),
+    sa.ForeignKeyConstraint(['biggest_loss_match_id'], ['matches.match_id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['biggest_win_match_id'], ['matches.match_id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['player_id'], ['players.player_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('player_id')
+    )
+    op.create_table('player_pair_stats',
+    sa.Column('player_id', sa.String(length=36), nullable=False),
+    sa.Column('other_player_id', sa.String(length=36), nullable=False),
+    sa.Column('games_together', sa.Integer(), nullable=False),
+    sa.Column('wins_together', sa.Integer(), nullable=False),
+    sa.Column('losses_together', sa.Integer(), nullable=False),
+    sa.Column('games_against', sa.Integer(), nullable=False),
+    sa.Column('wins_against', sa.Integer(), nullable=False),
+    sa.Column('losses_against', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['other_player_id'], ['players.player_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['player_id'], ['players.player_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('player_id', 'other_player_id')
+    )
+
+    # Fill the new tables from the matches played so far. Written out here rather than
+    # calling the application, so later changes to models or services cannot break it
+    _backfill_totals()
+    _backfill_pairs()
+    _backfill_records()
+
+
+def _backfill_totals() -> None:
+    """One player_stats row per player who played a match; only scored matches count for results"""
+    op.execute("""
+        INSERT INTO player_stats (
+            player_id, matches_played, wins, draws, losses, goals_scored, goals_conceded,
+            win_streak, loss_streak, biggest_win_streak, biggest_loss_streak,
+            biggest_win, biggest_win_match_id, biggest_loss, biggest_loss_match_id
+        )
+        SELECT
+            tp.player_id,
+            COUNT(*),
+            SUM(CASE WHEN my.score IS NOT NULL AND opp.score IS NOT NULL AND my.score > opp.score THEN 1 ELSE 0 END),
+            SUM(CASE WHEN my.score IS NOT NULL AND opp.score IS NOT NULL AND my.score = opp.score THEN 1 ELSE 0 END),
+            SUM(CASE WHEN my.score IS NOT NULL AND opp.score IS NOT NULL AND my.score < opp.score THEN 1 ELSE 0 END),
+            SUM(CASE WHEN my.score IS NOT NULL AND opp.score IS NOT NULL THEN my.score ELSE 0 END),
+            SUM(CASE WHEN my.score IS NOT NULL AND opp.score IS NOT NULL THEN opp.score ELSE 0 END),
+            0, 0, 0, 0, 0, NULL, 0, NULL
+        FROM team_players tp
+        JOIN matches m ON m.match_id = tp.match_id
+        JOIN teams my ON my.team_id = tp.team_id
+        LEFT JOIN teams opp ON opp.match_id = tp.match_id AND opp.team_id != my.team_id
+        GROUP BY tp.player_id
+    """)
+
+
+def _backfill_pairs() -> None:
+    """Teammate and rival tallies of every two players who met in a scored match"""
+    op.execute("""
+        INSERT INTO player_pair_stats (
+            player_id, other_player_id, games_together, wins_together, losses_together,
+            games_against, wins_against, losses_against
+        )
+        SELECT
+            mine.player_id,
+            theirs.player_id,
+            SUM(CASE WHEN theirs.team_id = mine.team_id THEN 1 ELSE 0 END),
+            SUM(CASE WHEN theirs.team_id = mine.team_id AND my.score > opp.score THEN 1 ELSE 0 END),
+            SUM(CASE WHEN theirs.team_id = mine.team_id AND my.score < opp.score THEN 1 ELSE 0 END),
+            SUM(CASE WHEN theirs.team_id != mine.team_id THEN 1 ELSE 0 END),
+            SUM(CASE WHEN theirs.team_id != mine.team_id AND my.score > opp.score THEN 1 ELSE 0 END),
+            SUM(CASE WHEN theirs.team_id != mine.team_id AND my.score < opp.score THEN 1 ELSE 0 END)
+        FROM team_players mine
+        JOIN team_players theirs ON theirs.match_id = mine.match_id AND theirs.player_id != mine.player_id
+        JOIN matches m ON m.match_id = mine.match_id
+        JOIN teams my ON my.team_id = mine.team_id
+        JOIN teams opp ON opp.match_id = mine.match_id AND opp.team_id != mine.team_id
+        WHERE my.score IS NOT NULL AND opp.score IS NOT NULL
+        GROUP BY mine.player_id, theirs.player_id
+    """)
+
+
+def _backfill_records() -> None:
+    """Streaks and the biggest win and loss, which depend on the order of results.
+
+    Results are read newest first. Draws neither extend nor break a streak,
+    and the newest match wins a tie for the biggest result.
+    """
+    bind = op.get_bind()
+    rows = bind.execute(sa.text("""
+        SELECT tp.player_id, m.match_id, my.score - opp.score
+        FROM team_players tp
+        JOIN matches m ON m.match_id = tp.match_id
+        JOIN teams my ON my.team_id = tp.team_id
+        JOIN teams opp ON opp.match_id = tp.match_id AND opp.team_id != my.team_id
+        WHERE my.score IS NOT NULL AND opp.score IS NOT NULL
+        ORDER BY m.created_at DESC, m.match_id
+    """))
+    results: dict[str, list[tuple[str, int]]] = {}
+    for player_id, match_id, diff in rows:
+        results.setdefault(player_id, []).append((match_id, diff))
+
+    records = []
+    for player_id, diffs in results.items():
+        record = dict(player_id=player_id, win_streak=0, loss_streak=0, biggest_win_streak=0, biggest_loss_streak=0,
+                      biggest_win=0, biggest_win_match_id=None, biggest_loss=0, biggest_loss_match_id=None)
+        wins = losses = 0
+        is_win_streak = is_loss_streak = True
+        for match_id, diff in diffs:
+            if diff > record["biggest_win"]:
+                record["biggest_win"], record["biggest_win_match_id"] = diff, match_id
+            if diff < record["biggest_loss"]:
+                record["biggest_loss"], record["biggest_loss_match_id"] = diff, match_id
+            if diff > 0:
+                is_loss_streak = False
+                wins, losses = wins + 1, 0
+                if is_win_streak:
+                    record["win_streak"] += 1
+            elif diff < 0:
+                is_win_streak = False
+                wins, losses = 0, losses + 1
+                if is_loss_streak:
+                    record["loss_streak"] += 1
+            record["biggest_win_streak"] = max(record["biggest_win_streak"], wins)
+            record["biggest_loss_streak"] = max(record["biggest_loss_streak"], losses)
+        records.append(record)
+
+    if records:
+        bind.execute(sa.text("""
+            UPDATE player_stats SET
+                win_streak = :win_streak, loss_streak = :loss_streak,
+                biggest_win_streak = :biggest_win_streak, biggest_loss_streak = :biggest_loss_streak,
+                biggest_win = :biggest_win, biggest_win_match_id = :biggest_win_match_id,
+                biggest_loss = :biggest_loss, biggest_loss_match_id = :biggest_loss_match_id
+            WHERE player_id = :player_id
+        """), records)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('player_pair_stats')
+    op.drop_table('player_stats')
@@ -0,0 +1,271 @@
+"""Scaling benchmark for DrawTeamsService.
+
+Runs each draw engine on synthetic rosters and records wall time, peak
+memory (tracemalloc) and candidates evaluated per case. Two-team results are
+compared with `_draw_teams_2_exhaustive` wherever the exhaustive sort is
+affordable, and draws into more teams with a brute-force search over every
+split of small rosters. A previous report passed as `--baseline` makes slow-downs fail
+the run.
+
+    cd backend
+    python -m tests.benchmarks.draw_benchmark --json draw_benchmark.json --csv draw_benchmark.csv
+    python -m tests.benchmarks.draw_benchmark --baseline draw_benchmark.json
+"""
+import argparse
+import csv
+import json
+import sys
+import tracemalloc
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from itertools import combinations
+from math import comb
+from random import Random
+from time import perf_counter
+
+from app.constants import Position
+from app.entities import PlayerData
+from app.services import draw_teams_service
+from app.services.draw_teams_service import DrawTeamsService
+
+PLAYER_COUNTS = range(8, 31, 2)
+TEAM_COUNTS = (2, 3)
+SEED = 2440
+
+# Largest roster each engine is run on; past these a single case takes minutes
+ENGINE_MAX_PLAYERS = {
+    "draw_teams": 30,
+    "vectorized": 30,
+    "subset_sum": 30,
+    "branch_and_bound": 26,
+    "exhaustive": 18,
+    "local_search": 30,
+}
+# Engines for draws into three or more teams; local_search skips the enumeration of small rosters
+N_TEAMS_ENGINES = ("draw_teams", "local_search")
+# Largest roster the two-team results are checked against the exhaustive sort
+EXHAUSTIVE_MAX_PLAYERS = 18
+# Largest roster draws into more teams are checked against the brute-force search
+N_TEAMS_REFERENCE_MAX_PLAYERS = 12
+# How far above the brute-force optimum the best N-team imbalance may end
+N_TEAMS_MAX_EXCESS = 0.5
+
+# A case is a regression when it is this much slower than the baseline, and slower by at least the floor
+REGRESSION_FACTOR = 1.5
+REGRESSION_FLOOR_MS = 5.0
+
+
+@dataclass
+class BenchmarkCase:
+    """One engine run on one roster. `matches_exhaustive` is None without a reference; two-team
+    drafts must equal the exhaustive sort, and the best N-team imbalance must stay within
+    `N_TEAMS_MAX_EXCESS` of the brute-force optimum"""
+    engine: str
+    players: int
+    teams: int
+    substitutions: bool
+    wall_ms: float
+    peak_kib: float
+    evaluated: int
+    imbalance: float | None
+    complete: bool
+    matches_exhaustive: bool | None
+
+    @property
+    def key(self) -> tuple:
+        return self.engine, self.players, self.teams, self.substitutions
+
+
+def synthetic_roster(players_amount: int, seed: int = SEED) -> list[PlayerData]:
+    """Players with squad-like scores: two decimals, between 20 and 90"""
+    rng = Random(seed * 100 + players_amount)
+    return [
+        PlayerData(
+            player_id=str(uuid.UUID(int=rng.getrandbits(128))),
+            squad_id="benchmark",
+            name=f"Player {i}",
+            position=Position.FIELD,
+            base_score=50,
+            _score=round(rng.uniform(20, 90), 2),
+            matches_played=0,
+            created_at=datetime.now(timezone.utc),
+        )
+        for i in range(players_amount)
+    ]
+
+
+def engines_for(players_amount: int, amount_of_teams: int) -> list[str]:
+    """Engines worth running on a roster of this size"""
+    if amount_of_teams != 2:
+        return [engine for engine in N_TEAMS_ENGINES if players_amount <= ENGINE_MAX_PLAYERS[engine]]
+    engines = [engine for engine, limit in ENGINE_MAX_PLAYERS.items()
+               if players_amount <= limit and (engine == "draw_teams" or engine not in N_TEAMS_ENGINES)]
+    if comb(players_amount, players_amount // 2) > draw_teams_service.VECTORIZED_MAX_COMBOS and "vectorized" in engines:
+        engines.remove("vectorized")
+    return engines
+
+
+def run_engine(service: DrawTeamsService, engine: str) -> list:
+    if engine == "draw_teams":
+        return service.draw_teams()
+    if service.amount_of_teams == 2:
+        return getattr(service, f"_draw_teams_2_{engine}")()
+    return getattr(service, f"_draw_teams_n_{engine}")()
+
+
+def n_teams_reference(players: list[PlayerData], amount_of_teams: int, allow_substitutions: bool) -> float:
+    """Smallest imbalance over every split into `amount_of_teams` teams.
+
+    Shares nothing with the service's search but the team sizes and the
+    score spread, and tries relabelled copies of each split too, so it stays
+    a plain brute force. Only affordable for a dozen players or so.
+    """
+    service = DrawTeamsService(players, amount_of_teams, allow_substitutions=allow_substitutions)
+    smallest_size = len(players) // amount_of_teams
+
+    def best_spread(rest: list[int], sizes: list[int], teams: list[tuple[int, ...]]) -> float:
+        if len(sizes) == 1:
+            return service._teams_spread([*teams, tuple(rest)], service.scores, smallest_size)
+        best = float("inf")
+        for team in combinations(rest, sizes[0]):
+            in_team = set(team)
+            best = min(best, best_spread([i for i in rest if i not in in_team], sizes[1:], [*teams, team]))
+        return best
+
+    return best_spread(list(range(len(players))), service._team_sizes(), [])
+
+
+def measure(players: list[PlayerData], amount_of_teams: int, allow_substitutions: bool, engine: str):
+    """Drafts, report, wall time in ms and peak traced memory in KiB of one engine run.
+
+    Time and memory come from separate runs, because tracing allocations
+    slows the pure Python searches down several times.
+    """
+    service = DrawTeamsService(players, amount_of_teams, allow_substitutions=allow_substitutions)
+    started = perf_counter()
+    drafts = run_engine(service, engine)
+    wall_ms = (perf_counter() - started) * 1000
+
+    traced = DrawTeamsService(players, amount_of_teams, allow_substitutions=allow_substitutions)
+    tracemalloc.start()
+    try:
+        run_engine(traced, engine)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return drafts, service.report, wall_ms, peak / 1024
+
+
+def run_benchmark(player_counts=PLAYER_COUNTS, team_counts=TEAM_COUNTS, substitutions=(True, False),
+                  engines: list[str] | None = None, log=None) -> list[BenchmarkCase]:
+    """Run every engine on every roster size, team count and substitution setting"""
+    cases = []
+    for players_amount in player_counts:
+        players = synthetic_roster(players_amount)
+        for amount_of_teams in team_counts:
+            for allow_substitutions in substitutions:
+                reference = optimum = None
+                if amount_of_teams == 2 and players_amount <= EXHAUSTIVE_MAX_PLAYERS:
+                    reference = DrawTeamsService(players, allow_substitutions=allow_substitutions)._draw_teams_2_exhaustive()
+                if amount_of_teams != 2 and players_amount <= N_TEAMS_REFERENCE_MAX_PLAYERS:
+                    optimum = n_teams_reference(players, amount_of_teams, allow_substitutions)
+
+                for engine in engines_for(players_amount, amount_of_teams):
+                    if engines is not None and engine not in engines:
+                        continue
+                    drafts, report, wall_ms, peak_kib = measure(players, amount_of_teams, allow_substitutions, engine)
+                    if engine == "exhaustive":
+                        # The reference keeps no report; it scores every non-duplicate split
+                        evaluated = comb(players_amount, players_amount // 2) - comb(players_amount - players_amount // 2, players_amount // 2)
+                        imbalance, complete = None, True
+                    else:
+                        evaluated = report.evaluated
+                        imbalance = report.imbalances[0] if report.imbalances else None
+                        complete = report.complete
+                    if reference is not None:
+                        matches_exhaustive = drafts == reference
+                    elif optimum is not None:
+                        matches_exhaustive = imbalance is not None and imbalance - optimum <= N_TEAMS_MAX_EXCESS
+                    else:
+                        matches_exhaustive = None
+                    case = BenchmarkCase(
+                        engine=engine,
+                        players=players_amount,
+                        teams=amount_of_teams,
+                        substitutions=allow_substitutions,
+                        wall_ms=round(wall_ms, 3),
+                        peak_kib=round(peak_kib, 1),
+                        evaluated=evaluated,
+                        imbalance=imbalance,
+                        complete=complete,
+                        matches_exhaustive=matches_exhaustive,
+                    )
+                    cases.append(case)
+                    if log:
+                        log(case)
+    return cases
+
+
+def write_json(cases: list[BenchmarkCase], path: str):
+    with open(path, "w") as file:
+        json.dump({"seed": SEED, "cases": [asdict(case) for case in cases]}, file, indent=2)
+
+
+def write_csv(cases: list[BenchmarkCase], path: str):
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(BenchmarkCase.__dataclass_fields__))
+        writer.writeheader()
+        for case in cases:
+            writer.writerow(asdict(case))
+
+
+def load_cases(path: str) -> list[BenchmarkCase]:
+    with open(path) as file:
+        return [BenchmarkCase(**case) for case in json.load(file)["cases"]]
+
+
+def find_regressions(cases: list[BenchmarkCase], baseline: list[BenchmarkCase]) -> list[str]:
+    """Cases that got slower than REGRESSION_FACTOR times the baseline, or stopped matching their reference"""
+    previous = {case.key: case for case in baseline}
+    regressions = []
+    for case in cases:
+        before = previous.get(case.key)
+        if case.matches_exhaustive is False:
+            regressions.append(f"{case.key}: result differs from the exhaustive reference")
+        if before is None:
+            continue
+        if case.wall_ms > before.wall_ms * REGRESSION_FACTOR and case.wall_ms - before.wall_ms > REGRESSION_FLOOR_MS:
+            regressions.append(f"{case.key}: {before.wall_ms:.1f} ms -> {case.wall_ms:.1f} ms")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, nargs="+", default=list(PLAYER_COUNTS), help="roster sizes")
+    parser.add_argument("--teams", type=int, nargs="+", default=list(TEAM_COUNTS), help="team counts")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINE_MAX_PLAYERS), help="only run these engines")
+    parser.add_argument("--json", help="write the report as JSON")
+    parser.add_argument("--csv", help="write the report as CSV")
+    parser.add_argument("--baseline", help="earlier JSON report to compare wall times with")
+    args = parser.parse_args(argv)
+
+    def log(case: BenchmarkCase):
+        print(f"{case.engine:>16} n={case.players:<3} k={case.teams} subs={case.substitutions!s:<5} "
+              f"{case.wall_ms:>10.1f} ms {case.peak_kib:>10.1f} KiB {case.evaluated:>10} evaluated"
+              f"{'' if case.matches_exhaustive is None else '  exact' if case.matches_exhaustive else '  MISMATCH'}")
+
+    cases = run_benchmark(args.players, args.teams, engines=args.engines, log=log)
+    if args.json:
+        write_json(cases, args.json)
+    if args.csv:
+        write_csv(cases, args.csv)
+
+    regressions = find_regressions(cases, load_cases(args.baseline) if args.baseline else [])
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
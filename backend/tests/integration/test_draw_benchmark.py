@@ -0,0 +1,55 @@
+import csv
+import json
+from dataclasses import replace
+
+import pytest
+
+from app.services.draw_teams_service import DrawTeamsService
+
+from tests.benchmarks import draw_benchmark
+from tests.benchmarks.draw_benchmark import find_regressions, run_benchmark, write_csv, write_json
+
+
+class TestDrawBenchmark:
+    """Small runs of the draw benchmark suite"""
+
+    def test_engines_match_exhaustive(self):
+        cases = run_benchmark(player_counts=[8, 11], team_counts=[2, 3])
+
+        two_teams = [case for case in cases if case.teams == 2]
+        assert {case.engine for case in two_teams} == set(draw_benchmark.ENGINE_MAX_PLAYERS) - {"local_search"}
+        assert all(case.matches_exhaustive for case in two_teams)
+        assert all(case.evaluated > 0 and case.wall_ms >= 0 and case.peak_kib > 0 for case in cases)
+
+    def test_n_teams_engines_match_brute_force(self):
+        cases = run_benchmark(player_counts=[9, 10, 11, 12], team_counts=[3])
+
+        assert {case.engine for case in cases} == set(draw_benchmark.N_TEAMS_ENGINES)
+        assert all(case.matches_exhaustive for case in cases)
+
+    def test_n_teams_reference_is_the_optimum(self):
+        players = draw_benchmark.synthetic_roster(9)
+        service = DrawTeamsService(players, 3)
+        service.draw_teams()
+
+        # Nine players in three teams are enumerated, so the service proves the optimum too
+        assert service.report.complete
+        assert draw_benchmark.n_teams_reference(players, 3, True) == pytest.approx(service.report.imbalances[0])
+
+    def test_reports_are_written(self, tmp_path):
+        cases = run_benchmark(player_counts=[8], team_counts=[2], substitutions=[True], engines=["draw_teams"])
+        write_json(cases, tmp_path / "report.json")
+        write_csv(cases, tmp_path / "report.csv")
+
+        assert json.loads((tmp_path / "report.json").read_text())["cases"][0]["players"] == 8
+        with open(tmp_path / "report.csv", newline="") as file:
+            rows = list(csv.DictReader(file))
+        assert [row["engine"] for row in rows] == ["draw_teams"]
+
+    def test_slow_down_is_a_regression(self):
+        case = run_benchmark(player_counts=[8], team_counts=[2], substitutions=[True], engines=["draw_teams"])[0]
+        baseline = replace(case, wall_ms=1.0)
+
+        assert find_regressions([replace(case, wall_ms=1.2)], [baseline]) == []
+        assert len(find_regressions([replace(case, wall_ms=100.0)], [baseline])) == 1
+        assert len(find_regressions([replace(case, matches_exhaustive=False)], [])) == 1
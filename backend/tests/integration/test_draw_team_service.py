@@ -1,8 +1,33 @@
+import asyncio
 import pytest
-from app.services.draw_teams_service import DrawTeamsService, Relation
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+from app.services import draw_teams_service
+from app.services.draw_teams_service import DrawTeamsService, Relation, RelationType
 from app.entities import PlayerData
 from app.constants import Position
+from datetime import datetime, timezone
+import random
 import uuid
+from time import perf_counter
+
+
+def players_from_scores(scores, positions=None):
+    """Build PlayerData objects for the given scores"""
+    positions = positions or [Position.FIELD] * len(scores)
+    return [
+        PlayerData(
+            player_id=str(uuid.uuid4()),
+            squad_id="squad-1",
+            name=f"Player {i}",
+            position=positions[i],
+            base_score=int(score),
+            _score=float(score),
+            matches_played=0,
+            created_at=datetime.now(timezone.utc)
+        )
+        for i, score in enumerate(scores)
+    ]
 
 
 @pytest.fixture
@@ -164,7 +189,7 @@ class TestDrawTeamsService:
 
     def test_draw_teams_invalid_amount(self, sample_players_balanced):
         """Test draw_teams method with invalid team amount"""
-        service = DrawTeamsService(sample_players_balanced, amount_of_teams=4)
+        service = DrawTeamsService(sample_players_balanced, amount_of_teams=1)
         
         with pytest.raises(ValueError, match="Invalid amount of teams"):
             service.draw_teams()
@@ -430,3 +455,646 @@ class TestDrawTeamsService:
                 assert balance_diff >= previous_balance_diff, "Results should be ordered by balance"
             
             previous_balance_diff = balance_diff
+
+
+class TestDrawTeams2Search:
+    """Fast two-team engines must match the exhaustive reference"""
+
+    ENGINES = ["_draw_teams_2_branch_and_bound", "_draw_teams_2_vectorized", "_draw_teams_2_subset_sum"]
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    @pytest.mark.parametrize("allow_substitutions", [True, False])
+    def test_matches_exhaustive_on_random_rosters(self, engine, allow_substitutions):
+        rng = random.Random(42)
+        for _ in range(60):
+            amount = rng.randint(2, 12)
+            scores = [round(rng.uniform(0, 100), 2) for _ in range(amount)]
+            service = DrawTeamsService(
+                players_from_scores(scores),
+                amount_of_draws=rng.randint(1, 25),
+                allow_substitutions=allow_substitutions
+            )
+            assert getattr(service, engine)() == service._draw_teams_2_exhaustive()
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_matches_exhaustive_with_tied_scores(self, engine):
+        service = DrawTeamsService(players_from_scores([50, 50, 50, 50, 40, 40, 40, 40, 30]), amount_of_draws=15)
+        assert getattr(service, engine)() == service._draw_teams_2_exhaustive()
+
+    def test_fewer_than_two_players(self):
+        assert DrawTeamsService(players_from_scores([70])).draw_teams_2() == []
+
+    def test_combo_maps_back_to_roster(self):
+        service = DrawTeamsService(players_from_scores([70, 60, 50, 40, 30]))
+        team_a, team_b = service._combo_to_teams((0, 3, 4))
+
+        assert [player.score for player in team_a] == [70, 40, 30]
+        assert [player.score for player in team_b] == [60, 50]
+        # Team A is the larger team, so its weakest player sits out
+        assert service._get_effective_combo_score((4, 0, 3)) == 110
+        assert service._calculate_squared_differences_for_combo((0, 3, 4)) == 200
+
+    def test_large_roster(self):
+        rng = random.Random(7)
+        scores = [round(rng.uniform(20, 90), 2) for _ in range(22)]
+        results = DrawTeamsService(players_from_scores(scores)).draw_teams_2()
+
+        assert len(results) == 20
+        for team_a, team_b in results:
+            assert len(team_a) == 11
+            assert len(team_b) == 11
+
+    @pytest.mark.parametrize("scores", [
+        [float(score) for score in random.Random(8).choices(range(40, 61), k=11)],
+        [50.25, 50.5, 49.75, 50, 50, 49.5, 51, 48.25, 50.75, 50],
+    ])
+    def test_subset_sum_with_integer_and_binary_scores(self, scores):
+        # Exact sums tie whole levels, which are cut by squared differences
+        service = DrawTeamsService(players_from_scores(scores), amount_of_draws=7)
+        assert service._draw_teams_2_subset_sum() == service._draw_teams_2_exhaustive()
+
+    def test_subset_sum_on_roster_beyond_vectorized_limit(self):
+        rng = random.Random(9)
+        service = DrawTeamsService(players_from_scores([float(rng.randint(20, 90)) for _ in range(26)]))
+        results = service.draw_teams_2()
+
+        assert len(results) == 20
+        assert service.report.complete
+        assert service.report.lower_bound == service.report.imbalances[0]
+        assert service.report.imbalances == sorted(service.report.imbalances)
+
+    def test_subset_sum_skips_negative_scores(self):
+        service = DrawTeamsService(players_from_scores([30, 20, -5, 10]))
+        assert service._subset_sum_weights() is None
+
+
+class TestDrawTeamsN:
+    """Local search draws into three or more teams"""
+
+    @pytest.mark.parametrize("amount_of_teams", [3, 4, 5, 6])
+    def test_teams_partition_roster(self, amount_of_teams):
+        rng = random.Random(amount_of_teams)
+        players = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(30)])
+        results = DrawTeamsService(players, amount_of_teams=amount_of_teams).draw_teams()
+
+        assert 0 < len(results) <= 20
+        all_ids = {player.player_id for player in players}
+        for teams in results:
+            assert len(teams) == amount_of_teams
+            sizes = sorted(len(team) for team in teams)
+            assert sizes[-1] - sizes[0] <= 1
+            ids = [player.player_id for team in teams for player in team]
+            assert len(ids) == len(set(ids))
+            assert set(ids) == all_ids
+
+    def test_results_are_ranked_and_distinct(self):
+        rng = random.Random(3)
+        service = DrawTeamsService(players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(15)]), amount_of_teams=3)
+        results = service.draw_teams()
+
+        index = {id(player): i for i, player in enumerate(service.players)}
+        scores = [player.score for player in service.players]
+        keys = []
+        splits = set()
+        for teams in results:
+            indices = [[index[id(player)] for player in team] for team in teams]
+            keys.append((service._teams_spread(indices, scores, 5), service._teams_squared_differences(indices, scores, 5)))
+            splits.add(frozenset(frozenset(team) for team in indices))
+        assert keys == sorted(keys)
+        assert len(splits) == len(results)
+
+    def test_finds_perfect_split(self):
+        # 90+60+30 = 80+70+30 = 75+65+40 = 180
+        players = players_from_scores([90, 80, 75, 70, 65, 60, 40, 30, 30])
+        best = DrawTeamsService(players, amount_of_teams=3).draw_teams()[0]
+
+        assert {sum(player.score for player in team) for team in best} == {180}
+
+    def test_too_few_players(self):
+        assert DrawTeamsService(players_from_scores([50, 40]), amount_of_teams=3).draw_teams() == []
+
+
+class TestAnytimeDraw:
+    """Time budget, max gap and the reported lower bound"""
+
+    def test_exact_draw_reports_optimum(self):
+        rng = random.Random(11)
+        service = DrawTeamsService(players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(12)]))
+        service.draw_teams()
+
+        assert service.report.complete
+        assert service.report.lower_bound == service.report.imbalances[0]
+        assert service.report.imbalances == sorted(service.report.imbalances)
+
+    def test_time_budget_on_large_roster(self):
+        rng = random.Random(12)
+        service = DrawTeamsService(players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(30)]), time_budget_ms=50)
+
+        start = perf_counter()
+        results = service.draw_teams()
+        elapsed = perf_counter() - start
+
+        assert elapsed < 1
+        assert len(results) == 20
+        assert 0 <= service.report.lower_bound <= service.report.imbalances[0]
+
+    def test_max_gap_stops_early(self):
+        rng = random.Random(13)
+        service = DrawTeamsService(players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(28)]), max_gap=1.0)
+        service.draw_teams()
+
+        assert service.report.imbalances[0] - service.report.lower_bound <= 1.0
+
+    def test_branch_and_bound_without_budget_is_complete(self):
+        rng = random.Random(14)
+        service = DrawTeamsService(players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(14)]), time_budget_ms=None)
+        drafts = service._draw_teams_2_branch_and_bound()
+
+        assert service.report.complete
+        assert drafts == service._draw_teams_2_exhaustive()
+        assert service.report.lower_bound == service.report.imbalances[0]
+
+    @pytest.mark.parametrize("engine", ["_draw_teams_2_branch_and_bound", "_draw_teams_2_subset_sum"])
+    def test_two_team_searches_take_a_default_budget(self, engine):
+        rng = random.Random(16)
+        # Multiples of ten leave thousands of equally balanced splits to go through
+        service = DrawTeamsService(players_from_scores([rng.randrange(20, 90, 10) for _ in range(30)]),
+                                   two_teams_budget_ms=50)
+
+        start = perf_counter()
+        results = getattr(service, engine)()
+
+        assert perf_counter() - start < 1
+        assert len(results) == 20
+        assert 0 <= service.report.lower_bound <= service.report.imbalances[0]
+
+    def test_n_teams_lower_bound_is_valid(self, monkeypatch):
+        monkeypatch.setattr(draw_teams_service, "N_TEAMS_EXACT_MAX_SPLITS", 0)
+        # The strongest player alone outweighs an average team
+        players = players_from_scores([100, 10, 10, 10, 10, 10])
+        service = DrawTeamsService(players, amount_of_teams=3)
+        service.draw_teams()
+
+        # Team of 100 + 10 against an average team of 150 / 3
+        assert service.report.lower_bound == pytest.approx(60)
+        assert service.report.imbalances[0] == pytest.approx(90)
+        assert not service.report.complete
+
+    def test_small_n_teams_draw_is_exact(self):
+        rng = random.Random(15)
+        players = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(9)])
+        service = DrawTeamsService(players, amount_of_teams=3, amount_of_draws=300)
+        results = service.draw_teams()
+
+        # Nine players split into three teams of three in 9! / (3!^3 * 3!) ways, all of them scored
+        assert len(results) == service.report.evaluated == 280
+        assert service.report.complete
+        assert service.report.lower_bound == service.report.imbalances[0]
+        assert service.report.imbalances == sorted(service.report.imbalances)
+
+
+class TestConstrainedDraw:
+    """Friends, enemies and goalies are pruned inside the searches"""
+
+    ENGINES = ["_draw_teams_2_branch_and_bound", "_draw_teams_2_vectorized", "_draw_teams_2_subset_sum"]
+
+    @staticmethod
+    def team_of(teams):
+        return {player.player_id: t for t, team in enumerate(teams) for player in team}
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_matches_filtered_exhaustive(self, engine):
+        rng = random.Random(21)
+        for _ in range(40):
+            amount = rng.randint(4, 12)
+            goalies = set(rng.sample(range(amount), rng.randint(0, 3)))
+            players = players_from_scores(
+                [round(rng.uniform(20, 90), 2) for _ in range(amount)],
+                [Position.GOALIE if i in goalies else Position.FIELD for i in range(amount)]
+            )
+            relations = [
+                Relation(*rng.sample(players, 2), rng.choice([RelationType.FRIEND, RelationType.ENEMY]))
+                for _ in range(rng.randint(1, 3))
+            ]
+            service = DrawTeamsService(players, amount_of_draws=10, relations=relations, one_goalie_per_team=True)
+            assert getattr(service, engine)() == service._draw_teams_2_exhaustive()
+
+    def test_two_teams_respect_constraints(self):
+        rng = random.Random(22)
+        players = players_from_scores(
+            [round(rng.uniform(20, 90), 2) for _ in range(16)],
+            [Position.GOALIE if i in (0, 1) else Position.FIELD for i in range(16)]
+        )
+        relations = [Relation(players[2], players[3], RelationType.FRIEND), Relation(players[4], players[5], RelationType.ENEMY)]
+        results = DrawTeamsService(players, relations=relations, one_goalie_per_team=True).draw_teams()
+
+        assert len(results) == 20
+        for teams in results:
+            team_of = self.team_of(teams)
+            assert team_of[players[2].player_id] == team_of[players[3].player_id]
+            assert team_of[players[4].player_id] != team_of[players[5].player_id]
+            assert team_of[players[0].player_id] != team_of[players[1].player_id]
+
+    def test_n_teams_respect_constraints(self):
+        rng = random.Random(23)
+        players = players_from_scores(
+            [round(rng.uniform(20, 90), 2) for _ in range(18)],
+            [Position.GOALIE if i in (0, 4, 9) else Position.FIELD for i in range(18)]
+        )
+        relations = [Relation(players[1], players[2], RelationType.FRIEND), Relation(players[5], players[6], RelationType.ENEMY)]
+        results = DrawTeamsService(players, amount_of_teams=3, relations=relations, one_goalie_per_team=True).draw_teams()
+
+        assert results
+        for teams in results:
+            team_of = self.team_of(teams)
+            assert team_of[players[1].player_id] == team_of[players[2].player_id]
+            assert team_of[players[5].player_id] != team_of[players[6].player_id]
+            assert sorted(team_of[players[i].player_id] for i in (0, 4, 9)) == [0, 1, 2]
+
+    def test_contradicting_relations_give_no_drafts(self):
+        players = players_from_scores([80, 70, 60, 50])
+        relations = [Relation(players[0], players[1], RelationType.FRIEND), Relation(players[0], players[1], RelationType.ENEMY)]
+        assert DrawTeamsService(players, relations=relations).draw_teams() == []
+
+    def test_relations_with_absent_players_are_ignored(self):
+        players = players_from_scores([80, 70, 60, 50])
+        absent = players_from_scores([40])[0]
+        service = DrawTeamsService(players, relations=[Relation(players[0], absent, RelationType.ENEMY)])
+
+        assert not service.constraints.active
+        assert service.draw_teams() == DrawTeamsService(players).draw_teams()
+
+
+class TestDiverseDraw:
+    """A minimum distance between the returned drafts"""
+
+    ENGINES = ["_draw_teams_2_branch_and_bound", "_draw_teams_2_vectorized", "_draw_teams_2_subset_sum"]
+
+    @staticmethod
+    def moved_players(first, second):
+        # Fewest players to move between two-team drafts, whichever way the teams are labelled
+        changed = len({player.player_id for player in first[0]} ^ {player.player_id for player in second[0]})
+        return min(changed, len(first[0]) + len(first[1]) - changed)
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_matches_exhaustive(self, engine):
+        rng = random.Random(31)
+        for _ in range(30):
+            scores = [round(rng.uniform(20, 90), 2) for _ in range(rng.randint(4, 12))]
+            service = DrawTeamsService(players_from_scores(scores), amount_of_draws=6, min_distance=rng.randint(1, 4))
+            assert getattr(service, engine)() == service._draw_teams_2_exhaustive()
+
+    def test_drafts_keep_min_distance(self):
+        rng = random.Random(32)
+        service = DrawTeamsService(players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(18)]), min_distance=4)
+        results = service.draw_teams()
+
+        assert len(results) == 20
+        for i, first in enumerate(results):
+            for second in results[:i]:
+                assert self.moved_players(first, second) >= 4
+        # The best draft is always kept
+        assert results[0] == DrawTeamsService(service.players).draw_teams()[0]
+        assert service.report.imbalances == sorted(service.report.imbalances)
+
+    def test_n_teams_keep_min_distance(self):
+        rng = random.Random(33)
+        service = DrawTeamsService(players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(15)]),
+                                   amount_of_teams=3, min_distance=3)
+        results = service.draw_teams()
+
+        index = {id(player): i for i, player in enumerate(service.players)}
+        splits = [[sum(1 << index[id(player)] for player in team) for team in teams] for teams in results]
+        assert results
+        for i, first in enumerate(splits):
+            for second in splits[:i]:
+                assert service._split_distance(first, second) >= 3
+
+    def test_split_distance_ignores_team_labels(self):
+        service = DrawTeamsService(players_from_scores([60, 50, 40, 30]))
+        assert service._split_distance([0b0011, 0b1100], [0b1100, 0b0011]) == 0
+        assert service._split_distance([0b0011, 0b1100], [0b0101, 0b1010]) == 2
+
+
+class TestRedraw:
+    """Re-optimising earlier drafts after a roster change"""
+
+    @staticmethod
+    def as_ids(drafts):
+        return [[[player.player_id for player in team] for team in draft] for draft in drafts]
+
+    def test_late_arrival_replaces_player(self):
+        rng = random.Random(41)
+        roster = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(25)])
+        previous = self.as_ids(DrawTeamsService(roster[:24]).draw_teams())
+        players = roster[:3] + roster[4:]
+
+        service = DrawTeamsService(players)
+        results = service.redraw_teams(previous)
+
+        assert len(results) == 20
+        for team_a, team_b in results:
+            assert len(team_a) == 12 and len(team_b) == 12
+            assert {player.player_id for player in team_a + team_b} == {player.player_id for player in players}
+        assert service.report.lower_bound <= service.report.imbalances[0]
+        assert service.report.imbalances[0] - service.report.lower_bound <= draw_teams_service.REDRAW_MAX_GAP
+        assert service.report.imbalances == sorted(service.report.imbalances)
+
+    def test_imbalances_match_exhaustive_keys(self):
+        rng = random.Random(42)
+        roster = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(11)])
+        previous = self.as_ids(DrawTeamsService(roster[:10]).draw_teams())
+
+        service = DrawTeamsService(roster)
+        results = service.redraw_teams(previous)
+
+        target = service._get_effective_total_score() / 2
+        for (team_a, _), imbalance in zip(results, service.report.imbalances):
+            combo = tuple(service.players.index(player) for player in team_a)
+            assert imbalance == abs(service._get_effective_combo_score(combo) - target)
+        assert service.report.imbalances[0] <= service.report.lower_bound + draw_teams_service.REDRAW_MAX_GAP
+
+    def test_falls_back_to_full_search(self, monkeypatch):
+        monkeypatch.setattr(draw_teams_service, "REDRAW_MAX_GAP", -1.0)
+        rng = random.Random(43)
+        roster = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(14)])
+        previous = self.as_ids(DrawTeamsService(roster[:13]).draw_teams())
+
+        service = DrawTeamsService(roster)
+        assert service.redraw_teams(previous) == DrawTeamsService(roster).draw_teams()
+
+    def test_max_gap_decides_the_fallback(self):
+        rng = random.Random(45)
+        roster = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(14)])
+        previous = self.as_ids(DrawTeamsService(roster[:13]).draw_teams())
+
+        service = DrawTeamsService(roster, max_gap=0.0)
+        results = service.redraw_teams(previous)
+
+        assert service.report.imbalances[0] == service.report.lower_bound
+        assert results == DrawTeamsService(roster).draw_teams()
+
+    def test_async_fallback_runs_off_the_event_loop(self, monkeypatch):
+        monkeypatch.setattr(draw_teams_service, "REDRAW_MAX_GAP", -1.0)
+        fallbacks = []
+        original = DrawTeamsService.draw_teams_async
+        async def draw_teams_async(self):
+            fallbacks.append(self)
+            return await original(self)
+        monkeypatch.setattr(DrawTeamsService, "draw_teams_async", draw_teams_async)
+        rng = random.Random(46)
+        roster = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(14)])
+        previous = self.as_ids(DrawTeamsService(roster[:13]).draw_teams())
+
+        service = DrawTeamsService(roster)
+        results = asyncio.run(service.redraw_teams_async(previous))
+
+        assert fallbacks == [service]
+        assert results == DrawTeamsService(roster).draw_teams()
+
+    def test_n_teams_player_leaves(self):
+        rng = random.Random(44)
+        roster = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(21)])
+        previous = self.as_ids(DrawTeamsService(roster, amount_of_teams=3).draw_teams())
+
+        results = DrawTeamsService(roster[1:], amount_of_teams=3).redraw_teams(previous)
+
+        assert results
+        for teams in results:
+            assert sorted(len(team) for team in teams) == [6, 7, 7]
+            assert roster[0].player_id not in {player.player_id for team in teams for player in team}
+
+    def test_without_previous_drafts_draws_from_scratch(self):
+        players = players_from_scores([70, 60, 50, 40])
+        assert DrawTeamsService(players).redraw_teams([]) == DrawTeamsService(players).draw_teams()
+
+
+class TestPositionBalancedDraw:
+    """Multi-objective draws that also spread positions evenly"""
+
+    POSITIONS = [Position.FIELD, Position.GOALIE, Position.DEFENDER, Position.MIDFIELDER, Position.FORWARD]
+
+    @staticmethod
+    def spread(service, teams):
+        return service._position_spread([[service.players.index(player) for player in team] for team in teams])
+
+    @pytest.mark.parametrize("engine", ["_draw_teams_2_branch_and_bound", "_draw_teams_2_vectorized",
+                                        "_draw_teams_2_subset_sum"])
+    def test_matches_exhaustive(self, engine):
+        rng = random.Random(61)
+        for _ in range(40):
+            amount = rng.randint(4, 13)
+            players = players_from_scores([round(rng.uniform(20, 90), rng.choice([0, 2])) for _ in range(amount)],
+                                          [rng.choice(self.POSITIONS) for _ in range(amount)])
+            service = DrawTeamsService(players, amount_of_draws=8, position_weight=rng.choice([0.5, 3.0, 10.0]),
+                                       allow_substitutions=rng.random() < 0.5)
+            assert getattr(service, engine)() == service._draw_teams_2_exhaustive()
+
+    def test_positions_are_split_evenly(self):
+        players = players_from_scores(
+            [80, 78, 60, 59, 50, 49, 40, 39],
+            [Position.DEFENDER, Position.DEFENDER, Position.FORWARD, Position.FORWARD,
+             Position.GOALIE, Position.GOALIE, Position.MIDFIELDER, Position.MIDFIELDER]
+        )
+        service = DrawTeamsService(players, position_weight=5.0)
+        results = service.draw_teams()
+
+        # One of each pair per team; pair gaps of 2, 1, 1, 1 leave team sums one point apart
+        assert self.spread(service, results[0]) == 0
+        assert service.report.imbalances[0] == 0.5
+
+    def test_weight_trades_score_for_positions(self):
+        rng = random.Random(62)
+        players = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(16)],
+                                      [rng.choice(self.POSITIONS[1:]) for _ in range(16)])
+        plain = DrawTeamsService(players)
+        balanced = DrawTeamsService(players, position_weight=10.0)
+
+        assert self.spread(balanced, balanced.draw_teams()[0]) <= self.spread(plain, plain.draw_teams()[0])
+        assert balanced.report.imbalances == sorted(balanced.report.imbalances)
+
+    def test_n_teams_spread_positions(self):
+        rng = random.Random(63)
+        players = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(18)],
+                                      [self.POSITIONS[1 + i % 4] for i in range(18)])
+        plain = DrawTeamsService(players, amount_of_teams=3)
+        balanced = DrawTeamsService(players, amount_of_teams=3, position_weight=10.0)
+
+        assert self.spread(balanced, balanced.draw_teams()[0]) <= self.spread(plain, plain.draw_teams()[0])
+        assert balanced.report.lower_bound <= balanced.report.imbalances[0]
+
+    def test_large_roster_uses_subset_sum(self, monkeypatch):
+        monkeypatch.setattr(draw_teams_service, "VECTORIZED_MAX_COMBOS", 0)
+        rng = random.Random(64)
+        players = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(12)],
+                                      [rng.choice(self.POSITIONS) for _ in range(12)])
+        service = DrawTeamsService(players, amount_of_draws=5, position_weight=2.0)
+        assert service.draw_teams() == service._draw_teams_2_exhaustive()
+
+    def test_large_roster_finishes_within_the_default_budget(self):
+        rng = random.Random(64)
+        players = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(26)],
+                                      [rng.choice(self.POSITIONS) for _ in range(26)])
+        plain = DrawTeamsService(players, two_teams_budget_ms=draw_teams_service.TWO_TEAMS_TIME_BUDGET_MS)
+        balanced = DrawTeamsService(players, position_weight=2.0,
+                                    two_teams_budget_ms=draw_teams_service.TWO_TEAMS_TIME_BUDGET_MS)
+        plain.draw_teams()
+        balanced.draw_teams()
+
+        # Every split pays the spread of odd-sized positions, so the search stops as early as without positions
+        assert balanced.report.complete
+        assert balanced.report.evaluated <= 2 * plain.report.evaluated
+
+
+class TestRepeatPenaltyDraw:
+    """Draws that keep recent teammates apart"""
+
+    @staticmethod
+    def random_history(rng, players):
+        return {(first.player_id, second.player_id): rng.randint(1, 6)
+                for first, second in combinations(players, 2) if rng.random() < 0.5}
+
+    @staticmethod
+    def penalty(service, teams):
+        return service._repeat_penalty([[service.players.index(player) for player in team] for team in teams])
+
+    @pytest.mark.parametrize("engine", ["_draw_teams_2_branch_and_bound", "_draw_teams_2_vectorized",
+                                        "_draw_teams_2_subset_sum"])
+    def test_matches_exhaustive(self, engine):
+        rng = random.Random(71)
+        for _ in range(40):
+            amount = rng.randint(4, 13)
+            players = players_from_scores([round(rng.uniform(20, 90), rng.choice([0, 2])) for _ in range(amount)],
+                                          [rng.choice(TestPositionBalancedDraw.POSITIONS) for _ in range(amount)])
+            service = DrawTeamsService(players, amount_of_draws=8, pair_history=self.random_history(rng, players),
+                                       repeat_weight=rng.choice([0.5, 3.0]), position_weight=rng.choice([0, 2.0]),
+                                       allow_substitutions=rng.random() < 0.5)
+            assert getattr(service, engine)() == service._draw_teams_2_exhaustive()
+
+    def test_recent_teammates_are_split(self):
+        players = players_from_scores([60, 60, 50, 50])
+        # The first two played together, and so did the last two
+        history = {(players[0].player_id, players[1].player_id): 3, (players[2].player_id, players[3].player_id): 3}
+        service = DrawTeamsService(players, pair_history=history, repeat_weight=1.0)
+        results = service.draw_teams()
+
+        assert self.penalty(service, results[0]) == 0
+        assert service.report.imbalances[0] == 0
+
+    def test_history_outside_roster_is_ignored(self):
+        players = players_from_scores([60, 55, 50, 45])
+        service = DrawTeamsService(players, pair_history={("someone", "else"): 4}, repeat_weight=1.0)
+
+        assert service.pair_counts is None and service._scores_only()
+        assert service.draw_teams() == DrawTeamsService(players).draw_teams()
+
+    def test_n_teams_avoid_repeats(self):
+        players = players_from_scores([50] * 9)
+        # Three trios that all played together
+        history = {(first.player_id, second.player_id): 2
+                   for trio in (players[:3], players[3:6], players[6:]) for first, second in combinations(trio, 2)}
+        service = DrawTeamsService(players, amount_of_teams=3, pair_history=history, repeat_weight=1.0)
+
+        assert self.penalty(service, service.draw_teams()[0]) == 0
+
+
+class TestDrawProgress:
+    """Progress callbacks while a draw runs"""
+
+    @pytest.mark.parametrize("engine", ["_draw_teams_2_branch_and_bound", "_draw_teams_2_subset_sum"])
+    def test_drafts_improve_until_the_result(self, engine):
+        rng = random.Random(71)
+        events = []
+        players = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(18)])
+        service = DrawTeamsService(players, progress=events.append)
+        results = getattr(service, engine)()
+
+        drafts = [event for event in events if event.draft]
+        assert drafts
+        keys = [event.imbalance for event in drafts]
+        assert keys == sorted(keys, reverse=True)
+        assert drafts[-1].draft == results[0]
+        assert [event.evaluated for event in events] == sorted(event.evaluated for event in events)
+
+    def test_n_teams_report_progress(self):
+        events = []
+        players = players_from_scores(list(range(40, 58)))
+        results = DrawTeamsService(players, amount_of_teams=3, progress=events.append).draw_teams()
+
+        assert events[-1].imbalance == pytest.approx(min(event.imbalance for event in events))
+        assert [event.draft for event in events if event.draft][-1] == results[0]
+
+    def test_counters_between_drafts(self, monkeypatch):
+        monkeypatch.setattr(draw_teams_service, "PROGRESS_INTERVAL_MS", 0)
+        rng = random.Random(72)
+        events = []
+        players = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(20)])
+        DrawTeamsService(players, progress=events.append)._draw_teams_2_branch_and_bound()
+
+        assert any(event.draft is None and event.evaluated > 0 for event in events)
+
+
+class TestParallelDraw:
+    """Two-team searches split into shards and merged back"""
+
+    @pytest.fixture(autouse=True)
+    def shard_small_rosters(self, monkeypatch):
+        monkeypatch.setattr(draw_teams_service, "VECTORIZED_MAX_COMBOS", 0)
+
+    @pytest.mark.parametrize("max_units", [draw_teams_service.SUBSET_SUM_MAX_UNITS, 0])
+    @pytest.mark.parametrize("workers", [1, 3, 16])
+    def test_matches_exhaustive(self, monkeypatch, max_units, workers):
+        # Without room for the subset-sum index the shards run branch-and-bound
+        monkeypatch.setattr(draw_teams_service, "SUBSET_SUM_MAX_UNITS", max_units)
+        monkeypatch.setattr(draw_teams_service, "DRAW_WORKERS", workers)
+        rng = random.Random(51)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for _ in range(15):
+                players = players_from_scores([round(rng.uniform(20, 90), rng.choice([0, 2]))
+                                               for _ in range(rng.randint(4, 14))])
+                service = DrawTeamsService(players, amount_of_draws=8)
+                assert service.draw_teams_parallel(executor) == service._draw_teams_2_exhaustive()
+                assert service.report.complete
+
+    def test_shards_partition_splits(self):
+        service = DrawTeamsService(players_from_scores(range(40, 51)))
+        shards = service._shards(8)
+        assert len(shards) >= 8
+        # Every non-duplicate team A belongs to exactly one shard
+        for combo in combinations(range(11), 5):
+            if combo[0] < 5:
+                owners = [shard for shard in shards if tuple(i for i in combo if i < shard[0]) == shard[1]]
+                assert len(owners) == 1
+
+    def test_constraints_hold_across_shards(self):
+        rng = random.Random(52)
+        players = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(12)])
+        relations = [Relation(players[0], players[1], RelationType.ENEMY),
+                     Relation(players[2], players[5], RelationType.FRIEND)]
+        service = DrawTeamsService(players, amount_of_draws=10, relations=relations)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            assert service.draw_teams_parallel(executor) == service._draw_teams_2_exhaustive()
+
+    def test_async_draw_on_process_pool(self):
+        rng = random.Random(53)
+        players = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(14)])
+        service = DrawTeamsService(players, amount_of_draws=5)
+        try:
+            results = asyncio.run(service.draw_teams_async())
+        finally:
+            draw_teams_service.shutdown_draw_executor()
+        assert results == service._draw_teams_2_exhaustive()
+        assert service.report.complete
+
+    @pytest.mark.parametrize("amount_of_teams", [2, 3])
+    def test_small_async_draw_stays_in_process(self, monkeypatch, amount_of_teams):
+        monkeypatch.setattr(draw_teams_service, "VECTORIZED_MAX_COMBOS", 1_000_000)
+        rng = random.Random(54)
+        players = players_from_scores([round(rng.uniform(20, 90), 2) for _ in range(9)])
+        service = DrawTeamsService(players, amount_of_teams)
+
+        results = asyncio.run(service.draw_teams_async())
+
+        # Small draws run on a thread, so the process pool is never started
+        assert draw_teams_service._draw_executor is None
+        assert results == DrawTeamsService(players, amount_of_teams).draw_teams()
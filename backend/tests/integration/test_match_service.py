@@ -1,14 +1,19 @@
+import asyncio
 import pytest
-from sqlalchemy import create_engine
+from itertools import combinations
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 import uuid
 from datetime import datetime, timezone
 
-from app.models import Squad, Player, Match, Team, TeamPlayer, User, Base
+from app.models import Squad, Player, Match, ScoreHistory, Team, TeamPlayer, User, Base
 from app.services import MatchService, TeamService, PlayerService
 from app.entities import MatchData, MatchDetailData, PlayerData, TeamDetailData, DraftData
 from app.constants import Position
+from app.schemas.match_schemas import TeamUpdate
 from app.services.squad_service import SquadService
+from app.services.draw_cache import DrawCache, draw_cache, pair_history_cache
+from app.services.draw_teams_service import DrawProgress, shutdown_draw_executor
 
 
 @pytest.fixture
@@ -745,3 +750,387 @@ class TestMatchService:
         # Should return the match unchanged
         assert updated_match is not None
         assert updated_match.match_id == sample_match.match_id
+
+
+class TestMatchDetails:
+    """Bulk match details from a fixed number of queries"""
+
+    @pytest.fixture
+    def matches(self, match_service, player_service, sample_squad, sample_players):
+        roster = [player_service.player_to_data(player) for player in sample_players]
+        return [
+            match_service.create_match(sample_squad.squad_id, roster[:3], roster[3:]),
+            match_service.create_match(sample_squad.squad_id, roster[::2], roster[1::2]),
+            match_service.create_match(sample_squad.squad_id, roster[:2], roster[2:4]),
+        ]
+
+    def test_matches_single_detail(self, match_service, matches):
+        match_ids = [match.match_id for match in reversed(matches)]
+
+        details = match_service.get_match_details(match_ids + [str(uuid.uuid4())])
+
+        assert details == [match_service.get_match_detail(match_id) for match_id in match_ids]
+
+    def test_fixed_number_of_queries(self, match_service, matches, session):
+        match_ids = [match.match_id for match in matches]
+        statements = []
+        listen = lambda *args: statements.append(args[2])
+        event.listen(session.get_bind(), "before_cursor_execute", listen)
+        session.expire_all()
+        try:
+            details = match_service.get_match_details(match_ids)
+        finally:
+            event.remove(session.get_bind(), "before_cursor_execute", listen)
+
+        # Matches, teams, team players and matches played
+        assert len(details) == 3
+        assert len(statements) == 4
+
+    def test_empty(self, match_service):
+        assert match_service.get_match_details([]) == []
+
+
+class TestDrawCache:
+    """Repeat draws of the same roster come from the draw cache"""
+
+    @pytest.fixture(autouse=True)
+    def empty_cache(self):
+        draw_cache.clear()
+        yield
+        draw_cache.clear()
+
+    def test_repeat_draw_is_cached(self, match_service, sample_players):
+        players_ids = [player.player_id for player in sample_players]
+
+        first = match_service.draw_teams(players_ids)
+        second = match_service.draw_teams(list(reversed(players_ids)))
+
+        assert first
+        assert len(draw_cache) == 1
+        assert [draft.team_a for draft in second] == [draft.team_a for draft in first]
+
+    def test_options_are_part_of_the_key(self, match_service, sample_players):
+        players_ids = [player.player_id for player in sample_players]
+
+        match_service.draw_teams(players_ids)
+        match_service.draw_teams(players_ids, allow_substitutions=False)
+        match_service.draw_teams(players_ids, amount_of_teams=3)
+
+        assert len(draw_cache) == 3
+
+    def test_score_change_invalidates(self, match_service, player_service, sample_players):
+        players_ids = [player.player_id for player in sample_players]
+        match_service.draw_teams(players_ids)
+
+        player_service.update_player_score(sample_players[0].player_id, 30.0)
+        assert len(draw_cache) == 0
+
+        drafts = match_service.draw_teams(players_ids)
+        scores = {player.player_id: player.score for player in drafts[0].team_a + drafts[0].team_b}
+        assert scores[sample_players[0].player_id] == 30.0
+
+    def test_least_recently_used_is_evicted(self):
+        cache = DrawCache(max_size=2)
+        keys = [DrawCache.make_key({player_id: 50.0}, 2, True) for player_id in ("a", "b", "c")]
+        cache.put(keys[0], ["draft a"], ["a"])
+        cache.put(keys[1], ["draft b"], ["b"])
+        cache.get(keys[0])
+        cache.put(keys[2], ["draft c"], ["c"])
+
+        assert cache.get(keys[0]) == ["draft a"]
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[2]) == ["draft c"]
+
+    def test_key_uses_rounded_scores(self):
+        assert DrawCache.make_key({"a": 50.001, "b": 40.0}, 2, True) == DrawCache.make_key({"b": 40.0, "a": 50.0}, 2, True)
+        assert DrawCache.make_key({"a": 50.01}, 2, True) != DrawCache.make_key({"a": 50.0}, 2, True)
+
+    def test_async_draw_matches_sync_draw(self, match_service, sample_players):
+        players_ids = [player.player_id for player in sample_players]
+        try:
+            drafts = asyncio.run(match_service.draw_teams_async(players_ids, allow_substitutions=False))
+        finally:
+            shutdown_draw_executor()
+        assert len(draw_cache) == 1
+
+        draw_cache.clear()
+        expected = match_service.draw_teams(players_ids, allow_substitutions=False)
+        assert [draft.team_a for draft in drafts] == [draft.team_a for draft in expected]
+
+
+class TestDrawStream:
+    """Streamed draws: progress events, then the drafts"""
+
+    @pytest.fixture(autouse=True)
+    def empty_cache(self):
+        draw_cache.clear()
+        yield
+        draw_cache.clear()
+
+    @staticmethod
+    def collect(events):
+        async def run():
+            return [event async for event in events]
+        return asyncio.run(run())
+
+    def test_stream_ends_with_the_drafts(self, match_service, sample_players):
+        players_ids = [player.player_id for player in sample_players]
+
+        events = self.collect(match_service.draw_teams_stream(players_ids, amount_of_teams=3))
+
+        drafts, report = events[-1]
+        assert report is not None and drafts[0].imbalance == report.imbalances[0]
+        assert all(isinstance(event, DrawProgress) for event in events[:-1])
+        assert [draft.teams for draft in drafts] == [draft.teams for draft in match_service.draw_teams(players_ids, amount_of_teams=3)]
+
+    def test_cached_draw_streams_only_the_drafts(self, match_service, sample_players):
+        players_ids = [player.player_id for player in sample_players]
+        expected = match_service.draw_teams(players_ids)
+
+        events = self.collect(match_service.draw_teams_stream(players_ids))
+
+        assert events == [(expected, None)]
+
+
+class TestPairHistory:
+    """Recent teammate pairs counted by the database and cached per squad"""
+
+    @pytest.fixture(autouse=True)
+    def empty_cache(self):
+        draw_cache.clear()
+        pair_history_cache.clear()
+        yield
+        draw_cache.clear()
+        pair_history_cache.clear()
+
+    @staticmethod
+    def teammate_pairs(players):
+        return {tuple(sorted((first.player_id, second.player_id))) for first, second in combinations(players, 2)}
+
+    @pytest.fixture
+    def roster(self, player_service, sample_players):
+        return [player_service.player_to_data(player) for player in sample_players]
+
+    @pytest.fixture
+    def played_match(self, match_service, sample_squad, roster):
+        return match_service.create_match(sample_squad.squad_id, roster[:3], roster[3:])
+
+    def test_counts_pairs_of_teammates(self, match_service, sample_squad, played_match, roster):
+        pairs = match_service.get_pair_history(sample_squad.squad_id)
+
+        assert pairs == {pair: 1 for pair in self.teammate_pairs(roster[:3]) | self.teammate_pairs(roster[3:])}
+
+    def test_only_last_matches_count(self, match_service, sample_squad, played_match, roster):
+        later_a, later_b = roster[::2], roster[1::2]
+        match_service.create_match(sample_squad.squad_id, later_a, later_b)
+
+        pairs = match_service.get_pair_history(sample_squad.squad_id, last_matches=1)
+
+        assert pairs == {pair: 1 for pair in self.teammate_pairs(later_a) | self.teammate_pairs(later_b)}
+
+    def test_match_changes_invalidate(self, match_service, sample_squad, played_match, sample_players):
+        pairs = match_service.get_pair_history(sample_squad.squad_id)
+        assert match_service.get_pair_history(sample_squad.squad_id) is pairs
+
+        players_ids = [player.player_id for player in sample_players]
+        match_service.update_match_players(played_match.match_id, players_ids[:2], players_ids[2:])
+        assert match_service.get_pair_history(sample_squad.squad_id) is not pairs
+
+        match_service.delete_match(played_match.match_id)
+        assert match_service.get_pair_history(sample_squad.squad_id) == {}
+
+    def test_draw_splits_recent_teammates(self, match_service, sample_squad, played_match, sample_players):
+        players_ids = [player.player_id for player in sample_players]
+        pairs = match_service.get_pair_history(sample_squad.squad_id)
+
+        drafts = match_service.draw_teams(players_ids, repeat_weight=10.0)
+
+        # Two trios of three players cannot be split further than one repeated pair per team
+        repeats = sum(pairs.get(pair, 0) for team in drafts[0].teams for pair in self.teammate_pairs(team))
+        assert repeats == 2
+
+    def test_history_is_part_of_the_draw_key(self, match_service, played_match, sample_players):
+        players_ids = [player.player_id for player in sample_players]
+        match_service.draw_teams(players_ids, repeat_weight=1.0)
+        match_service.draw_teams(players_ids)
+        assert len(draw_cache) == 2
+
+        match_service.delete_match(played_match.match_id)
+        assert len(draw_cache) == 0
+
+
+class TestRedrawTeams:
+    """Re-draw after a player leaves or joins"""
+
+    def test_redraw_after_player_leaves(self, match_service, sample_players):
+        players_ids = [player.player_id for player in sample_players]
+        previous = [[[player.player_id for player in team] for team in draft.teams]
+                    for draft in match_service.draw_teams(players_ids)]
+
+        drafts = match_service.redraw_teams(previous, removed=[players_ids[0]])
+
+        assert drafts
+        for draft in drafts:
+            ids = {player.player_id for player in draft.team_a + draft.team_b}
+            assert ids == set(players_ids[1:])
+            assert draft.imbalance is not None
+
+    def test_redraw_without_previous_drafts(self, match_service):
+        assert match_service.redraw_teams([]) == []
+
+    def test_async_redraw_matches_sync_redraw(self, match_service, sample_players):
+        players_ids = [player.player_id for player in sample_players]
+        previous = [[[player.player_id for player in team] for team in draft.teams]
+                    for draft in match_service.draw_teams(players_ids)]
+
+        drafts = asyncio.run(match_service.redraw_teams_async(previous, removed=[players_ids[0]], time_budget_ms=500))
+
+        expected = match_service.redraw_teams(previous, removed=[players_ids[0]], time_budget_ms=500)
+        assert [draft.teams for draft in drafts] == [draft.teams for draft in expected]
+
+
+class TestScoreUpdates:
+    """Match results applied to each player's score history in one transaction, with bulk writes"""
+
+    @pytest.fixture
+    def roster(self, player_service, sample_players):
+        return [player_service.player_to_data(player) for player in sample_players]
+
+    @staticmethod
+    def set_result(match_service, match, score):
+        return match_service.update_match(
+            match.match_id,
+            TeamUpdate(team_id=match.team_a.team_id, score=score[0]),
+            TeamUpdate(team_id=match.team_b.team_id, score=score[1]),
+        )
+
+    def test_editing_an_old_result_keeps_later_deltas(self, session, match_service, sample_squad, sample_players, roster):
+        first = match_service.create_match(sample_squad.squad_id, roster[:3], roster[3:])
+        self.set_result(match_service, first, (3, 1))
+        second = match_service.create_match(sample_squad.squad_id, roster[::2], roster[1::2])
+        self.set_result(match_service, second, (2, 0))
+
+        self.set_result(match_service, first, (1, 1))
+
+        session.expire_all()
+        player = sample_players[0]
+        deltas = {entry.match_id: entry.delta for entry in player.score_history}
+        # The second match is the player's second one, so its goal difference is divided by 1.2
+        assert deltas == {first.match_id: 0.0, second.match_id: round(2 / 1.2, 2)}
+        assert player.score == round(player.base_score + sum(deltas.values()), 2)
+
+    def test_commits_do_not_grow_with_players(self, session, match_service, sample_squad, roster):
+        def count_commits(match) -> int:
+            commits = []
+            listen = lambda session: commits.append(session)
+            event.listen(session, "after_commit", listen)
+            try:
+                self.set_result(match_service, match, (2, 1))
+            finally:
+                event.remove(session, "after_commit", listen)
+            return len(commits)
+
+        small = match_service.create_match(sample_squad.squad_id, roster[:1], roster[1:2])
+        large = match_service.create_match(sample_squad.squad_id, roster[2:4] + roster[:1], roster[4:] + roster[1:2])
+
+        assert count_commits(small) == count_commits(large)
+
+    def test_statements_do_not_grow_with_players(self, session, match_service, sample_squad, roster):
+        def count_statements(match) -> int:
+            statements = []
+            listen = lambda *args: statements.append(args[2])
+            event.listen(session.get_bind(), "before_cursor_execute", listen)
+            session.expire_all()
+            try:
+                self.set_result(match_service, match, (2, 1))
+            finally:
+                event.remove(session.get_bind(), "before_cursor_execute", listen)
+            return len(statements)
+
+        # Both are the first match of all their players
+        small = match_service.create_match(sample_squad.squad_id, roster[:1], roster[1:2])
+        large = match_service.create_match(sample_squad.squad_id, roster[2:4], roster[4:])
+        assert count_statements(small) == count_statements(large)
+
+
+class TestScoreReplay:
+    """Squad-wide replays that recompute every delta and score from the matches, oldest first"""
+
+    @pytest.fixture
+    def played(self, match_service, player_service, sample_squad, sample_players):
+        """Three scored matches; the first player plays in all of them"""
+        matches = []
+        for team_a, team_b, score in [
+            (slice(0, 3), slice(3, 6), (3, 1)),
+            (slice(0, 6, 2), slice(1, 6, 2), (2, 0)),
+            (slice(0, 2), slice(2, 4), (1, 2)),
+        ]:
+            # Fresh data for every match, so each one starts from the current scores like the API does
+            roster = [player_service.player_to_data(player) for player in sample_players]
+            match = match_service.create_match(sample_squad.squad_id, roster[team_a], roster[team_b])
+            TestScoreUpdates.set_result(match_service, match, score)
+            matches.append(match)
+        return matches
+
+    @staticmethod
+    def history(player):
+        return {entry.match_id: (entry.previous_score, entry.new_score, entry.delta) for entry in player.score_history}
+
+    def test_deleting_an_old_match_replays_later_factors(self, session, match_service, sample_players, played):
+        match_service.delete_match(played[0].match_id)
+
+        session.expire_all()
+        player = sample_players[0]
+        # The later matches moved up one place, so they are divided by 1 and 1.2 now
+        second = round(2 / 1, 2)
+        third = round(-1 / 1.2, 2)
+        assert self.history(player) == {
+            played[1].match_id: (player.base_score, player.base_score + second, second),
+            played[2].match_id: (player.base_score + second, round(player.base_score + second + third, 2), third),
+        }
+        assert player.score == round(player.base_score + second + third, 2)
+
+    def test_base_score_change_moves_the_whole_history(self, session, player_service, sample_players, played):
+        player = sample_players[0]
+        before = self.history(player)
+
+        player_service.update_player_base_score(player.player_id, player.base_score + 10)
+
+        session.expire_all()
+        after = self.history(player)
+        assert {match_id: (previous + 10, new + 10, delta) for match_id, (previous, new, delta) in before.items()} == after
+        assert player.score == round(player.base_score + sum(delta for _, _, delta in after.values()), 2)
+
+    def test_replay_of_unchanged_history_writes_nothing(self, session, player_service, sample_squad, played):
+        before = [(entry.score_history_id, entry.previous_score, entry.new_score, entry.delta)
+                  for entry in session.query(ScoreHistory).order_by(ScoreHistory.score_history_id)]
+
+        assert player_service.replay_squad_scores(sample_squad.squad_id) == set()
+        session.commit()
+
+        session.expire_all()
+        after = [(entry.score_history_id, entry.previous_score, entry.new_score, entry.delta)
+                 for entry in session.query(ScoreHistory).order_by(ScoreHistory.score_history_id)]
+        assert before == after
+
+    def test_statements_do_not_grow_with_matches(self, session, match_service, player_service, sample_squad,
+                                                 sample_players, played):
+        def count_statements() -> list[str]:
+            statements = []
+            listen = lambda *args: statements.append(args[2])
+            event.listen(session.get_bind(), "before_cursor_execute", listen)
+            try:
+                player_service.replay_squad_scores(sample_squad.squad_id)
+            finally:
+                event.remove(session.get_bind(), "before_cursor_execute", listen)
+            return statements
+
+        few = count_statements()
+        for _ in range(5):
+            roster = [player_service.player_to_data(player) for player in sample_players]
+            match = match_service.create_match(sample_squad.squad_id, roster[:3], roster[3:])
+            TestScoreUpdates.set_result(match_service, match, (1, 0))
+        many = count_statements()
+
+        assert len(few) == len(many)
+        assert all(statement.lstrip().startswith("SELECT") for statement in many)
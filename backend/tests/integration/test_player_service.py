@@ -1,5 +1,5 @@
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 import uuid
 from datetime import datetime, timezone
@@ -920,3 +920,25 @@ class TestPlayerService:
         
         assert other_player.player_id in other_player_ids
         assert other_player.player_id not in original_player_ids
+
+    def test_get_players_counts_matches_in_one_query(self, player_service, sample_squad, sample_players,
+                                                     sample_match_with_teams, session):
+        """Test that get_players counts matches played with one grouped query, not one per player"""
+        squad_id = sample_squad.squad_id
+        statements = []
+        listen = lambda *args: statements.append(args[2])
+        event.listen(session.get_bind(), "before_cursor_execute", listen)
+        session.expire_all()
+        try:
+            players = player_service.get_players(squad_id)
+        finally:
+            event.remove(session.get_bind(), "before_cursor_execute", listen)
+
+        assert len(statements) == 2
+        matches_played = {player.player_id: player.matches_played for player in players}
+        assert matches_played == {
+            sample_players[0].player_id: 1,
+            sample_players[1].player_id: 1,
+            sample_players[2].player_id: 0,
+        }
+        assert matches_played == {player.player_id: len(player.matches) for player in sample_players}
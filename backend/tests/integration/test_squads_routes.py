@@ -336,4 +336,61 @@ class TestSquadsRoutes:
                              json=match_data, headers=other_headers)
         
         assert response.status_code == 403
-        assert "Only squad owner can create matches" in response.json()["detail"] 
\ No newline at end of file
+        assert "Only squad owner can create matches" in response.json()["detail"] 
+    def test_draw_match_stream(self, client, session, sample_squad, auth_headers):
+        """Test streaming a draw as NDJSON lines ending with the drafts"""
+        import json
+        players = [
+            Player(
+                player_id=str(uuid.uuid4()),
+                squad_id=sample_squad.squad_id,
+                name=f"Player {i}",
+                position="field",
+                base_score=10 + i,
+                score=10.0 + i * 3
+            )
+            for i in range(9)
+        ]
+        session.add_all(players)
+        session.commit()
+
+        response = client.post(f"/api/v1/squads/{sample_squad.squad_id}/matches/draw/stream",
+                               json={"players_ids": [player.player_id for player in players], "amount_of_teams": 3},
+                               headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[-1]["event"] == "result"
+        assert len(lines[-1]["drafts"]) > 0
+        assert all(line["event"] in ("draft", "progress") for line in lines[:-1])
+        assert any(line["event"] == "draft" for line in lines)
+
+    def test_draw_match_budgets_two_team_searches(self, client, sample_squad, auth_headers):
+        """The route, not the service, caps the unbounded two-team searches"""
+        from app.services.draw_teams_service import TWO_TEAMS_TIME_BUDGET_MS
+        calls = []
+
+        async def draw_teams_async(self, players_ids, amount_of_teams=2, **options):
+            calls.append(options)
+            return []
+
+        with patch.object(MatchService, "draw_teams_async", draw_teams_async):
+            response = client.post(f"/api/v1/squads/{sample_squad.squad_id}/matches/draw",
+                                   json={"players_ids": []}, headers=auth_headers)
+
+        assert response.status_code == 200
+        assert calls[0]["two_teams_budget_ms"] == TWO_TEAMS_TIME_BUDGET_MS
+        assert calls[0]["time_budget_ms"] is None
+
+    def test_redraw_match_rejects_single_team_drafts(self, client, session, sample_squad, auth_headers):
+        """A draft needs two teams to re-draw; one team is a validation error, not a server error"""
+        player = Player(player_id=str(uuid.uuid4()), squad_id=sample_squad.squad_id, name="Player",
+                        position="field", base_score=50, score=50.0)
+        session.add(player)
+        session.commit()
+
+        response = client.post(f"/api/v1/squads/{sample_squad.squad_id}/matches/redraw",
+                               json={"drafts": [[[player.player_id]]]}, headers=auth_headers)
+
+        assert response.status_code == 422
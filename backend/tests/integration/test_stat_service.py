@@ -0,0 +1,435 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+import uuid
+from datetime import datetime, timezone
+
+from app.models import Match, Squad, Player, PlayerPairStats, PlayerStats, User, Base
+from app.services import MatchService, PlayerService
+from app.services.squad_service import SquadService
+from app.services.stat_service import StatService
+from app.constants import CarouselType
+from app.schemas.match_schemas import TeamUpdate
+
+
+@pytest.fixture
+def session():
+    """Create in-memory SQLite database session for testing"""
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    return Session()
+
+
+@pytest.fixture
+def sample_squad(session):
+    """Create a sample squad with its owner"""
+    user = User(
+        user_id=str(uuid.uuid4()),
+        username="test@example.com",
+        password_hash="hashed_password",
+        created_at=datetime.now(timezone.utc)
+    )
+    squad = Squad(
+        squad_id=str(uuid.uuid4()),
+        name="Test Squad",
+        created_at=datetime.now(timezone.utc),
+        owner_id=user.user_id
+    )
+    session.add_all([user, squad])
+    session.commit()
+    return squad
+
+
+@pytest.fixture
+def sample_players(session, sample_squad):
+    """Players A to D, strongest first"""
+    players = [
+        Player(
+            player_id=str(uuid.uuid4()),
+            squad_id=sample_squad.squad_id,
+            name=name,
+            position="field",
+            base_score=score,
+            score=float(score)
+        )
+        for name, score in (("A", 60), ("B", 50), ("C", 40), ("D", 30))
+    ]
+    session.add_all(players)
+    session.commit()
+    return players
+
+
+def play(session, squad, team_a, team_b, score=None):
+    """Create a match between two lists of players and set its score"""
+    player_service = PlayerService(session)
+    match_service = MatchService(session)
+    match = match_service.create_match(
+        squad.squad_id,
+        [player_service.player_to_data(player) for player in team_a],
+        [player_service.player_to_data(player) for player in team_b],
+    )
+    if score is not None:
+        score_match(session, match, score)
+    return match
+
+
+def score_match(session, match, score):
+    """Set the result of a match through MatchService, like the update route"""
+    MatchService(session).update_match(
+        match.match_id,
+        TeamUpdate(team_id=match.team_a.team_id, score=score[0]),
+        TeamUpdate(team_id=match.team_b.team_id, score=score[1]),
+    )
+
+
+@pytest.fixture
+def played_matches(session, sample_squad, sample_players):
+    """Four matches of player A, oldest first; the last one has no score yet"""
+    a, b, c, d = sample_players
+    return [
+        play(session, sample_squad, [a, b], [c, d], (3, 1)),
+        play(session, sample_squad, [a, c], [b, d], (0, 2)),
+        play(session, sample_squad, [a, b], [c, d], (4, 0)),
+        play(session, sample_squad, [a, d], [b, c]),
+    ]
+
+
+class TestPlayerStats:
+    """Player statistics from one pass over the player's matches"""
+
+    def test_results_and_streaks(self, session, sample_players, played_matches):
+        stats = StatService(session).get_player_stats(sample_players[0].player_id)
+
+        # Newest first: no score, win by 4, loss by 2, win by 2
+        assert stats.total_matches == 4
+        assert (stats.total_wins, stats.total_draws, stats.total_losses) == (2, 0, 1)
+        assert (stats.win_streak, stats.loss_streak) == (1, 0)
+        assert (stats.biggest_win_streak, stats.biggest_loss_streak) == (1, 1)
+        assert (stats.goals_scored, stats.goals_conceded) == (7, 3)
+        assert stats.avg_goals_per_match == 2.5
+        assert stats.avg_score == (1.75, 0.75)
+
+    def test_carousel(self, session, sample_players, played_matches):
+        a, b, c, d = sample_players
+        stats = StatService(session).get_player_stats(a.player_id)
+        carousel = {stat.carousel_type: stat for stat in stats.carousel_stats}
+
+        assert carousel[CarouselType.BIGGEST_WIN].value == 4
+        assert carousel[CarouselType.BIGGEST_WIN].ref.matchId == played_matches[2].match_id
+        assert carousel[CarouselType.BIGGEST_WIN].ref.score == (4, 0)
+        assert carousel[CarouselType.BIGGEST_LOSS].value == -2
+        assert carousel[CarouselType.BIGGEST_LOSS].ref.matchId == played_matches[1].match_id
+        assert carousel[CarouselType.WIN_RATIO].value == ["50", "0", "25"]
+
+        assert (carousel[CarouselType.TOP_TEAMMATE].value, carousel[CarouselType.TOP_TEAMMATE].ref.playerName) == (2, "B")
+        assert (carousel[CarouselType.WIN_TEAMMATE].value, carousel[CarouselType.WIN_TEAMMATE].ref.playerName) == (100, "B")
+        assert (carousel[CarouselType.WORST_TEAMMATE].value, carousel[CarouselType.WORST_TEAMMATE].ref.playerName) == (100, "C")
+        assert (carousel[CarouselType.NEMEZIS].value, carousel[CarouselType.NEMEZIS].ref.playerName) == ([0, 1], "B")
+        assert (carousel[CarouselType.WORST_RIVAL].value, carousel[CarouselType.WORST_RIVAL].ref.playerName) == ([2, 0], "C")
+        # D was the opponent most often: newest first, padded to five
+        assert carousel[CarouselType.H2H].value == ["W", "L", "W", "X", "X"]
+        assert carousel[CarouselType.H2H].ref.playerId == d.player_id
+
+    def test_score_history_links_matches(self, session, sample_players, played_matches):
+        stats = StatService(session).get_player_stats(sample_players[0].player_id)
+
+        assert stats.score_history[0].match_ref is None
+        assert [entry.match_ref.matchId for entry in stats.score_history[1:]] == [match.match_id for match in played_matches]
+        assert stats.score_history[1].match_ref.score == (3, 1)
+        assert stats.score_history[4].match_ref.score is None
+
+    def test_player_without_matches(self, session, sample_squad):
+        player = Player(squad_id=sample_squad.squad_id, name="E", position="field", base_score=50, score=50.0)
+        session.add(player)
+        session.commit()
+
+        stats = StatService(session).get_player_stats(player.player_id)
+
+        assert stats.total_matches == 0
+        assert stats.carousel_stats == []
+        assert len(stats.score_history) == 1
+
+    def test_queries_do_not_grow_with_matches(self, session, sample_squad, sample_players, played_matches):
+        a, b, c, d = sample_players
+
+        def count_queries() -> int:
+            statements = []
+            listen = lambda *args: statements.append(args[2])
+            event.listen(session.get_bind(), "before_cursor_execute", listen)
+            session.expire_all()
+            try:
+                StatService(session).get_player_stats(a.player_id)
+            finally:
+                event.remove(session.get_bind(), "before_cursor_execute", listen)
+            return len(statements)
+
+        before = count_queries()
+        score_match(session, played_matches[3], (2, 2))
+        for _ in range(5):
+            play(session, sample_squad, [a, c], [b, d], (1, 1))
+
+        assert count_queries() == before
+
+    def test_h2h_lists_every_result(self, session, sample_squad, sample_players, played_matches):
+        a, b, c, d = sample_players
+        score_match(session, played_matches[3], (1, 1))
+        for _ in range(4):
+            play(session, sample_squad, [a, c], [b, d], (2, 1))
+
+        stats = StatService(session).get_player_stats(a.player_id)
+        h2h = next(stat for stat in stats.carousel_stats if stat.carousel_type == CarouselType.H2H)
+
+        assert h2h.ref.playerId == d.player_id
+        assert h2h.value == ["W", "W", "W", "W", "W", "L", "W"]
+
+    def test_ties_go_to_the_player_met_first(self, session, sample_squad, sample_players):
+        a, b, c, d = sample_players
+        play(session, sample_squad, [a, b], [c, d], (1, 0))
+        play(session, sample_squad, [a, c], [b, d], (1, 0))
+        # B and C both won their only match with A; the first one met in A's matches is kept
+        session.expire_all()
+        first_match = session.get(Player, a.player_id).matches[0]
+        first_teammate = next(
+            player for team in first_match.teams if a in team.players for player in team.players if player is not a
+        )
+
+        stats = StatService(session).get_player_stats(a.player_id)
+        carousel = {stat.carousel_type: stat for stat in stats.carousel_stats}
+
+        assert carousel[CarouselType.TOP_TEAMMATE].ref.playerId == first_teammate.player_id
+        assert carousel[CarouselType.WIN_TEAMMATE].ref.playerId == first_teammate.player_id
+
+
+def stats_rows(session) -> dict:
+    """Every player_stats and player_pair_stats row as plain tuples"""
+    session.expire_all()
+    stats = {
+        row.player_id: tuple(getattr(row, column.name) for column in PlayerStats.__table__.columns)
+        for row in session.query(PlayerStats)
+    }
+    pairs = {
+        (row.player_id, row.other_player_id): tuple(getattr(row, column.name) for column in PlayerPairStats.__table__.columns)
+        for row in session.query(PlayerPairStats)
+    }
+    return {"stats": stats, "pairs": pairs}
+
+
+def rebuilt_rows(session) -> dict:
+    StatService(session).rebuild_player_stats()
+    session.commit()
+    return stats_rows(session)
+
+
+class TestConcurrentPlayerStats:
+    """Profiles computed side by side by several workers, each with its own session"""
+
+    WORKERS = 4
+    ROUNDS = 25
+
+    @pytest.fixture
+    def session(self, tmp_path):
+        """SQLite file database, so that every worker can open its own connection"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        return Session()
+
+    def test_overlapping_requests_keep_their_own_tallies(self, session, sample_players, played_matches):
+        score_match(session, played_matches[3], (2, 2))
+        player_ids = [player.player_id for player in sample_players]
+        expected = {
+            player_id: StatService(session).get_player_stats(player_id).to_schema().model_dump()
+            for player_id in player_ids
+        }
+        Session = sessionmaker(bind=session.get_bind())
+        barrier = Barrier(self.WORKERS)
+
+        def profile(player_id: str) -> dict:
+            request_session = Session()
+            try:
+                service = StatService(request_session)
+                # Start every request of the round at once
+                barrier.wait()
+                return service.get_player_stats(player_id).to_schema().model_dump()
+            finally:
+                request_session.close()
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as executor:
+            for round_number in range(self.ROUNDS):
+                # Rotate players so each pair of profiles overlaps in some round
+                order = player_ids[round_number % len(player_ids):] + player_ids[:round_number % len(player_ids)]
+                results = list(executor.map(profile, order))
+                assert results == [expected[player_id] for player_id in order]
+
+        assert not hasattr(StatService, "teammates")
+
+
+class TestPlayerStatsRows:
+    """player_stats and player_pair_stats kept up to date by MatchService"""
+
+    def test_rows_match_a_rebuild(self, session, sample_players, played_matches):
+        a, b, c, d = sample_players
+        rows = stats_rows(session)
+
+        assert rows == rebuilt_rows(session)
+        stats = session.get(PlayerStats, a.player_id)
+        assert (stats.matches_played, stats.wins, stats.losses, stats.biggest_win) == (4, 2, 1, 4)
+        assert stats.biggest_win_match_id == played_matches[2].match_id
+        # The unscored match adds nothing to the pair tallies
+        pair = session.get(PlayerPairStats, (a.player_id, d.player_id))
+        assert (pair.games_together, pair.games_against, pair.wins_against, pair.losses_against) == (0, 3, 2, 1)
+
+    def test_changed_score_replaces_the_old_result(self, session, sample_players, played_matches):
+        a, b, c, d = sample_players
+        score_match(session, played_matches[3], (1, 1))
+        score_match(session, played_matches[2], (0, 1))
+
+        stats = session.get(PlayerStats, a.player_id)
+        assert (stats.wins, stats.draws, stats.losses) == (1, 1, 2)
+        assert (stats.goals_scored, stats.goals_conceded) == (4, 5)
+        assert (stats.biggest_win, stats.biggest_win_match_id) == (2, played_matches[0].match_id)
+        # Newest first: draw, loss, loss, win
+        assert (stats.win_streak, stats.loss_streak, stats.biggest_loss_streak) == (0, 2, 2)
+        assert stats_rows(session) == rebuilt_rows(session)
+
+    def test_changed_players_move_their_tallies(self, session, sample_squad, sample_players, played_matches):
+        a, b, c, d = sample_players
+        e = Player(squad_id=sample_squad.squad_id, name="E", position="field", base_score=50, score=50.0)
+        session.add(e)
+        session.commit()
+
+        MatchService(session).update_match_players(played_matches[0].match_id, [a.player_id, e.player_id], [c.player_id, d.player_id])
+
+        assert session.get(PlayerStats, b.player_id).matches_played == 3
+        assert session.get(PlayerStats, e.player_id).wins == 1
+        assert session.get(PlayerPairStats, (a.player_id, e.player_id)).games_together == 1
+        assert session.get(PlayerPairStats, (a.player_id, b.player_id)).games_together == 1
+        assert stats_rows(session) == rebuilt_rows(session)
+
+    def test_failed_update_leaves_the_rows_alone(self, session, sample_players, played_matches):
+        a, b, c, d = sample_players
+        match = played_matches[0]
+        rows = stats_rows(session)
+
+        # The players change first, then the unknown team fails the score update
+        with pytest.raises(ValueError):
+            MatchService(session).update_match(
+                match.match_id,
+                TeamUpdate(team_id=match.team_a.team_id, players=[a.player_id, c.player_id], score=1),
+                TeamUpdate(team_id=str(uuid.uuid4()), score=0),
+            )
+
+        assert stats_rows(session) == rows
+        assert {player.player_id for player in match.team_a.players} == {a.player_id, b.player_id}
+
+    def test_deleted_match_is_taken_out(self, session, sample_players, played_matches):
+        a, b, c, d = sample_players
+        MatchService(session).delete_match(played_matches[2].match_id)
+
+        stats = session.get(PlayerStats, a.player_id)
+        assert (stats.matches_played, stats.wins, stats.losses) == (3, 1, 1)
+        assert (stats.biggest_win, stats.biggest_win_match_id) == (2, played_matches[0].match_id)
+        # A met C as a rival in the first and the deleted match
+        assert session.get(PlayerPairStats, (a.player_id, c.player_id)).games_against == 1
+        assert stats_rows(session) == rebuilt_rows(session)
+
+    def test_failed_delete_keeps_the_match_and_its_stats(self, session, played_matches, monkeypatch):
+        match = played_matches[2]
+        rows = stats_rows(session)
+
+        # The stats are reverted and the match deleted before the score replay fails
+        def fail(self, squad_id):
+            raise RuntimeError("replay failed")
+        monkeypatch.setattr(PlayerService, "replay_squad_scores", fail)
+        with pytest.raises(RuntimeError):
+            MatchService(session).delete_match(match.match_id)
+
+        assert session.get(Match, match.match_id) is not None
+        assert stats_rows(session) == rows
+
+    def test_reverting_every_match_empties_the_pairs(self, session, sample_players, played_matches):
+        for match in played_matches:
+            MatchService(session).delete_match(match.match_id)
+
+        assert stats_rows(session)["pairs"] == {}
+        for stats in session.query(PlayerStats):
+            assert (stats.matches_played, stats.wins, stats.losses, stats.goals_scored) == (0, 0, 0, 0)
+            assert (stats.biggest_win_streak, stats.biggest_win, stats.biggest_win_match_id) == (0, 0, None)
+
+
+class TestRebuildPlayerStats:
+    """Stats rows filled from scratch with the accumulation MatchService uses per match"""
+
+    def test_matches_the_maintained_rows(self, session, sample_players, played_matches):
+        a, b, c, d = sample_players
+        score_match(session, played_matches[3], (2, 2))
+        rows = stats_rows(session)
+
+        assert rebuilt_rows(session) == rows
+        assert len(rows["pairs"]) == 12
+        assert rows["pairs"][(a.player_id, d.player_id)][2:] == (1, 0, 0, 3, 2, 1)
+
+    def test_query_count_does_not_grow_with_matches(self, session, sample_squad, sample_players, played_matches):
+        a, b, c, d = sample_players
+        score_match(session, played_matches[3], (2, 2))
+        statements = []
+        listen = lambda *args: statements.append(args[2])
+        event.listen(session.get_bind(), "before_cursor_execute", listen)
+        try:
+            StatService(session).rebuild_player_stats()
+            first = len(statements)
+            for _ in range(4):
+                play(session, sample_squad, [a, d], [b, c], (1, 0))
+            statements.clear()
+            StatService(session).rebuild_player_stats()
+        finally:
+            event.remove(session.get_bind(), "before_cursor_execute", listen)
+
+        assert len(statements) == first
+
+
+class TestSquadStats:
+    """Squad totals aggregated in the database"""
+
+    def test_totals(self, session, sample_squad, played_matches):
+        stats = StatService(session).get_squad_stats(sample_squad.squad_id)
+
+        assert (stats.total_players, stats.total_matches) == (4, 4)
+        # The match without a score counts as played but adds no goals
+        assert stats.total_goals == 10
+        assert stats.avg_player_score == 45
+        assert stats.avg_goals_per_match == 2.5
+        assert stats.avg_score == (1.75, 0.75)
+
+    def test_empty_squad(self, session, sample_squad):
+        stats = StatService(session).get_squad_stats(sample_squad.squad_id)
+
+        assert (stats.total_players, stats.total_matches, stats.total_goals) == (0, 0, 0)
+        assert (stats.avg_player_score, stats.avg_goals_per_match, stats.avg_score) == (0, 0, (0, 0))
+
+    def test_squad_detail_queries_do_not_grow(self, session, sample_squad, sample_players, played_matches):
+        a, b, c, d = sample_players
+        squad_id = sample_squad.squad_id
+
+        def count_queries() -> int:
+            statements = []
+            listen = lambda *args: statements.append(args[2])
+            event.listen(session.get_bind(), "before_cursor_execute", listen)
+            session.expire_all()
+            try:
+                SquadService(session).get_squad_detail(squad_id)
+            finally:
+                event.remove(session.get_bind(), "before_cursor_execute", listen)
+            return len(statements)
+
+        before = count_queries()
+        session.add(Player(squad_id=squad_id, name="E", position="field", base_score=50, score=50.0))
+        session.commit()
+        score_match(session, played_matches[3], (2, 2))
+        for _ in range(5):
+            play(session, sample_squad, [a, c], [b, d], (1, 1))
+
+        assert count_queries() == before
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+from random import Random
+
+from app.services.score_replay import ReplayEntry, ReplayMatch, ScoreReplay
+
+START = datetime(2024, 1, 1)
+
+
+def match(match_id: str, hours: int, team_a: list[str], team_b: list[str], score=(None, None)) -> ReplayMatch:
+    return ReplayMatch(match_id, START + timedelta(hours=hours), [(team_a, score[0]), (team_b, score[1])])
+
+
+def entry(player_id: str, match_id: str | None, delta: float = 0.0, hours: int | None = None) -> ReplayEntry:
+    created_at = None if hours is None else START + timedelta(hours=hours)
+    return ReplayEntry(f"{player_id}-{match_id or hours}", player_id, match_id, created_at, 0.0, None, delta)
+
+
+def values(replay_entry: ReplayEntry) -> tuple:
+    return replay_entry.previous_score, replay_entry.new_score, replay_entry.delta
+
+
+class TestScoreReplay:
+    def test_factors_follow_match_order(self):
+        matches = [match("m2", 2, ["a"], ["b"], (2, 0)), match("m1", 1, ["a"], ["b"], (2, 0)), match("m3", 3, ["a"], ["b"], (0, 1))]
+        entries = [entry(player, m.match_id) for m in matches for player in "ab"]
+
+        replay = ScoreReplay({"a": 50, "b": 50}, matches, entries).run()
+
+        a = {e.match_id: values(e) for e in entries if e.player_id == "a"}
+        assert a == {"m1": (50, 52.0, 2.0), "m2": (52.0, 53.67, 1.67), "m3": (53.67, 52.96, -0.71)}
+        assert replay.scores == {"a": 52.96, "b": 47.04}
+
+    def test_matches_at_the_same_moment_are_not_earlier(self):
+        matches = [match("m1", 1, ["a"], ["b"], (1, 0)), match("m2", 1, ["a"], ["c"], (1, 0)), match("m3", 2, ["a"], ["c"], (1, 0))]
+        entries = [entry(player, m.match_id) for m in matches for players, _ in m.teams for player in players]
+
+        ScoreReplay({"a": 50, "b": 50, "c": 50}, matches, entries).run()
+
+        deltas = {(e.player_id, e.match_id): e.delta for e in entries}
+        assert deltas[("a", "m1")] == deltas[("a", "m2")] == 1.0
+        assert deltas[("a", "m3")] == round(1 / 1.4, 2)
+
+    def test_manual_entries_keep_their_delta_and_place(self):
+        matches = [match("m1", 1, ["a"], ["b"], (3, 0)), match("m2", 3, ["a"], ["b"], (0, 0))]
+        manual = entry("a", None, delta=-5.0, hours=2)
+        entries = [entry("a", "m1"), entry("a", "m2", delta=4.0), manual, entry("b", "m1"), entry("b", "m2")]
+
+        replay = ScoreReplay({"a": 50, "b": 50}, matches, entries).run()
+
+        assert values(manual) == (53.0, 48.0, -5.0)
+        assert values(entries[1]) == (48.0, 48.0, 0.0)
+        assert replay.scores["a"] == 48.0
+
+    def test_unscored_matches_keep_their_delta_but_count(self):
+        matches = [match("m1", 1, ["a"], ["b"]), match("m2", 2, ["a"], ["b"], (1, 0))]
+        entries = [entry("a", "m1", delta=1.5), entry("a", "m2")]
+
+        replay = ScoreReplay({"a": 50, "b": 50}, matches, entries).run()
+
+        assert [e.delta for e in entries] == [1.5, round(1 / 1.2, 2)]
+        assert replay.scores["a"] == round(50 + 1.5 + round(1 / 1.2, 2), 2)
+
+    def test_missing_entries_are_added_and_stale_ones_removed(self):
+        matches = [match("m1", 1, ["a"], ["b"], (1, 0))]
+        entries = [entry("a", "m1"), entry("a", "gone"), entry("c", "m1")]
+        duplicate = ReplayEntry("a-m1-again", "a", "m1", None, 0.0, None, 0.0)
+
+        replay = ScoreReplay({"a": 50, "b": 50, "c": 50}, matches, entries + [duplicate]).run()
+
+        assert [(e.player_id, values(e)) for e in replay.added] == [("b", (50, 49.0, -1.0))]
+        assert sorted(replay.removed) == ["a-gone", "a-m1-again", "c-m1"]
+        assert replay.scores == {"a": 51.0, "b": 49.0, "c": 50}
+
+    def test_scores_are_clamped(self):
+        matches = [match("m1", 1, ["a"], ["b"], (9, 0)), match("m2", 2, ["a"], ["b"], (0, 1))]
+        entries = [entry(player, m.match_id) for m in matches for player in "ab"]
+
+        replay = ScoreReplay({"a": 95, "b": 5}, matches, entries).run()
+
+        # The snapshots show the clamped score, the running sum is not clamped
+        assert values(entries[2]) == (100, round(100 - 1 / 1.2, 2), round(-1 / 1.2, 2))
+        assert replay.scores == {"a": 100, "b": 0}
+
+    def test_replay_is_deterministic(self):
+        rng = Random(25)
+        players = [f"p{i}" for i in range(8)]
+        matches = []
+        for i in range(40):
+            chosen = rng.sample(players, 6)
+            matches.append(match(f"m{i}", i // 2, chosen[:3], chosen[3:], (rng.randint(0, 5), rng.randint(0, 5))))
+        base_scores = {player: rng.randint(10, 90) for player in players}
+
+        def entries_of(order: list[ReplayMatch]) -> list[ReplayEntry]:
+            return [entry(player, m.match_id) for m in order for team, _ in m.teams for player in team]
+
+        entries = entries_of(matches)
+        first = ScoreReplay(base_scores, matches, entries).run()
+        shuffled = ScoreReplay(base_scores, rng.sample(matches, len(matches)), rng.sample(entries_of(matches), len(entries))).run()
+        assert shuffled.scores == first.scores
+        assert sorted(map(values, shuffled.changed)) == sorted(map(values, first.changed))
+
+        # Replaying its own output changes nothing
+        again = ScoreReplay(base_scores, matches, entries).run()
+        assert again.changed == [] and again.added == [] and again.scores == first.scores